@@ -1,26 +1,33 @@
 import os
 import sys
+import tempfile
+import math
+import asyncio
 import logging
+import concurrent.futures
 
-from .subsonic import SubsonicClient
+from .subsonic import SubsonicClient, AsyncSubsonicClient
+from .cache import ResponseCache
+from .retry import RetryPolicy
 from .db import Database
-from .playlist import PlaylistGenerator
+from .pipeline import DatabaseWriter
+from .playlist import PlaylistGenerator, PlaylistBatchGenerator, print_playlist
+from .columnar import ColumnarLibrary
 from .cli import generate_cli
 from .config import read_config
-from .musicbrainz_db import (
-    get_genres,
-    get_genre_aliases,
-    get_l_genre_genre,
-    GENRE_LINK_TYPES,
+from .genre_db import (
+    iter_genres,
+    iter_genre_aliases,
+    iter_genre_relations,
+    get_genre_db_path,
 )
-from .helpers import normalize_genre_name
+from .helpers import normalize_genre_name, split_genre_names, format_size
 from . import APPLICATION_NAME, VERSION
 
 
 def get_artists(subsonic):
-    for index in subsonic.getArtists():
-        for artist in index["artist"]:
-            yield artist
+    # Artists are streamed as the response can be huge on large libraries
+    yield from subsonic.iterArtists()
 
 
 def get_albums(subsonic):
@@ -32,112 +39,523 @@ def get_albums(subsonic):
         offset += size
 
 
-def get_tracks(subsonic):
-    for album in get_albums(subsonic):
-        for track in subsonic.getAlbum(album["id"])["song"]:
-            track["_albumArtistId"] = album["parent"]
-            track["_albumRating"] = album["rating"] if album["rating"] else 3
-            track["_albumGenre"] = album["genre"]
-            yield track
+class AlbumFetchError(Exception):
+    """Raised when the details of an album cannot be fetched from the Subsonic
+    API.
 
+    :param str album_id: The ID of the album that failed.
+    :param Exception error: The original error.
+    """
+
+    def __init__(self, album_id, error):
+        super().__init__("Unable to fetch album '%s': %s" % (album_id, str(error)))
+        self.album_id = album_id
+        self.error = error
+
+
+def _tag_album_tracks(album, tracks):
+    for track in tracks:
+        track["_albumArtistId"] = album["parent"]
+        track["_albumRating"] = album["rating"] if album["rating"] else 3
+        track["_albumGenre"] = album["genre"]
+    return tracks
+
+
+def _fetch_album_tracks(subsonic, album):
+    try:
+        album_details = subsonic.getAlbum(album["id"])
+    except Exception as error:
+        raise AlbumFetchError(album["id"], error) from error
+    return _tag_album_tracks(album, album_details["song"])
+
+
+def get_tracks(subsonic, albums=None, workers=1):
+    """Fetches tracks of the given albums, using a pool of ``workers`` threads
+    to query the Subsonic API in parallel.
+
+    Tracks are yielded as soon as their album details are received, so they
+    are not returned in the albums order.
+
+    :param SubsonicClient subsonic: The Subsonic API client.
+    :param albums: The albums to fetch tracks from (default: all the albums
+        of the library).
+    :param int workers: The number of albums to fetch in parallel.
+
+    :raise AlbumFetchError: When fetching the details of an album fails.
+
+    :rtype: generator<dict>
+    """
+    if albums is None:
+        albums = get_albums(subsonic)
+    workers = max(1, workers)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        try:
+            for album in albums:
+                pending.add(executor.submit(_fetch_album_tracks, subsonic, album))
+                # Keep a bounded number of albums in flight
+                if len(pending) < workers * 2:
+                    continue
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield from future.result()
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield from future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _tag_song(albums_by_id, song):
+    album = albums_by_id.get(song["albumId"]) or albums_by_id.get(song["parent"])
+    if album:
+        return _tag_album_tracks(album, [song])[0]
+    song["_albumArtistId"] = None
+    song["_albumRating"] = 3
+    song["_albumGenre"] = ""
+    return song
+
+
+def get_tracks_bulk(subsonic, albums, page_size=500):
+    """Fetches all the tracks of the library using paginated ``search3``
+    requests with an empty query (see
+    :meth:`SubsonicClient.supports_song_listing`). The songs of each page are
+    streamed (see :meth:`SubsonicClient.iterSearch3Songs`).
+
+    :param SubsonicClient subsonic: The Subsonic API client.
+    :param albums: All the albums of the library (used to complete tracks
+        information).
+    :param int page_size: The number of songs requested per page.
+
+    :rtype: generator<dict>
+    """
+    albums_by_id = {album["id"]: album for album in albums}
+    track_ids = set()
+    offset = 0
+    while True:
+        count = 0
+        for song in subsonic.iterSearch3Songs(
+            query="", songCount=page_size, songOffset=offset
+        ):
+            count += 1
+            if song["id"] in track_ids:
+                continue
+            track_ids.add(song["id"])
+            yield _tag_song(albums_by_id, song)
+        if count < page_size:
+            break
+        offset += page_size
+
+
+def _artist_record(artist):
+    return {
+        "id_": artist["id"],
+        "name": artist["name"],
+        "sortName": artist["sortName"] if artist["sortName"] else artist["name"],
+        "starred": bool(artist["starred"]),
+        "rating": artist["rating"] if artist["rating"] else 3,
+    }
+
+
+def _album_record(album):
+    return {
+        "id_": album["id"],
+        "artistId": album["parent"],
+        "genreName": normalize_genre_name(album["genre"]),
+        "coverArtId": album["coverArt"],
+        "name": album["title"],
+        "sortName": album["sortName"] if album["sortName"] else album["title"],
+        "year": album["year"],
+        "created": album["created"],
+        "starred": bool(album["starred"]),
+        "rating": album["rating"] if album["rating"] else 3,
+        "songCount": album["songCount"],
+        "duration": album["duration"],
+    }
+
+
+def _track_record(track):
+    return {
+        "id_": track["id"],
+        "albumArtistId": track["_albumArtistId"],
+        "artistId": track["artistId"],
+        "albumId": track["albumId"],
+        "coverArtId": track["coverArt"],
+        # All the genres of multi-valued tags (e.g. "rock; folk")
+        "genreName": "; ".join(
+            split_genre_names(
+                track["genre"] if track["genre"] else track.get("_albumGenre", "")
+            )
+        ),
+        "diskNumber": track["discNumber"],
+        "trackNumber": track["track"],
+        "name": track["title"],
+        "sortName": track["sortName"] if track["sortName"] else track["title"],
+        "duration": track["duration"],
+        "year": track["year"],
+        "created": track["created"],
+        "starred": bool(track["starred"]),
+        "rating": (
+            track["userRating"] if track["userRating"] else track["_albumRating"]
+        ),
+        "playCount": track["playCount"],
+        "lastPlayed": track["played"] if track["played"] else None,
+    }
+
+
+def _as_row(record, fields):
+    return tuple(record[field] for field in fields)
+
+
+def _artist_row(artist):
+    return _as_row(_artist_record(artist), Database.ARTIST_FIELDS)
+
+
+def _album_row(album):
+    return _as_row(_album_record(album), Database.ALBUM_FIELDS)
+
+
+def _track_row(track):
+    return _as_row(_track_record(track), Database.TRACK_FIELDS)
+
+
+def _create_writer(db):
+    # In bulk-load mode, there is a single transaction per phase of the import
+    return DatabaseWriter(db, batch_size=None if db.is_bulk_loading else 500)
+
+
+def _log_transfer_stats(subsonic):
+    stats = subsonic.transfer_stats
+    logging.debug(
+        "  * Received %s from the Subsonic API (%s decompressed)"
+        % (format_size(stats.bytes_received), format_size(stats.bytes_decoded))
+    )
+
+
+def import_music_to_database(subsonic, db, workers=1):
+    if isinstance(subsonic, AsyncSubsonicClient):
+        asyncio.run(async_import_music_to_database(subsonic, db, workers=workers))
+        return
 
-def import_music_to_database(subsonic, db):
     logging.info("Importing data from Subsonic API")
-    # Get Artists
-    logging.debug("  * Importing artists...")
-    count = 0
-    for artist in get_artists(subsonic):
-        count += 1
-        db.insert_artist(
-            id_=artist["id"],
-            name=artist["name"],
-            sortName=artist["sortName"] if artist["sortName"] else artist["name"],
-            starred=bool(artist["starred"]),
-            rating=artist["rating"] if artist["rating"] else 3,
-        )
-    logging.debug("    Imported %i artist(s)." % count)
-
-    # Get Albums
-    logging.debug("  * Importing Albums...")
-    count = 0
-    for album in get_albums(subsonic):
-        count += 1
-        db.insert_album(
-            id_=album["id"],
-            artistId=album["parent"],
-            genreName=normalize_genre_name(album["genre"]),
-            coverArtId=album["coverArt"],
-            name=album["title"],
-            sortName=album["sortName"] if album["sortName"] else album["title"],
-            year=album["year"],
-            created=album["created"],
-            starred=bool(album["starred"]),
-            rating=album["rating"] if album["rating"] else 3,
+    # Records are written to the database by a dedicated thread while the next
+    # ones are fetched
+    with _create_writer(db) as writer:
+        # Get Artists
+        logging.debug("  * Importing artists...")
+        count = 0
+        for artist in get_artists(subsonic):
+            count += 1
+            writer.put_row("insert_artists_many", _artist_row(artist))
+        logging.debug("    Imported %i artist(s)." % count)
+        writer.commit()
+
+        # Get Albums
+        logging.debug("  * Importing Albums...")
+        albums = []
+        for album in get_albums(subsonic):
+            albums.append(album)
+            writer.put_row("insert_albums_many", _album_row(album))
+        logging.debug("    Imported %i album(s)." % len(albums))
+        writer.commit()
+
+        # Get Tracks
+        logging.debug("  * Importing Tracks...")
+        count = 0
+        if subsonic.supports_song_listing():
+            logging.debug("    Listing all songs with 'search3' requests...")
+            tracks = get_tracks_bulk(subsonic, albums)
+        else:
+            tracks = get_tracks(subsonic, albums=albums, workers=workers)
+        for track in tracks:
+            count += 1
+            writer.put_row("insert_tracks_many", _track_row(track))
+        logging.debug("    Imported %i track(s)." % count)
+    writer.log_stats()
+    _log_transfer_stats(subsonic)
+
+
+def sync_music_to_database(subsonic, db, workers=1, stats_max_age=7):
+    """Updates the library stored in the database from the Subsonic API.
+
+    Artists and albums are upserted, and albums that are new or changed
+    (detected by comparing their ``created``, ``songCount`` and ``duration``
+    with the stored ones) have their tracks replaced. Albums (and their
+    tracks) and artists that are not in the library anymore are removed.
+
+    The ratings and play statistics of the tracks of unchanged albums are
+    refreshed too:
+
+    * if the server can list all the songs (see
+      :meth:`SubsonicClient.supports_song_listing`), all the tracks are
+      listed and upserted,
+    * otherwise the tracks of the unchanged albums that were fetched more
+      than ``stats_max_age`` days ago are fetched again, the oldest first.
+      Only ``1 / stats_max_age`` of the albums are refreshed per call, so a
+      daily synchronization spreads the refresh over ``stats_max_age`` days.
+
+    :param SubsonicClient subsonic: The Subsonic API client.
+    :param Database db: The database to update.
+    :param int workers: The number of albums to fetch in parallel.
+    :param int stats_max_age: The number of days after which the tracks of
+        unchanged albums are fetched again.
+    """
+    logging.info("Synchronizing data from Subsonic API")
+    stored_albums = db.get_albums_signatures()
+    stale_album_ids = set(
+        db.get_stale_album_ids(
+            max_age=stats_max_age,
+            limit=math.ceil(len(stored_albums) / stats_max_age),
         )
-    logging.debug("    Imported %i album(s)." % count)
-
-    # Get Tracks
-    logging.debug("  * Importing Tracks...")
-    count = 0
-    for track in get_tracks(subsonic):
-        count += 1
-        db.insert_track(
-            id_=track["id"],
-            albumArtistId=track["_albumArtistId"],
-            artistId=track["artistId"],
-            albumId=track["albumId"],
-            coverArtId=track["coverArt"],
-            genreName=normalize_genre_name(
-                track["genre"] if track["genre"] else track.get("_albumGenre", "")
-            ),
-            diskNumber=track["discNumber"],
-            trackNumber=track["track"],
-            name=track["title"],
-            sortName=track["sortName"] if track["sortName"] else track["title"],
-            duration=track["duration"],
-            year=track["year"],
-            created=track["created"],
-            starred=bool(track["starred"]),
-            rating=(
-                track["userRating"] if track["userRating"] else track["_albumRating"]
-            ),
-            playCount=track["playCount"],
-            lastPlayed=track["played"] if track["played"] else None,
+    )
+    artist_ids = set()
+    album_ids = set()
+    albums = []
+    changed_albums = []
+    stale_albums = []
+
+    with _create_writer(db) as writer:
+        # Get Artists
+        logging.debug("  * Synchronizing artists...")
+        for artist in get_artists(subsonic):
+            artist_ids.add(artist["id"])
+            writer.put_row("insert_artists_many", _artist_row(artist), upsert=True)
+        logging.debug("    Updated %i artist(s)." % len(artist_ids))
+
+        # Get Albums
+        logging.debug("  * Synchronizing albums...")
+        for album in get_albums(subsonic):
+            album_ids.add(album["id"])
+            albums.append(album)
+            record = _album_record(album)
+            writer.put_row(
+                "insert_albums_many",
+                _as_row(record, Database.ALBUM_FIELDS),
+                upsert=True,
+            )
+            signature = (record["created"], record["songCount"], record["duration"])
+            if stored_albums.get(album["id"]) != signature:
+                changed_albums.append(album)
+            elif album["id"] in stale_album_ids:
+                stale_albums.append(album)
+        logging.debug(
+            "    Updated %i album(s) (%i new or changed)."
+            % (len(album_ids), len(changed_albums))
         )
-    logging.debug("    Imported %i track(s)." % count)
+
+        # Get Tracks of new and changed albums, and refresh the other ones
+        logging.debug("  * Synchronizing tracks...")
+        for album in changed_albums:
+            writer.put("delete_album_tracks", album_id=album["id"])
+        if subsonic.supports_song_listing():
+            logging.debug("    Listing all songs with 'search3' requests...")
+            tracks = get_tracks_bulk(subsonic, albums)
+        else:
+            logging.debug(
+                "    Refreshing the tracks of %i unchanged album(s)."
+                % len(stale_albums)
+            )
+            for album in stale_albums:
+                writer.put("delete_album_tracks", album_id=album["id"])
+            tracks = get_tracks(
+                subsonic, albums=changed_albums + stale_albums, workers=workers
+            )
+        count = 0
+        for track in tracks:
+            count += 1
+            writer.put_row("insert_tracks_many", _track_row(track), upsert=True)
+        logging.debug("    Imported %i track(s)." % count)
+    writer.log_stats()
+    _log_transfer_stats(subsonic)
+
+    # Remove artists and albums that are not in the library anymore
+    removed_count = db.delete_artists(keep_ids=artist_ids)
+    removed_album_ids = set(stored_albums) - album_ids
+    db.delete_albums(removed_album_ids)
+    logging.debug(
+        "  * Removed %i artist(s) and %i album(s)."
+        % (removed_count, len(removed_album_ids))
+    )
 
     db.commit()
 
 
+async def async_get_albums(subsonic):
+    size = 100
+    offset = 0
+    while albums := await subsonic.getAlbumList(offset=offset, size=size):
+        for album in albums:
+            yield album
+        offset += size
+
+
+async def _async_fetch_album_tracks(subsonic, album):
+    try:
+        album_details = await subsonic.getAlbum(album["id"])
+    except Exception as error:
+        raise AlbumFetchError(album["id"], error) from error
+    return _tag_album_tracks(album, album_details["song"])
+
+
+async def async_get_tracks(subsonic, albums, workers=1):
+    """Asyncio version of :func:`get_tracks`: fetches tracks of the given
+    albums with at most ``workers`` requests in flight.
+
+    :param AsyncSubsonicClient subsonic: The Subsonic API client.
+    :param albums: The albums to fetch tracks from.
+    :param int workers: The number of albums to fetch concurrently.
+
+    :raise AlbumFetchError: When fetching the details of an album fails.
+
+    :rtype: async_generator<dict>
+    """
+    workers = max(1, workers)
+    pending = set()
+    try:
+        for album in albums:
+            pending.add(
+                asyncio.ensure_future(_async_fetch_album_tracks(subsonic, album))
+            )
+            if len(pending) < workers * 2:
+                continue
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                for track in task.result():
+                    yield track
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                for track in task.result():
+                    yield track
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def async_get_tracks_bulk(subsonic, albums, page_size=500):
+    """Asyncio version of :func:`get_tracks_bulk`.
+
+    :param AsyncSubsonicClient subsonic: The Subsonic API client.
+    :param albums: All the albums of the library.
+    :param int page_size: The number of songs requested per page.
+
+    :rtype: async_generator<dict>
+    """
+    albums_by_id = {album["id"]: album for album in albums}
+    track_ids = set()
+    offset = 0
+    while True:
+        count = 0
+        async for song in subsonic.iterSearch3Songs(
+            query="", songCount=page_size, songOffset=offset
+        ):
+            count += 1
+            if song["id"] in track_ids:
+                continue
+            track_ids.add(song["id"])
+            yield _tag_song(albums_by_id, song)
+        if count < page_size:
+            break
+        offset += page_size
+
+
+async def async_import_music_to_database(subsonic, db, workers=1):
+    """Asyncio version of :func:`import_music_to_database`.
+
+    :param AsyncSubsonicClient subsonic: The Subsonic API client.
+    :param Database db: The database to import the library into.
+    :param int workers: The number of albums to fetch concurrently.
+    """
+    logging.info("Importing data from Subsonic API (asyncio)")
+    try:
+        with _create_writer(db) as writer:
+            # Get Artists
+            logging.debug("  * Importing artists...")
+            count = 0
+            # Artists are streamed as the response can be huge on large
+            # libraries
+            async for artist in subsonic.iterArtists():
+                count += 1
+                await writer.put_row_async("insert_artists_many", _artist_row(artist))
+            logging.debug("    Imported %i artist(s)." % count)
+            writer.commit()
+
+            # Get Albums
+            logging.debug("  * Importing Albums...")
+            albums = []
+            async for album in async_get_albums(subsonic):
+                albums.append(album)
+                await writer.put_row_async("insert_albums_many", _album_row(album))
+            logging.debug("    Imported %i album(s)." % len(albums))
+            writer.commit()
+
+            # Get Tracks
+            logging.debug("  * Importing Tracks...")
+            count = 0
+            if await subsonic.supports_song_listing():
+                logging.debug("    Listing all songs with 'search3' requests...")
+                tracks = async_get_tracks_bulk(subsonic, albums)
+            else:
+                tracks = async_get_tracks(subsonic, albums, workers=workers)
+            async for track in tracks:
+                count += 1
+                await writer.put_row_async("insert_tracks_many", _track_row(track))
+            logging.debug("    Imported %i track(s)." % count)
+        writer.log_stats()
+        _log_transfer_stats(subsonic)
+    finally:
+        await subsonic.close()
+
+
 def import_genres_to_database(db):
     logging.info("Importing genres data from Musicbrainz locale DB")
 
     logging.debug("  * Importing genres...")
-    for genre in get_genres():
-        db.insert_genre(id_=genre["id"], name=normalize_genre_name(genre["name"]))
+    db.insert_genres_many(iter_genres())
 
     logging.debug("  * Importing genre aliases...")
-    for alias in get_genre_aliases():
-        db.insert_genre_alias(
-            id_=alias["id"],
-            genreId=alias["genre"],
-            name=normalize_genre_name(alias["name"]),
-        )
+    db.insert_genre_aliases_many(iter_genre_aliases())
 
     logging.debug("  * Importing genre relations...")
-    for rel in get_l_genre_genre():
-        if rel["link"] == GENRE_LINK_TYPES.SUBGENRE_OF.value:
-            db.insert_genre_relation(
-                id_=rel["id"], parentGenreId=rel["entity0"], childGenreId=rel["entity1"]
-            )
-        if rel["link"] == GENRE_LINK_TYPES.FUSION_OF.value:
-            db.insert_genre_relation(
-                id_=rel["id"], parentGenreId=rel["entity1"], childGenreId=rel["entity0"]
-            )
+    db.insert_genre_relations_many(iter_genre_relations())
+
+    logging.debug("  * Resolving the genres of the tracks...")
+    db.update_track_genres()
 
     db.commit()
 
 
+def use_genre_db(db):
+    """Attaches the prebuilt genre database (see
+    :mod:`flozz_daily_mix.genre_db`) to the given database, unless genres were
+    imported in it. Genres are imported if the genre database cannot be
+    built.
+
+    :param flozz_daily_mix.db.Database db: The database.
+    """
+    if db.execute_query("SELECT 1 FROM genres LIMIT 1").fetchone():
+        return
+    try:
+        genre_db_path = get_genre_db_path()
+    except OSError as error:
+        logging.warning("Unable to build the genre database: %s" % error)
+        import_genres_to_database(db)
+        return
+    logging.debug("Using the genre database '%s'" % genre_db_path)
+    db.attach_genre_db(genre_db_path)
+
+
 def create_or_update_playlsit(
     subsonic,
     fzz_id,
@@ -178,66 +596,267 @@ def create_or_update_playlsit(
     )
 
 
-def dumpdata(subsonic, db_file):
+def dumpdata(subsonic, db_file, workers=1):
     logging.info("Dumping data from Subsonic API to '%s'..." % db_file)
-    # Remove the database file if it already exists. We cannot update it, we
-    # can only dump all data again.
-    if os.path.isfile(db_file):
-        logging.debug("Removing existing database...")
-        os.unlink(db_file)
-
-    # Create the database
-    logging.debug("Creating new database...")
+    # All data is dumped again (use the "sync" subcommand to update an existing
+    # database instead). The new database is built in a temporary file, that
+    # replaces the existing one once complete: an interrupted dump never
+    # leaves a partial database behind.
+    fd, tmp_db_file = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(db_file),
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(db_file)),
+    )
+    os.close(fd)
+
+    try:
+        # Create the database
+        logging.debug("Creating new database...")
+        db = Database(tmp_db_file)
+
+        # Genres are not copied to the database, the genre database is
+        # attached when it is used
+        use_genre_db(db)
+
+        with db.bulk_load():
+            # Fetch data from the music cloud
+            import_music_to_database(subsonic, db, workers=workers)
+
+        # Scores of the day are stored, so "generate" can read them as is
+        db.refresh_track_scores()
+        db.close()
+        os.replace(tmp_db_file, db_file)
+    except BaseException:
+        if os.path.isfile(tmp_db_file):
+            os.unlink(tmp_db_file)
+        raise
+
+
+def sync(subsonic, db_file, workers=1):
+    logging.info("Synchronizing data from Subsonic API to '%s'..." % db_file)
     db = Database(db_file)
+    use_genre_db(db)
+
+    # Fetch new and changed data from the music cloud
+    sync_music_to_database(subsonic, db, workers=workers)
+
+    # Scores of the day are stored, so "generate" can read them as is
+    db.refresh_track_scores()
+
+
+def _create_playlist_generator(db, playlist_config, library=None):
+    return PlaylistGenerator(
+        db,
+        length=playlist_config["max_tracks"],
+        min_duration=playlist_config["min_track_duration"],
+        max_duration=playlist_config["max_track_duration"],
+        track_ignore_pattern=playlist_config["ignore_tracks_matching"],
+        min_rate=playlist_config["minimal_track_rating"],
+        sampling_engine=playlist_config["sampling_engine"],
+        library=library,
+        genres=[
+            normalize_genre_name(genre, first_only=False)
+            for genre in playlist_config["genres"]
+        ],
+    )
 
-    # Fetch data from the music cloud
-    import_music_to_database(subsonic, db)
 
-    # Import genres from Musicbrainz locale db
-    import_genres_to_database(db)
+def _generate_playlists(db, playlists_configs):
+    # Load the library in memory once for the playlists using the "numpy"
+    # sampling engine
+    library = None
+    if any(config["sampling_engine"] == "numpy" for config in playlists_configs):
+        library = ColumnarLibrary(db)
 
+    generators = [
+        _create_playlist_generator(db, playlist_config, library=library)
+        for playlist_config in playlists_configs
+    ]
 
-def generate(subsonic, playlists_configs, db_file=None, dry_run=False, print_pl=False):
-    if db_file:
-        db = Database(db_file, skip_table_creation=True)
-    else:
-        db = Database(":memory:")
+    # Generate all the playlists, reading the scored tracks once
+    PlaylistBatchGenerator(db, generators).generate()
+    return [generator.get_playlist() for generator in generators]
+
+
+# Read-only database of the playlist generation worker processes
+_worker_db = None
+
+
+def _init_playlist_worker(db_file):
+    global _worker_db
+    _worker_db = Database(db_file, skip_table_creation=True, read_only=True)
+    use_genre_db(_worker_db)
+
+
+def _check_track_scores(db):
+    # Read-only databases cannot compute the scores of the tracks: without
+    # them, all the playlists would be empty
+    query = (
+        "SELECT EXISTS (SELECT 1 FROM tracks)"
+        " AND NOT EXISTS (SELECT 1 FROM track_scores)"
+    )
+    if db.execute_query(query).fetchone()[0]:
+        raise RuntimeError(
+            "The scores of the tracks were not computed before the database"
+            " was opened read-only"
+        )
+
+
+def _generate_playlists_worker(playlists_configs):
+    _check_track_scores(_worker_db)
+    return _generate_playlists(_worker_db, playlists_configs)
+
+
+def generate_playlists(db, playlists_configs, jobs=1, db_file=None):
+    """Generates the tracks of the playlists.
+
+    With more than one job, playlists are distributed among a pool of
+    processes. Each process opens its own read-only connection to the
+    database file.
+
+    :param flozz_daily_mix.db.Database db: The database.
+    :param list playlists_configs: The playlists configurations.
+    :param int jobs: The number of processes generating playlists in parallel.
+    :param str db_file: The path of the database file (required with more
+        than one job). It must contain the scores of the tracks if it is not
+        the file of ``db``.
+
+    :raise RuntimeError: If the tracks of the database file have no scores.
+
+    :rtype: list
+    :return: The tracks of each playlist (see
+        :meth:`flozz_daily_mix.playlist.PlaylistGenerator.get_playlist`), in
+        the order of the configurations.
+    """
+    jobs = min(jobs, len(playlists_configs))
+    if jobs <= 1:
+        logging.info("Generating %i playlist(s)..." % len(playlists_configs))
+        return _generate_playlists(db, playlists_configs)
 
-    # Fetch data from the music cloud and import genres if no input database provided
     if not db_file:
-        import_music_to_database(subsonic, db)
-        import_genres_to_database(db)
+        raise ValueError(
+            "A database file is required to generate playlists in parallel"
+        )
+
+    # Scores are refreshed once, before the workers read the database
+    db.refresh_track_scores()
+    db.commit()
+
+    logging.info(
+        "Generating %i playlist(s) using %i processes..."
+        % (len(playlists_configs), jobs)
+    )
+    # The playlists of each worker are generated together, from a single scan
+    # of the tracks (see PlaylistBatchGenerator)
+    chunks = [list(range(len(playlists_configs)))[i::jobs] for i in range(jobs)]
+    playlists = [None] * len(playlists_configs)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_playlist_worker,
+        initargs=(db_file,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _generate_playlists_worker,
+                [playlists_configs[i] for i in chunk],
+            )
+            for chunk in chunks
+        ]
+        for chunk, future in zip(chunks, futures):
+            for i, playlist in zip(chunk, future.result()):
+                playlists[i] = playlist
+    return playlists
 
-    # Generate playlists from configs
-    for playlist_config in playlists_configs:
-        logging.info("Generating '%s' playlist..." % playlist_config["name"])
-
-        logging.debug("Playlist config:")
-        for k, v in playlist_config.items():
-            logging.debug("  * %s: %s" % (k, str(playlist_config[k])))
-
-        # Check genres exists and warn the user if they don't
-        for genre in playlist_config["genres"]:
-            if (
-                genre != "all"
-                and not db.is_genre(genre)
-                and not db.is_genre_alias(genre)
-            ):
-                logging.warning("The genre '%s' is unknown" % genre)
-
-        generator = PlaylistGenerator(
-            db,
-            length=playlist_config["max_tracks"],
-            min_duration=playlist_config["min_track_duration"],
-            max_duration=playlist_config["max_track_duration"],
-            track_ignore_pattern=playlist_config["ignore_tracks_matching"],
-            min_rate=playlist_config["minimal_track_rating"],
-            genres=[normalize_genre_name(genre) for genre in playlist_config["genres"]],
+
+def _create_temp_db_file():
+    fd, db_file = tempfile.mkstemp(prefix="flozz-daily-mix.", suffix=".db")
+    os.close(fd)
+    return db_file
+
+
+def generate(
+    subsonic,
+    playlists_configs,
+    db_file=None,
+    dry_run=False,
+    print_pl=False,
+    workers=1,
+    crawler=None,
+    jobs=1,
+):
+    """Generates the playlists.
+
+    :param SubsonicClient subsonic: The Subsonic API client used to publish
+        the playlists (and to fetch the library if no ``crawler`` is given).
+    :param list playlists_configs: The playlists configurations.
+    :param str db_file: Read the library from this database instead of
+        fetching it from the Subsonic API (optional). The database is not
+        modified: if it does not store the scores of the day, it is copied to
+        a temporary file before being migrated and scored.
+    :param bool dry_run: Do not publish the playlists.
+    :param bool print_pl: Print the playlists to stdout.
+    :param int workers: The number of albums to fetch in parallel.
+    :param crawler: The Subsonic API client used to fetch the library
+        (optional, e.g. an :class:`AsyncSubsonicClient`).
+    :param int jobs: The number of playlists to generate in parallel.
+    """
+    tmp_db_file = None
+    try:
+        if db_file:
+            # The source database is only read. It is used as is if it stores
+            # the scores of the day (see dumpdata and sync), otherwise the
+            # migrations and the scores are written to a temporary copy of it.
+            db = Database(db_file, read_only=True)
+            if db.is_outdated():
+                logging.info(
+                    "The scores of '%s' are outdated: using a temporary copy" % db_file
+                )
+                tmp_db_file = _create_temp_db_file()
+                db.backup(tmp_db_file)
+                db.close()
+                db = Database(tmp_db_file, skip_table_creation=True)
+        else:
+            db = Database(":memory:")
+        use_genre_db(db)
+
+        # Fetch data from the music cloud if no input database provided
+        if not db_file:
+            import_music_to_database(crawler or subsonic, db, workers=workers)
+
+        genre_graph = db.get_genre_graph()
+        for playlist_config in playlists_configs:
+            logging.debug("Playlist '%s' config:" % playlist_config["name"])
+            for k, v in playlist_config.items():
+                logging.debug("  * %s: %s" % (k, str(playlist_config[k])))
+
+            # Check genres exists and warn the user if they don't
+            for genre in playlist_config["genres"]:
+                if (
+                    genre != "all"
+                    and not genre_graph.is_genre(genre)
+                    and not genre_graph.is_genre_alias(genre)
+                    and db.get_custom_genre_id(genre) is None
+                ):
+                    logging.warning("The genre '%s' is unknown" % genre)
+
+        # Worker processes cannot read an in-memory database: it is copied to
+        # a temporary file. The workers open it read-only, so the scores are
+        # computed before the copy.
+        if jobs > 1 and len(playlists_configs) > 1 and not db_file:
+            db.refresh_track_scores()
+            tmp_db_file = _create_temp_db_file()
+            db.backup(tmp_db_file)
+
+        playlists = generate_playlists(
+            db, playlists_configs, jobs=jobs, db_file=tmp_db_file or db_file
         )
-        generator.generate()
+    finally:
+        if tmp_db_file and os.path.isfile(tmp_db_file):
+            os.unlink(tmp_db_file)
 
+    for playlist_config, playlist in zip(playlists_configs, playlists):
         if print_pl:
-            generator.print()
+            print_playlist(playlist)
 
         if not dry_run:
             create_or_update_playlsit(
@@ -245,7 +864,7 @@ def generate(subsonic, playlists_configs, db_file=None, dry_run=False, print_pl=
                 playlist_config["_id"],
                 name=playlist_config["name"],
                 comment=playlist_config["description"],
-                tracks_ids=generator.get_tracks_ids(),
+                tracks_ids=[track["trackId"] for track in playlist],
             )
         else:
             logging.debug(
@@ -254,44 +873,43 @@ def generate(subsonic, playlists_configs, db_file=None, dry_run=False, print_pl=
             )
 
 
-def list_genres(db_file=None):
+def list_genres(db_file=None, root=None):
     if db_file:
-        db = Database(db_file, skip_table_creation=True)
+        db = Database(db_file, read_only=True)
     else:
         db = Database(":memory:")
+    use_genre_db(db)
+
+    genre_graph = db.get_genre_graph()
+    genre_ids = None
+    if root:
+        genre_id = genre_graph.get_genre_id(root)
+        if genre_id is None:
+            logging.error("The genre '%s' is unknown" % root)
+            sys.exit(1)
+        genre_ids = [genre_id]
 
-    # Import genres if no input database provided
-    if not db_file:
-        import_genres_to_database(db)
-
-    def _print_genre_tree(genres, level=0, prefix=""):
-        for genre in genres:
-            bullet = "├"
-            next_prefix = "│ "
-            if genres.index(genre) == len(genres) - 1:
-                bullet = "└"
-                next_prefix = "  "
-            elif level == 0 and genres.index(genre) == 0:
-                bullet = "┌"
-            print(
-                "\x1b[2;90m%s%s╴\x1b[0m%s \x1b[2m%s\x1b[0m"
-                % (
-                    prefix,
-                    bullet,
-                    genre["name"].title(),
-                    (
-                        "(%s)"
-                        % ", ".join(
-                            genre["aliases"],
-                        )
-                        if genre["aliases"]
-                        else ""
-                    ),
-                )
+    # Genres are printed while walking the tree
+    for genre_id, positions in genre_graph.walk(genre_ids):
+        prefix = "".join(
+            "  " if index == count - 1 else "│ " for index, count in positions[:-1]
+        )
+        index, count = positions[-1]
+        bullet = "├"
+        if index == count - 1:
+            bullet = "└"
+        elif len(positions) == 1 and index == 0:
+            bullet = "┌"
+        aliases = genre_graph.get_genre_aliases(genre_id)
+        print(
+            "\x1b[2;90m%s%s╴\x1b[0m%s \x1b[2m%s\x1b[0m"
+            % (
+                prefix,
+                bullet,
+                genre_graph.get_genre_name(genre_id).title(),
+                "(%s)" % ", ".join(aliases) if aliases else "",
             )
-            _print_genre_tree(genre["children"], level + 1, prefix=prefix + next_prefix)
-
-    _print_genre_tree(db.get_genre_tree())
+        )
 
 
 def setup_logging(level):
@@ -330,6 +948,9 @@ def main(args=sys.argv[1:]):
     subsonic_api_username = parsed_args.subsonic_api_username
     subsonic_api_password = parsed_args.subsonic_api_password
     subsonic_api_legacy_authentication = parsed_args.subsonic_api_legacy_authentication
+    subsonic_workers = parsed_args.subsonic_workers
+    subsonic_use_asyncio = parsed_args.subsonic_use_asyncio
+    cache_file = parsed_args.cache_file
 
     # In some cases there will be no access to the Subsonic API, so there will
     # be no need for a Subsonic instance nor to check if we have credentials set
@@ -369,6 +990,12 @@ def main(args=sys.argv[1:]):
             "subsonic/api_legacy_authentication"
         ]
 
+    if subsonic_workers is None:
+        subsonic_workers = config["subsonic/workers"]
+
+    if cache_file is None:
+        cache_file = config["cache/path"]
+
     # Print configs
     logging.debug("Subcommand: %s" % parsed_args.subcommand)
     logging.debug("Subsonic API:")
@@ -382,6 +1009,11 @@ def main(args=sys.argv[1:]):
         "  * Use legacy authentication: %s"
         % ("True" if subsonic_api_legacy_authentication else "False")
     )
+    logging.debug("  * Workers: %i" % subsonic_workers)
+    logging.debug("  * Timeout: %is" % config["subsonic/timeout"])
+    logging.debug("  * Max retries: %i" % config["subsonic/max_retries"])
+    logging.debug("  * Use asyncio: %s" % ("True" if subsonic_use_asyncio else "False"))
+    logging.debug("  * Cache file: %s" % (cache_file or "-none-"))
     logging.debug("General Options:")
     logging.debug("  * quiet: %s" % ("True" if parsed_args.quiet else "False"))
     logging.debug("  * verbose: %s" % ("True" if parsed_args.verbose else "False"))
@@ -393,10 +1025,11 @@ def main(args=sys.argv[1:]):
             % ("True" if parsed_args.print_playlist else "False")
         )
         logging.debug("  * source_db: %s" % str(parsed_args.source_db))
+        logging.debug("  * jobs: %i" % parsed_args.jobs)
         logging.debug("  * skip_subsonic: %s" % ("True" if skip_subsonic else "False"))
         logging.debug("  * config_files: %s" % ", ".join(parsed_args.config_file))
-    if parsed_args.subcommand == "dumpdata":
-        logging.debug("Dumpdata Options:")
+    if parsed_args.subcommand in ("dumpdata", "sync"):
+        logging.debug("%s Options:" % parsed_args.subcommand.title())
         logging.debug("  * config_files: %s" % str(parsed_args.config_file))
         logging.debug("  * db_file: %s" % str(parsed_args.db_file))
 
@@ -426,6 +1059,21 @@ def main(args=sys.argv[1:]):
             )
             sys.exit(1)
 
+    # Initialize the cache of the Subsonic API responses
+    cache = None
+    if cache_file and not skip_subsonic:
+        cache = ResponseCache(
+            cache_file,
+            max_size=config["cache/max_size"] * 1024**2,
+            ttls={
+                "getArtists": config["cache/ttl_artists"],
+                "getAlbumList": config["cache/ttl_albums"],
+                "getAlbum": config["cache/ttl_tracks"],
+                "search3": config["cache/ttl_tracks"],
+                "getPlaylists": config["cache/ttl_playlists"],
+            },
+        )
+
     # Initialize Subsonic client
     subsonic = None
     if not skip_subsonic:
@@ -434,6 +1082,24 @@ def main(args=sys.argv[1:]):
             subsonic_api_username,
             subsonic_api_password,
             client_name="%s/%s" % (APPLICATION_NAME, VERSION),
+            pool_size=subsonic_workers,
+            cache=cache,
+            timeout=config["subsonic/timeout"],
+            retry_policy=RetryPolicy(max_retries=config["subsonic/max_retries"]),
+        )
+
+    # Initialize the asyncio Subsonic client used to fetch the library
+    crawler = subsonic
+    if subsonic and subsonic_use_asyncio:
+        crawler = AsyncSubsonicClient(
+            subsonic_api_url,
+            subsonic_api_username,
+            subsonic_api_password,
+            client_name="%s/%s" % (APPLICATION_NAME, VERSION),
+            max_connections=subsonic_workers,
+            cache=cache,
+            timeout=config["subsonic/timeout"],
+            retry_policy=RetryPolicy(max_retries=config["subsonic/max_retries"]),
         )
 
     # Run the requested task
@@ -444,11 +1110,16 @@ def main(args=sys.argv[1:]):
             db_file=parsed_args.source_db,
             dry_run=parsed_args.dry_run,
             print_pl=parsed_args.print_playlist,
+            workers=subsonic_workers,
+            crawler=crawler,
+            jobs=parsed_args.jobs,
         )
     elif parsed_args.subcommand == "dumpdata":
-        dumpdata(subsonic, parsed_args.db_file)
+        dumpdata(crawler, parsed_args.db_file, workers=subsonic_workers)
+    elif parsed_args.subcommand == "sync":
+        sync(subsonic, parsed_args.db_file, workers=subsonic_workers)
     elif parsed_args.subcommand == "genres":
-        list_genres(db_file=parsed_args.source_db)
+        list_genres(db_file=parsed_args.source_db, root=parsed_args.root)
 
 
 if __name__ == "__main__":
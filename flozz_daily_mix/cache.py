@@ -0,0 +1,236 @@
+import time
+import sqlite3
+import logging
+import threading
+import urllib.parse
+
+_SQL_CREATE_TABLES = """
+
+CREATE TABLE IF NOT EXISTS "responses" (
+    "key"           TEXT NOT NULL,
+    "endpoint"      TEXT NOT NULL,
+    "body"          BLOB NOT NULL,
+    "etag"          TEXT,
+    "lastModified"  TEXT,
+    "storedAt"      REAL NOT NULL,
+    "lastAccess"    REAL NOT NULL,
+    "size"          INTEGER NOT NULL,
+    PRIMARY KEY("key")
+);
+
+--
+
+CREATE INDEX IF NOT EXISTS "responses_lastAccess" ON "responses" ("lastAccess");
+"""
+
+# Query parameters holding credentials, that must not be part of cache keys
+_CREDENTIAL_PARAMS = ("p", "t", "s")
+
+
+class CacheEntry:
+    """A response read from the cache.
+
+    :param bytes body: The (decoded) response body.
+    :param str etag: The ``ETag`` header of the response.
+    :param str last_modified: The ``Last-Modified`` header of the response.
+    :param bool fresh: Whether the entry is younger than its TTL.
+    """
+
+    def __init__(self, body, etag, last_modified, fresh):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh = fresh
+
+    def get_validation_headers(self):
+        """Returns the headers to send to revalidate the entry.
+
+        :rtype: dict
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """On-disk cache of Subsonic API responses, stored in a SQLite file.
+
+    Entries are fresh for the TTL of their endpoint. Stale entries are kept to
+    be revalidated using the ``ETag`` / ``Last-Modified`` headers when the
+    server sent them. When the cache grows over ``max_size``, least recently
+    used entries are evicted.
+
+    :param str path: The path of the SQLite file.
+    :param int max_size: The maximum size of the cached bodies in bytes
+        (default: 256 MiB).
+    :param dict ttls: TTLs in seconds by endpoint name (optional, overrides
+        :attr:`DEFAULT_TTLS`). Only the listed endpoints are cached.
+    """
+
+    #: Default TTLs (in seconds) of the cached endpoints. Playlists are always
+    #: revalidated as we are writing them.
+    DEFAULT_TTLS = {
+        "getArtists": 3600,
+        "getAlbumList": 3600,
+        "getAlbum": 3600,
+        "search3": 3600,
+        "getPlaylists": 0,
+    }
+
+    def __init__(self, path, max_size=256 * 1024**2, ttls=None):
+        self._path = path
+        self._max_size = max_size
+        self._ttls = dict(self.DEFAULT_TTLS) | (ttls or {})
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        for statement in _SQL_CREATE_TABLES.split("--"):
+            self._con.execute(statement)
+        self._con.commit()
+
+    @staticmethod
+    def get_key(url):
+        """Returns the cache key of an URL: the URL without credentials.
+
+        The user name is kept as responses (ratings, play counts,...) depend
+        on the user.
+
+        :param str url: The requested URL.
+
+        :rtype: str
+
+        >>> ResponseCache.get_key("http://x/rest/getAlbum?u=foo&p=bar&f=json&id=1")
+        'http://x/rest/getAlbum?u=foo&f=json&id=1'
+        """
+        parsed_url = urllib.parse.urlsplit(url)
+        query = [
+            (key, value)
+            for key, value in urllib.parse.parse_qsl(parsed_url.query)
+            if key not in _CREDENTIAL_PARAMS
+        ]
+        return urllib.parse.urlunsplit(
+            parsed_url._replace(query=urllib.parse.urlencode(query), fragment="")
+        )
+
+    @staticmethod
+    def get_endpoint(url):
+        """Returns the name of the API endpoint of an URL.
+
+        >>> ResponseCache.get_endpoint("http://x/rest/getAlbum?id=1")
+        'getAlbum'
+        """
+        return urllib.parse.urlsplit(url).path.rsplit("/", 1)[-1]
+
+    def is_cacheable(self, url):
+        return self.get_endpoint(url) in self._ttls
+
+    def get(self, url):
+        """Reads a response from the cache.
+
+        :param str url: The requested URL.
+
+        :rtype: CacheEntry or None
+        """
+        key = self.get_key(url)
+        now = time.time()
+        with self._lock:
+            row = self._con.execute(
+                "SELECT body, etag, lastModified, storedAt FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if not row:
+                return None
+            self._con.execute(
+                "UPDATE responses SET lastAccess = ? WHERE key = ?", (now, key)
+            )
+            self._con.commit()
+        body, etag, last_modified, stored_at = row
+        fresh = now - stored_at < self._ttls.get(self.get_endpoint(url), 0)
+        return CacheEntry(body, etag, last_modified, fresh)
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Stores a response in the cache.
+
+        :param str url: The requested URL.
+        :param bytes body: The (decoded) response body.
+        :param str etag: The ``ETag`` header of the response.
+        :param str last_modified: The ``Last-Modified`` header of the
+            response.
+        """
+        if len(body) > self._max_size:
+            return
+        now = time.time()
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO responses VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.get_key(url),
+                    self.get_endpoint(url),
+                    body,
+                    etag,
+                    last_modified,
+                    now,
+                    now,
+                    len(body),
+                ),
+            )
+            self._evict()
+            self._con.commit()
+
+    def touch(self, url):
+        """Marks a cached response as fresh again (after a successful
+        revalidation).
+
+        :param str url: The requested URL.
+        """
+        now = time.time()
+        with self._lock:
+            self._con.execute(
+                "UPDATE responses SET storedAt = ?, lastAccess = ? WHERE key = ?",
+                (now, now, self.get_key(url)),
+            )
+            self._con.commit()
+
+    def delete(self, url):
+        """Removes a response from the cache.
+
+        :param str url: The requested URL.
+        """
+        with self._lock:
+            self._con.execute(
+                "DELETE FROM responses WHERE key = ?", (self.get_key(url),)
+            )
+            self._con.commit()
+
+    def invalidate(self, endpoint):
+        """Removes all the cached responses of an endpoint.
+
+        :param str endpoint: The endpoint name (e.g. ``"getPlaylists"``).
+        """
+        with self._lock:
+            self._con.execute("DELETE FROM responses WHERE endpoint = ?", (endpoint,))
+            self._con.commit()
+
+    def _evict(self):
+        (total_size,) = self._con.execute(
+            "SELECT IFNULL(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total_size <= self._max_size:
+            return
+        cursor = self._con.execute(
+            "SELECT key, size FROM responses ORDER BY lastAccess ASC"
+        )
+        evicted_keys = []
+        for key, size in cursor.fetchall():
+            if total_size <= self._max_size:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        self._con.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+        logging.debug("Evicted %i response(s) from the cache" % len(evicted_keys))
+
+    def close(self):
+        with self._lock:
+            self._con.close()
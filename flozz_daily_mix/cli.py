@@ -17,6 +17,20 @@ def generate_dumpdata_subcli(parser):
     )
 
 
+def generate_sync_subcli(parser):
+    parser.add_argument(
+        "-c",
+        "--config-file",
+        help="a config file to read Subsonic API URL and credential from (if not provided using the CLI)",
+        default=None,
+    )
+
+    parser.add_argument(
+        "db_file",
+        help="SQLite database file to update (created if it does not exist)",
+    )
+
+
 def generate_generate_subcli(parser):
     parser.add_argument(
         "-D",
@@ -41,6 +55,14 @@ def generate_generate_subcli(parser):
         default=False,
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of playlists to generate in parallel, in separate processes (default: %(default)s)",
+        type=int,
+        default=1,
+    )
+
     parser.add_argument(
         "config_file",
         help="one or more files containing configurations of playlists to generate",
@@ -56,6 +78,13 @@ def generate_genres_subcli(parser):
         default=None,
     )
 
+    parser.add_argument(
+        "-r",
+        "--root",
+        help="only list the given genre and its subgenres",
+        default=None,
+    )
+
 
 def generate_cli():
     parser = argparse.ArgumentParser(
@@ -101,6 +130,31 @@ def generate_cli():
         default=False,
     )
 
+    parser.add_argument(
+        "-w",
+        "--subsonic-workers",
+        metavar="N",
+        help="number of parallel requests made to the Subsonic API when importing the library (default: 4)",
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
+        "-a",
+        "--subsonic-use-asyncio",
+        help="fetch the library from the Subsonic API using asyncio instead of threads (use it with a high number of workers)",
+        action="store_true",
+        default=False,
+    )
+
+    parser.add_argument(
+        "-C",
+        "--cache-file",
+        metavar="FILE",
+        help="cache the responses of the Subsonic API in the given SQLite file (overrides the '[cache]path' setting)",
+        default=None,
+    )
+
     parser.add_argument(
         "-q",
         "--quiet",
@@ -125,6 +179,12 @@ def generate_cli():
     )
     generate_dumpdata_subcli(dumpdata_parser)
 
+    sync_parser = subparsers.add_parser(
+        "sync",
+        help="update a file written by 'dumpdata' with new and changed data from the Subsonic API",
+    )
+    generate_sync_subcli(sync_parser)
+
     generate_parser = subparsers.add_parser(
         "generate",
         help="generate playlists",
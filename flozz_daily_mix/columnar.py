@@ -0,0 +1,278 @@
+import random
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ColumnarLibrary:
+    """An in-memory, columnar copy of the tracks of the library (NumPy
+    arrays), used by the ``"numpy"`` sampling engine of
+    :class:`~flozz_daily_mix.playlist.PlaylistGenerator`.
+
+    The tracks are loaded once. Their scores are then computed with
+    vectorized operations (once per day), and the candidate pools of each
+    playlist are selected without any SQL query. Tracks added to the database
+    after the library was loaded are ignored.
+
+    :param flozz_daily_mix.db.Database db: The database to load the tracks
+        from.
+
+    :raise Exception: If NumPy is not installed.
+    """
+
+    # The track fields, in the same order as
+    # flozz_daily_mix.playlist.PlaylistGenerator._SQL_SELECT_FIELDS
+    _SQL_SELECT_TRACKS = """
+    SELECT tracks.id,
+           tracks.artistId,
+           tracks.albumArtistId,
+           artists.name,
+           albums.name,
+           tracks.name,
+           tracks.duration,
+           tracks.year,
+           tracks.rating,
+           tracks.starred,
+           tracks.playCount,
+           tracks.lastPlayed,
+           JULIANDAY(tracks.created),
+           JULIANDAY(tracks.lastPlayed),
+           JULIANDAY(IFNULL(tracks.lastPlayed, JULIANDAY('1970-01-01')))
+    FROM tracks
+    LEFT JOIN artists ON artists.id = tracks.albumArtistId
+    LEFT JOIN albums ON albums.id = tracks.albumId
+    """
+
+    _TRACK_FIELDS = (
+        "trackId",
+        "artistId",
+        "albumArtistId",
+        "albumArtistName",
+        "albumName",
+        "trackName",
+        "duration",
+        "year",
+        "rating",
+        "starred",
+        "playCount",
+        "lastPlayed",
+    )
+
+    def __init__(self, db):
+        if numpy is None:
+            raise Exception(  # XXX
+                "The 'numpy' sampling engine requires NumPy to be installed"
+                " (pip install flozz-daily-mix[numpy])"
+            )
+        self._db = db
+        self._scores = {}
+        logging.debug("Loading the tracks in memory...")
+        rows = db.execute_query(self._SQL_SELECT_TRACKS).fetchall()
+        #: Track fields (tuples, in the order of :attr:`_TRACK_FIELDS`)
+        self._tracks = [row[: len(self._TRACK_FIELDS)] for row in rows]
+        self._indexes = {row[0]: i for i, row in enumerate(rows)}
+
+        def _column(index):
+            # NULL values are converted to NaN
+            return numpy.array([row[index] for row in rows], dtype=numpy.float64)
+
+        self.duration = _column(6)
+        self.year = _column(7)
+        self.rating = _column(8)
+        self.starred = _column(9)
+        self.play_count = _column(10)
+        #: Dates, as julian days
+        self.created = _column(12)
+        self.last_played = _column(13)
+        self.last_played_or_epoch = _column(14)
+        #: Genres of the tracks (indexes of the tracks, IDs of the genres)
+        track_genres = [
+            (self._indexes[track_id], genre_id)
+            for track_id, genre_id in db.execute_query(
+                "SELECT trackId, genreId FROM track_genres"
+            )
+            if track_id in self._indexes
+        ]
+        self.genre_track = numpy.array(
+            [index for index, _ in track_genres], dtype=numpy.int64
+        )
+        self.genre_id = numpy.array(
+            [genre_id for _, genre_id in track_genres], dtype=numpy.int64
+        )
+        logging.debug("%i track(s) loaded in memory" % len(rows))
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def _get_day(self, day):
+        query = "SELECT DATE(:day), JULIANDAY(:day), STRFTIME('%Y', DATE(:day))"
+        return self._db.execute_query(query, {"day": day or "now"}).fetchone()
+
+    def get_scores(self, day=None):
+        """Computes the interest, freshness and regular scores of all the
+        tracks, with the formulas of :mod:`flozz_daily_mix.scores`. Scores
+        that would be ``NULL`` in SQLite are NaN.
+
+        :param str day: The reference day (``YYYY-MM-DD``, default: today,
+            UTC).
+
+        :rtype: (numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        day, now, year = self._get_day(day)
+        if day in self._scores:
+            return self._scores[day]
+        log = numpy.log10
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            low_play_count = log(1 + numpy.minimum(self.play_count, 10))
+            rotation = log(1 + numpy.minimum(now - self.last_played_or_epoch, 30))
+            interest = (
+                log(self.rating) * (1 + 1.2 * self.starred)
+                + 1
+                + log(11)
+                - low_play_count / 10
+                + rotation / log(30) / 50
+            )
+            freshness = (
+                (
+                    1
+                    + (log(366) - log(1 + now - numpy.maximum(self.created, 365)))
+                    / log(365)
+                )
+                + (1 + log(6) - log(1 + numpy.minimum(int(year) - self.year, 5)))
+                + 1
+                + log(11)
+                - low_play_count
+            )
+            regular = (1 + log(numpy.power(self.rating, 2))) + rotation / log(30) / 4
+        for score in (interest, freshness, regular):
+            score[~numpy.isfinite(score)] = numpy.nan
+        # Only keep the scores of the last day
+        self._scores = {day: (interest, freshness, regular)}
+        return self._scores[day]
+
+    def _get_ignored(self, ignore_bit):
+        ignored = numpy.zeros(len(self), dtype=bool)
+        if not ignore_bit:
+            return ignored
+        query = "SELECT trackId, mask FROM temp.track_ignore_masks"
+        for track_id, mask in self._db.execute_query(query):
+            if mask & ignore_bit and track_id in self._indexes:
+                ignored[self._indexes[track_id]] = True
+        return ignored
+
+    def _select_best(self, indexes, keys, k, rng):
+        # Returns the indexes of the k highest keys, by decreasing key. Ties
+        # are broken randomly.
+        if k <= 0 or not len(indexes):
+            return indexes[:0]
+        if len(indexes) > k:
+            partition = numpy.argpartition(-keys, k - 1)
+            threshold = keys[partition[k - 1]]
+            best = keys > threshold
+            tied = numpy.flatnonzero(keys == threshold)
+            selected = numpy.concatenate(
+                [
+                    numpy.flatnonzero(best),
+                    rng.choice(tied, k - best.sum(), replace=False),
+                ]
+            )
+            indexes = indexes[selected]
+            keys = keys[selected]
+        order = rng.permutation(len(indexes))
+        order = order[numpy.argsort(-keys[order], kind="stable")]
+        return indexes[order]
+
+    def select_pools(
+        self,
+        limits,
+        min_rate=2,
+        min_duration=60,
+        max_duration=600,
+        genre_ids=None,
+        ignore_bit=0,
+        day=None,
+    ):
+        """Selects the candidate tracks of the pools of a playlist.
+
+        * interest, freshness: the tracks with the highest score,
+        * back catalog: the tracks that were not played for the longest time,
+        * regular: a random sample, proportional to the regular score.
+
+        :param dict limits: The size of each pool (``{TrackRole: int}``).
+        :param int min_rate: The minimal rating of the tracks.
+        :param int min_duration: The minimal duration of the tracks.
+        :param int max_duration: The maximal duration of the tracks.
+        :param set genre_ids: Only select tracks of the genres with these IDs
+            (default: all the genres).
+        :param int ignore_bit: Ignore the tracks whose mask in the
+            ``temp.track_ignore_masks`` table contains this bit.
+        :param str day: The reference day of the scores.
+
+        :rtype: dict
+        :return: The tracks of each pool (``{TrackRole: [dict, ...]}``).
+        """
+        # Avoid circular import
+        from .playlist import TrackRole
+
+        interest, freshness, regular = self.get_scores(day)
+        rng = numpy.random.default_rng(random.getrandbits(64))
+
+        mask = (
+            (self.rating >= min_rate)
+            & (self.duration >= min_duration)
+            & (self.duration <= max_duration)
+            & ~self._get_ignored(ignore_bit)
+        )
+        if genre_ids is not None:
+            genre_mask = numpy.zeros(len(self), dtype=bool)
+            genre_mask[self.genre_track[numpy.isin(self.genre_id, list(genre_ids))]] = (
+                True
+            )
+            mask &= genre_mask
+        indexes = numpy.flatnonzero(mask)
+
+        # NULL scores are sorted last
+        pools = {}
+        pools[TrackRole.INTEREST] = self._select_best(
+            indexes,
+            numpy.nan_to_num(interest[indexes], nan=-numpy.inf),
+            limits[TrackRole.INTEREST],
+            rng,
+        )
+        pools[TrackRole.FRESHNESS] = self._select_best(
+            indexes,
+            numpy.nan_to_num(freshness[indexes], nan=-numpy.inf),
+            limits[TrackRole.FRESHNESS],
+            rng,
+        )
+        played = indexes[~numpy.isnan(self.last_played[indexes])]
+        pools[TrackRole.BACKCATALOG] = self._select_best(
+            played, -self.last_played[played], limits[TrackRole.BACKCATALOG], rng
+        )
+        # Weighted random sample (Efraimidis-Spirakis keys, like
+        # flozz_daily_mix.sampling.WeightedReservoir)
+        weighted = indexes[regular[indexes] > 0]
+        keys = numpy.log(1 - rng.random(len(weighted))) / regular[weighted]
+        pools[TrackRole.REGULAR] = self._select_best(
+            weighted, keys, limits[TrackRole.REGULAR], rng
+        )
+
+        return {
+            role: [self._get_track(i, interest, freshness, regular) for i in pool]
+            for role, pool in pools.items()
+        }
+
+    def _get_track(self, index, interest, freshness, regular):
+        track = dict(zip(self._TRACK_FIELDS, self._tracks[index]))
+        track["fzzInterestScore"] = self._to_score(interest[index])
+        track["fzzFreshnessScore"] = self._to_score(freshness[index])
+        track["fzzRegularScore"] = self._to_score(regular[index])
+        track["rand"] = None
+        return track
+
+    @staticmethod
+    def _to_score(value):
+        return None if numpy.isnan(value) else float(value)
@@ -3,11 +3,22 @@ import sys
 import configparser
 import logging
 
+from .playlist import SAMPLING_ENGINES
+
 _DEFAULT_CONFIG = {
     "subsonic/api_url": None,
     "subsonic/api_username": None,
     "subsonic/api_password": None,
     "subsonic/api_legacy_authentication": None,
+    "subsonic/workers": 4,
+    "subsonic/timeout": 30,
+    "subsonic/max_retries": 3,
+    "cache/path": None,
+    "cache/max_size": 256,
+    "cache/ttl_artists": 3600,
+    "cache/ttl_albums": 3600,
+    "cache/ttl_tracks": 3600,
+    "cache/ttl_playlists": 0,
     "playlists": [],
 }
 
@@ -21,6 +32,7 @@ _DEFAULT_PLAYLIST_CONFIG = {
     "ignore_tracks_matching": "",
     "minimal_track_rating": 2,
     "genres": ["all"],
+    "sampling_engine": "sql",
 }
 
 
@@ -31,7 +43,7 @@ def read_config(config_files):
     parser.read(config_files)
 
     for section in parser:
-        if section in ["subsonic"]:
+        if section in ["subsonic", "cache"]:
             for key in parser[section]:
                 option_name = "%s/%s" % (section, key)
                 if option_name in _DEFAULT_CONFIG:
@@ -56,6 +68,21 @@ def read_config(config_files):
                             % (parser[section][key], section, key, str(error))
                         )
                         sys.exit(1)
+                # Check sampling engine
+                if (
+                    key == "sampling_engine"
+                    and parser[section][key] not in SAMPLING_ENGINES
+                ):
+                    logging.error(
+                        "Invalid value '%s' for '[%s]%s' setting: expected one of %s"
+                        % (
+                            parser[section][key],
+                            section,
+                            key,
+                            ", ".join(SAMPLING_ENGINES),
+                        )
+                    )
+                    sys.exit(1)
                 if type(_DEFAULT_PLAYLIST_CONFIG[key]) in (list, tuple):
                     playlist[key] = [
                         item.strip() for item in parser[section][key].split(",")
@@ -75,4 +102,25 @@ def read_config(config_files):
             "subsonic/api_legacy_authentication"
         ].lower() in ["true", "yes", "y", "1"]
 
+    for option_name in [
+        "subsonic/workers",
+        "subsonic/timeout",
+        "subsonic/max_retries",
+        "cache/max_size",
+        "cache/ttl_artists",
+        "cache/ttl_albums",
+        "cache/ttl_tracks",
+        "cache/ttl_playlists",
+    ]:
+        if type(config[option_name]) is not str:
+            continue
+        try:
+            config[option_name] = int(config[option_name])
+        except ValueError:
+            logging.error(
+                "Invalid value '%s' for '[%s]%s' setting: an integer is expected"
+                % (config[option_name], *option_name.split("/"))
+            )
+            sys.exit(1)
+
     return config
@@ -1,9 +1,15 @@
-import re
+import os
 import math
+import itertools
+import contextlib
 import logging
 import sqlite3
+import urllib.request
 
-from .helpers import normalize_genre_name
+from .helpers import normalize_genre_name, split_genre_names
+from .ignore import TrackIgnoreMatcher
+from .genres import GenreGraph
+from . import scores
 
 # SQL Queries to create the tables. Each creation statement should be separated
 # by a line containing only two dash and a line feed char ("--\n").
@@ -57,6 +63,8 @@ CREATE TABLE IF NOT EXISTS "albums" (
     "created"       TEXT,
     "starred"       INTEGER DEFAULT 0,
     "rating"        NUMERIC DEFAULT 3,
+    "songCount"     INTEGER DEFAULT 0,
+    "duration"      INTEGER DEFAULT 0,
     PRIMARY KEY("id")
 );
 
@@ -82,8 +90,244 @@ CREATE TABLE IF NOT EXISTS "tracks" (
     "lastPlayed"    TEXT DEFAULT NULL,
     PRIMARY KEY("id")
 );
+
+--
+
+CREATE TABLE IF NOT EXISTS "track_scores" (
+    "trackId"           TEXT NOT NULL,
+    "day"               TEXT NOT NULL,
+    "rating"            NUMERIC,
+    "starred"           INTEGER,
+    "playCount"         INTEGER,
+    "lastPlayed"        TEXT,
+    "created"           TEXT,
+    "year"              INTEGER,
+    "interestScore"     REAL,
+    "freshnessScore"    REAL,
+    "regularScore"      REAL,
+    PRIMARY KEY("trackId")
+);
+
+--
+
+CREATE TABLE IF NOT EXISTS "track_genres" (
+    "trackId"       TEXT NOT NULL,
+    "genreId"       INTEGER NOT NULL,
+    PRIMARY KEY("trackId", "genreId")
+) WITHOUT ROWID;
+
+--
+
+CREATE TABLE IF NOT EXISTS "album_syncs" (
+    "albumId"       TEXT NOT NULL,
+    "tracksSynced"  TEXT NOT NULL,
+    PRIMARY KEY("albumId")
+) WITHOUT ROWID;
+
+--
+
+CREATE TABLE IF NOT EXISTS "custom_genres" (
+    "id"            INTEGER NOT NULL UNIQUE,
+    "name"          TEXT NOT NULL UNIQUE,
+    PRIMARY KEY("id" AUTOINCREMENT)
+);
 """
 
+# Tables shadowed by the views of an attached genre database (see
+# Database.attach_genre_db())
+_GENRE_TABLES = ("genres", "genre_aliases", "genre_relations")
+
+# Secondary indexes, by name. They are not required to enforce constraints, so
+# they can be dropped while bulk loading data and created again afterwards.
+_SQL_CREATE_INDEXES = {
+    "genre_relations_parentGenreId": """
+CREATE INDEX IF NOT EXISTS main."genre_relations_parentGenreId"
+    ON "genre_relations" ("parentGenreId");
+""",
+    "genre_relations_childGenreId": """
+CREATE INDEX IF NOT EXISTS main."genre_relations_childGenreId"
+    ON "genre_relations" ("childGenreId");
+""",
+    "genre_aliases_genreId": """
+CREATE INDEX IF NOT EXISTS main."genre_aliases_genreId"
+    ON "genre_aliases" ("genreId");
+""",
+    # Access paths of the playlist generator queries
+    "tracks_lastPlayed": """
+CREATE INDEX IF NOT EXISTS main."tracks_lastPlayed"
+    ON "tracks" ("lastPlayed") WHERE "lastPlayed" IS NOT NULL;
+""",
+    "tracks_albumId": """
+CREATE INDEX IF NOT EXISTS main."tracks_albumId" ON "tracks" ("albumId");
+""",
+    "tracks_albumArtistId": """
+CREATE INDEX IF NOT EXISTS main."tracks_albumArtistId" ON "tracks" ("albumArtistId");
+""",
+    # Index-ordered scans of the best scored tracks
+    "track_scores_interestScore": """
+CREATE INDEX IF NOT EXISTS main."track_scores_interestScore"
+    ON "track_scores" ("interestScore");
+""",
+    "track_scores_freshnessScore": """
+CREATE INDEX IF NOT EXISTS main."track_scores_freshnessScore"
+    ON "track_scores" ("freshnessScore");
+""",
+    "track_scores_regularScore": """
+CREATE INDEX IF NOT EXISTS main."track_scores_regularScore"
+    ON "track_scores" ("regularScore");
+""",
+    "track_genres_genreId": """
+CREATE INDEX IF NOT EXISTS main."track_genres_genreId"
+    ON "track_genres" ("genreId", "trackId");
+""",
+}
+
+# SQL queries to upgrade databases created by previous versions. The
+# "user_version" of a database is the number of migrations applied to it. As
+# for tables creation, statements are separated by "--\n" lines.
+_SQL_MIGRATIONS = [
+    # 1: Store the song count and the duration of albums (incremental sync)
+    """
+ALTER TABLE "albums" ADD COLUMN "songCount" INTEGER DEFAULT 0;
+
+--
+
+ALTER TABLE "albums" ADD COLUMN "duration" INTEGER DEFAULT 0;
+""",
+    # 2: Index the genre relations and aliases
+    """
+CREATE INDEX IF NOT EXISTS "genre_relations_parentGenreId"
+    ON "genre_relations" ("parentGenreId");
+
+--
+
+CREATE INDEX IF NOT EXISTS "genre_relations_childGenreId"
+    ON "genre_relations" ("childGenreId");
+
+--
+
+CREATE INDEX IF NOT EXISTS "genre_aliases_genreId"
+    ON "genre_aliases" ("genreId");
+""",
+    # 3: Index the tracks for the playlist generator queries
+    """
+CREATE INDEX IF NOT EXISTS "tracks_genreName_rating_duration"
+    ON "tracks" ("genreName", "rating", "duration");
+
+--
+
+CREATE INDEX IF NOT EXISTS "tracks_lastPlayed"
+    ON "tracks" ("lastPlayed") WHERE "lastPlayed" IS NOT NULL;
+
+--
+
+CREATE INDEX IF NOT EXISTS "tracks_albumId" ON "tracks" ("albumId");
+
+--
+
+CREATE INDEX IF NOT EXISTS "tracks_albumArtistId" ON "tracks" ("albumArtistId");
+
+--
+
+ANALYZE;
+""",
+    # 4: Store the scores of the tracks of the day
+    """
+CREATE TABLE IF NOT EXISTS "track_scores" (
+    "trackId"           TEXT NOT NULL,
+    "day"               TEXT NOT NULL,
+    "rating"            NUMERIC,
+    "starred"           INTEGER,
+    "playCount"         INTEGER,
+    "lastPlayed"        TEXT,
+    "created"           TEXT,
+    "year"              INTEGER,
+    "interestScore"     REAL,
+    "freshnessScore"    REAL,
+    "regularScore"      REAL,
+    PRIMARY KEY("trackId")
+);
+
+--
+
+CREATE INDEX IF NOT EXISTS "track_scores_interestScore"
+    ON "track_scores" ("interestScore");
+
+--
+
+CREATE INDEX IF NOT EXISTS "track_scores_freshnessScore"
+    ON "track_scores" ("freshnessScore");
+
+--
+
+CREATE INDEX IF NOT EXISTS "track_scores_regularScore"
+    ON "track_scores" ("regularScore");
+""",
+    # 5: Store the IDs of the genres of the tracks
+    """
+CREATE TABLE IF NOT EXISTS "track_genres" (
+    "trackId"       TEXT NOT NULL,
+    "genreId"       INTEGER NOT NULL,
+    PRIMARY KEY("trackId", "genreId")
+) WITHOUT ROWID;
+
+--
+
+CREATE INDEX IF NOT EXISTS "track_genres_genreId"
+    ON "track_genres" ("genreId", "trackId");
+
+--
+
+INSERT OR IGNORE INTO "track_genres" ("trackId", "genreId")
+    SELECT tracks.id, genres.id
+    FROM tracks
+    JOIN genres ON genres.name = tracks.genreName
+    UNION
+    SELECT tracks.id, genre_aliases.genreId
+    FROM tracks
+    JOIN genre_aliases ON genre_aliases.name = tracks.genreName
+    WHERE genre_aliases.genreId IS NOT NULL;
+""",
+    # 6: Drop the index of the genre names of the tracks (tracks are filtered
+    # by genre with the track_genres table)
+    """
+DROP INDEX IF EXISTS "tracks_genreName_rating_duration";
+""",
+    # 7: Store when the tracks of the albums were fetched (incremental sync)
+    """
+CREATE TABLE IF NOT EXISTS "album_syncs" (
+    "albumId"       TEXT NOT NULL,
+    "tracksSynced"  TEXT NOT NULL,
+    PRIMARY KEY("albumId")
+) WITHOUT ROWID;
+""",
+    # 8: Store the genres of the tracks that are not in the genre graph (their
+    # IDs are stored negated in the track_genres table)
+    """
+CREATE TABLE IF NOT EXISTS "custom_genres" (
+    "id"            INTEGER NOT NULL UNIQUE,
+    "name"          TEXT NOT NULL UNIQUE,
+    PRIMARY KEY("id" AUTOINCREMENT)
+);
+
+--
+
+INSERT OR IGNORE INTO "custom_genres" ("name")
+    SELECT DISTINCT genreName
+    FROM tracks
+    WHERE genreName != ''
+      AND id NOT IN (SELECT trackId FROM track_genres);
+
+--
+
+INSERT OR IGNORE INTO "track_genres" ("trackId", "genreId")
+    SELECT tracks.id, -custom_genres.id
+    FROM tracks
+    JOIN custom_genres ON custom_genres.name = tracks.genreName
+    WHERE tracks.id NOT IN (SELECT trackId FROM track_genres);
+""",
+]
+
 
 def sqlite_function_exists(cursor, name):
     """Checks if the given function is available in SQLite.
@@ -111,6 +355,47 @@ def sqlite_function_exists(cursor, name):
 
 class Database:
 
+    #: Fields of the rows given to :meth:`insert_artists_many` (the arguments
+    #: of :meth:`insert_artist`)
+    ARTIST_FIELDS = ("id_", "name", "sortName", "starred", "rating")
+
+    #: Fields of the rows given to :meth:`insert_albums_many`
+    ALBUM_FIELDS = (
+        "id_",
+        "artistId",
+        "genreName",
+        "coverArtId",
+        "name",
+        "sortName",
+        "year",
+        "created",
+        "starred",
+        "rating",
+        "songCount",
+        "duration",
+    )
+
+    #: Fields of the rows given to :meth:`insert_tracks_many`
+    TRACK_FIELDS = (
+        "id_",
+        "albumArtistId",
+        "artistId",
+        "albumId",
+        "coverArtId",
+        "genreName",
+        "diskNumber",
+        "trackNumber",
+        "name",
+        "sortName",
+        "duration",
+        "year",
+        "created",
+        "starred",
+        "rating",
+        "playCount",
+        "lastPlayed",
+    )
+
     _DEFAULT_ARTIST = {
         "id_": "default-artist-0",
         "name": "Unknown Artist",
@@ -132,12 +417,49 @@ class Database:
         "rating": 3,
     }
 
-    def __init__(self, db_path=":memory:", skip_table_creation=False):
+    #: Maximum number of ``ignore_tracks_matching`` patterns whose masks are
+    #: stored at the same time (one bit of a SQLite integer per pattern)
+    MAX_TRACK_IGNORE_PATTERNS = 62
+
+    def __init__(self, db_path=":memory:", skip_table_creation=False, read_only=False):
         self._db_path = db_path
-        self._con = sqlite3.connect(self._db_path)
+        self._read_only = read_only
+        self._bulk_loading = False
+        # Bits of the patterns stored in the temp.track_ignore_masks table
+        self._track_ignore_patterns = {}
+        # Patterns whose masks did not fit in the table, matched by the next
+        # pass (see compute_track_ignore_masks())
+        self._pending_track_ignore_patterns = []
+        # In-memory genre graph (see get_genre_graph())
+        self._genre_graph = None
+        # Whether a genre database is attached (see attach_genre_db())
+        self._genre_db_attached = False
+        # The connection can be handed over to another thread (see
+        # flozz_daily_mix.pipeline.DatabaseWriter), but it is never used by two
+        # threads at the same time
+        if read_only:
+            # Only the temporary tables can be written (e.g. by playlist
+            # generation workers sharing the same database file)
+            self._con = sqlite3.connect(
+                "file:%s?mode=ro"
+                % urllib.request.pathname2url(os.path.abspath(self._db_path)),
+                uri=True,
+                check_same_thread=False,
+            )
+        else:
+            # URI filenames are enabled to attach the genre database read-only
+            # (see attach_genre_db())
+            self._con = sqlite3.connect(
+                self._db_path, uri=True, check_same_thread=False
+            )
         self._cur = self._con.cursor()
-        if not skip_table_creation:
+        if not read_only:
+            self._migrate()
+        if not skip_table_creation and not read_only:
             self._create_tables()
+        if not read_only and self._table_exists("tracks"):
+            self._cur.execute("PRAGMA user_version = %i" % len(_SQL_MIGRATIONS))
+            self._con.commit()
         # Add missing math functions (if SQLite was not compiled with
         # 'SQLITE_ENABLE_MATH_FUNCTIONS')
         if not sqlite_function_exists(self._cur, "log"):
@@ -146,18 +468,300 @@ class Database:
         if not sqlite_function_exists(self._cur, "power"):
             logging.debug("Adding missing 'POWER()' math function to SQLite...")
             self._con.create_function("power", 2, math.pow)
-        # Add regexp filtering function
-        self._con.create_function(
-            "regexp_match", 2, lambda r, v: bool(re.match(r, v, re.I))
+        self._create_temp_objects()
+
+    def _create_temp_objects(self):
+        # Tracks matching ignore patterns (see compute_track_ignore_masks())
+        self._cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS track_ignore_masks "
+            "(trackId TEXT PRIMARY KEY, mask INTEGER NOT NULL)"
+        )
+        # Genres the tracks are filtered on (see set_genre_filter())
+        self._cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS genre_filter "
+            "(genreId INTEGER PRIMARY KEY)"
+        )
+        # Playlists generated together, and the genres they are filtered on
+        # (see set_batch_playlists())
+        self._cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS batch_playlists "
+            "(playlistId INTEGER PRIMARY KEY, minRate NUMERIC, minDuration INTEGER, "
+            "maxDuration INTEGER, ignoreMask INTEGER, genreFiltered INTEGER, "
+            "allRows INTEGER, interestLimit INTEGER, freshnessLimit INTEGER, "
+            "backcatalogLimit INTEGER, regularLimit INTEGER)"
+        )
+        self._cur.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS batch_genre_filter "
+            "(playlistId INTEGER, genreId INTEGER, PRIMARY KEY(playlistId, genreId))"
         )
+        # Genres of the attached genre database (see attach_genre_db())
+        if self._genre_db_attached:
+            for table in _GENRE_TABLES:
+                self._cur.execute(
+                    'CREATE TEMP VIEW IF NOT EXISTS "%s" AS '
+                    'SELECT * FROM genre_db."%s"' % (table, table)
+                )
+
+    def _table_exists(self, name):
+        query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+        self._cur.execute(query, {"name": name})
+        return bool(self._cur.fetchone())
 
     def _create_tables(self):
         # Create tables
         for statement in _SQL_CREATE_TABLES.split("--"):
             self._cur.execute(statement)
+        self.create_indexes()
         # Insert default artist and album to attach orphan albums and tracks
-        self.insert_artist(**self._DEFAULT_ARTIST)
-        self.insert_album(**self._DEFAULT_ALBUM)
+        self.insert_artist(**self._DEFAULT_ARTIST, upsert=True)
+        self.insert_album(**self._DEFAULT_ALBUM, upsert=True)
+
+    def create_indexes(self):
+        """Creates the secondary indexes (if they do not exist)."""
+        for statement in _SQL_CREATE_INDEXES.values():
+            self._cur.execute(statement)
+
+    def drop_indexes(self):
+        """Drops the secondary indexes."""
+        for name in _SQL_CREATE_INDEXES:
+            self._cur.execute('DROP INDEX IF EXISTS main."%s"' % name)
+
+    @property
+    def is_bulk_loading(self):
+        """Whether the database is in bulk-load mode (see :meth:`bulk_load`).
+
+        :rtype: bool
+        """
+        return self._bulk_loading
+
+    @contextlib.contextmanager
+    def bulk_load(self, vacuum=True):
+        """Context manager to quickly fill a new database.
+
+        While loading, the journal is disabled, data is not synced to the
+        disk, and secondary indexes are dropped. Once the block completes,
+        the data is committed, indexes are created again, statistics are
+        computed (``ANALYZE``), and the database is compacted (``VACUUM``).
+
+        .. WARNING::
+
+            The database file will be corrupted if the block is interrupted
+            (an error, a crash,...). Only use it to build a new database in a
+            temporary file, that is discarded on error.
+
+        :param bool vacuum: Run ``VACUUM`` at the end (default: ``True``).
+        """
+        self._con.commit()
+        self._cur.execute("PRAGMA journal_mode = OFF")
+        self._cur.execute("PRAGMA synchronous = OFF")
+        self._cur.execute("PRAGMA temp_store = MEMORY")
+        # Changing temp_store deletes all the temporary tables and views
+        self._track_ignore_patterns = {}
+        self._create_temp_objects()
+        self._cur.execute("PRAGMA cache_size = -65536")  # 64 MiB
+        self.drop_indexes()
+        self._bulk_loading = True
+        try:
+            yield self
+            self._con.commit()
+            logging.debug("Creating indexes...")
+            self.create_indexes()
+            # Only the main database (a genre database may be attached)
+            self._cur.execute("ANALYZE main")
+            self._con.commit()
+        finally:
+            self._bulk_loading = False
+            self._cur.execute("PRAGMA synchronous = FULL")
+            self._cur.execute("PRAGMA journal_mode = DELETE")
+        if vacuum:
+            logging.debug("Compacting the database...")
+            # The indexes of the genre tables cannot be rebuilt while the
+            # tables are shadowed by the views of the genre database
+            for table in _GENRE_TABLES if self._genre_db_attached else ():
+                self._cur.execute('DROP VIEW IF EXISTS temp."%s"' % table)
+            self._cur.execute("VACUUM")
+            self._create_temp_objects()
+
+    def _migrate(self):
+        # Nothing to migrate in a new database
+        if not self._table_exists("tracks"):
+            return
+        (version,) = self._cur.execute("PRAGMA user_version").fetchone()
+        for index, migration in enumerate(_SQL_MIGRATIONS[version:], version + 1):
+            logging.debug("Applying database migration %i..." % index)
+            for statement in migration.split("--"):
+                self._cur.execute(statement)
+            self._cur.execute("PRAGMA user_version = %i" % index)
+        self._con.commit()
+
+    def _insert_many(self, table, fields, rows, upsert=False, chunk_size=1000):
+        """Inserts rows in a table, using one ``executemany()`` call per chunk
+        of rows.
+
+        :param str table: The name of the table.
+        :param tuple fields: The fields of the rows (in the column order).
+        :param rows: An iterable of tuples.
+        :param bool upsert: Replace existing rows with the same id.
+        :param int chunk_size: The number of rows inserted per call.
+
+        :rtype: int
+        :return: The number of inserted rows.
+        """
+        query = "%s INTO %s VALUES(%s)" % (
+            "INSERT OR REPLACE" if upsert else "INSERT",
+            table,
+            ", ".join(["?"] * len(fields)),
+        )
+        rows = iter(rows)
+        count = 0
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            try:
+                self._cur.executemany(query, chunk)
+            except sqlite3.DatabaseError as error:
+                logging.error(
+                    "DB: An error occured when inserting into %s: %s"
+                    % (
+                        table,
+                        (
+                            dict(zip(fields, chunk[0]))
+                            if len(chunk) == 1
+                            else "%i rows" % len(chunk)
+                        ),
+                    )
+                )
+                raise error
+            count += len(chunk)
+        return count
+
+    def _album_row_with_defaults(self, row):
+        if row[1]:
+            return row
+        return (row[0], self._DEFAULT_ARTIST["id_"], *row[2:])
+
+    def _track_row_with_defaults(self, row):
+        id_, albumArtistId, artistId, albumId, *values = row
+
+        if albumArtistId and not artistId:
+            artistId = albumArtistId
+        elif not albumArtistId and artistId:
+            albumArtistId = artistId
+        elif not albumArtistId and not artistId:
+            albumArtistId = self._DEFAULT_ARTIST["id_"]
+            artistId = self._DEFAULT_ARTIST["id_"]
+
+        if not albumId:
+            albumId = self._DEFAULT_ALBUM["id_"]
+
+        return (id_, albumArtistId, artistId, albumId, *values)
+
+    def insert_artists_many(self, artists, upsert=False, chunk_size=1000):
+        """Inserts artists.
+
+        :param artists: An iterable of tuples whose values follow
+            :attr:`ARTIST_FIELDS`.
+        :param bool upsert: Replace existing artists with the same id.
+        :param int chunk_size: The number of rows inserted per query.
+
+        :rtype: int
+        :return: The number of inserted artists.
+        """
+        return self._insert_many(
+            "artists", self.ARTIST_FIELDS, artists, upsert, chunk_size
+        )
+
+    def insert_albums_many(self, albums, upsert=False, chunk_size=1000):
+        """Inserts albums. Albums without artist are attached to the default
+        artist.
+
+        :param albums: An iterable of tuples whose values follow
+            :attr:`ALBUM_FIELDS`.
+        :param bool upsert: Replace existing albums with the same id.
+        :param int chunk_size: The number of rows inserted per query.
+
+        :rtype: int
+        :return: The number of inserted albums.
+        """
+        return self._insert_many(
+            "albums",
+            self.ALBUM_FIELDS,
+            map(self._album_row_with_defaults, albums),
+            upsert,
+            chunk_size,
+        )
+
+    def insert_tracks_many(self, tracks, upsert=False, chunk_size=1000):
+        """Inserts tracks. Tracks without artist or album are attached to the
+        default artist and album. The albums of the tracks are marked as
+        synchronized now (see :meth:`get_stale_album_ids`).
+
+        :param tracks: An iterable of tuples whose values follow
+            :attr:`TRACK_FIELDS`.
+        :param bool upsert: Replace existing tracks with the same id.
+        :param int chunk_size: The number of rows inserted per query.
+
+        :rtype: int
+        :return: The number of inserted tracks.
+        """
+        self._track_ignore_patterns.clear()
+        track_genres = []
+        album_ids = set()
+
+        def _rows():
+            for track in tracks:
+                track = self._track_row_with_defaults(track)
+                track_genres.append((track[0], track[5]))
+                album_ids.add(track[3])
+                yield track
+
+        count = self._insert_many(
+            "tracks", self.TRACK_FIELDS, _rows(), upsert, chunk_size
+        )
+        self.update_track_genres(track_genres, replace=upsert)
+        self._cur.executemany(
+            "INSERT OR REPLACE INTO album_syncs VALUES(?, DATETIME('now'))",
+            ((album_id,) for album_id in album_ids),
+        )
+        return count
+
+    def insert_genres_many(self, genres, chunk_size=1000):
+        """Inserts genres.
+
+        :param genres: An iterable of ``(id, name)`` tuples.
+
+        :rtype: int
+        """
+        self._genre_graph = None
+        return self._insert_many(
+            "genres", ("id_", "name"), genres, chunk_size=chunk_size
+        )
+
+    def insert_genre_aliases_many(self, aliases, chunk_size=1000):
+        """Inserts genre aliases.
+
+        :param aliases: An iterable of ``(id, genreId, name)`` tuples.
+
+        :rtype: int
+        """
+        self._genre_graph = None
+        return self._insert_many(
+            "genre_aliases", ("id_", "genreId", "name"), aliases, chunk_size=chunk_size
+        )
+
+    def insert_genre_relations_many(self, relations, chunk_size=1000):
+        """Inserts genre relations.
+
+        :param relations: An iterable of ``(id, parentGenreId, childGenreId)``
+            tuples.
+
+        :rtype: int
+        """
+        self._genre_graph = None
+        return self._insert_many(
+            "genre_relations",
+            ("id_", "parentGenreId", "childGenreId"),
+            relations,
+            chunk_size=chunk_size,
+        )
 
     def insert_artist(
         self,
@@ -166,16 +770,11 @@ class Database:
         sortName=None,
         starred=None,
         rating=None,
+        upsert=False,
     ):
-        params = {k.rstrip("_"): v for k, v in locals().items()}
-        query = "INSERT INTO artists VALUES(:id, :name, :sortName, :starred, :rating)"
-        try:
-            self._cur.execute(query, params)
-        except sqlite3.DatabaseError as error:
-            logging.error(
-                "DB: An error occured when inserting artist: %s" % str(params)
-            )
-            raise error
+        self.insert_artists_many(
+            [(id_, name, sortName, starred, rating)], upsert=upsert
+        )
 
     def insert_album(
         self,
@@ -189,21 +788,14 @@ class Database:
         created=None,
         starred=None,
         rating=None,
+        songCount=None,
+        duration=None,
+        upsert=False,
     ):
-        params = {k.rstrip("_"): v for k, v in locals().items()}
-
-        if not params["artistId"]:
-            params["artistId"] = self._DEFAULT_ARTIST["id_"]
-
-        query = (
-            "INSERT INTO albums VALUES(:id, :artistId, :genreName, :coverArtId, "
-            ":name, :sortName, :year, :created, :starred, :rating)"
+        params = locals()
+        self.insert_albums_many(
+            [tuple(params[field] for field in self.ALBUM_FIELDS)], upsert=upsert
         )
-        try:
-            self._cur.execute(query, params)
-        except sqlite3.DatabaseError as error:
-            logging.error("DB: An error occured when inserting album: %s" % str(params))
-            raise error
 
     def insert_track(
         self,
@@ -224,45 +816,372 @@ class Database:
         rating=None,
         playCount=None,
         lastPlayed=None,
+        upsert=False,
     ):
-        params = {k.rstrip("_"): v for k, v in locals().items()}
-
-        if params["albumArtistId"] and not params["artistId"]:
-            params["artistId"] = params["albumArtistId"]
-        elif not params["albumArtistId"] and params["artistId"]:
-            params["albumArtistId"] = params["artistId"]
-        elif not params["albumArtistId"] and not params["artistId"]:
-            params["albumArtistId"] = self._DEFAULT_ARTIST["id_"]
-            params["artistId"] = self._DEFAULT_ARTIST["id_"]
-
-        if not params["albumId"]:
-            params["albumId"] = self._DEFAULT_ALBUM["id_"]
-
-        query = (
-            "INSERT INTO tracks VALUES(:id, :albumArtistId, :artistId, :albumId, "
-            ":coverArtId, :genreName, :diskNumber, :trackNumber, :name, :sortName, "
-            ":duration, :year, :created, :starred, :rating, :playCount, :lastPlayed)"
+        params = locals()
+        self.insert_tracks_many(
+            [tuple(params[field] for field in self.TRACK_FIELDS)], upsert=upsert
         )
-        try:
-            self._cur.execute(query, params)
-        except sqlite3.DatabaseError as error:
-            logging.error("DB: An error occured when inserting track: %s" % str(params))
-            raise error
 
     def insert_genre(self, id_=None, name=None):
-        params = {k.rstrip("_"): v for k, v in locals().items()}
-        query = "INSERT INTO genres VALUES(:id, :name)"
-        self._cur.execute(query, params)
+        self.insert_genres_many([(id_, name)])
 
     def insert_genre_alias(self, id_=None, genreId=None, name=None):
-        params = {k.rstrip("_"): v for k, v in locals().items()}
-        query = "INSERT INTO genre_aliases VALUES(:id, :genreId, :name)"
-        self._cur.execute(query, params)
+        self.insert_genre_aliases_many([(id_, genreId, name)])
 
     def insert_genre_relation(self, id_=None, parentGenreId=None, childGenreId=None):
-        params = {k.rstrip("_"): v for k, v in locals().items()}
-        query = "INSERT INTO genre_relations VALUES(:id, :parentGenreId, :childGenreId)"
-        self._cur.execute(query, params)
+        self.insert_genre_relations_many([(id_, parentGenreId, childGenreId)])
+
+    def refresh_track_scores(self, day=None):
+        """Computes the scores of the tracks for the given day, and stores
+        them in the ``track_scores`` table.
+
+        Scores are only computed for new tracks and for tracks whose
+        statistics changed since the last refresh, unless the day changed.
+
+        :param str day: The reference day (``YYYY-MM-DD``, default: today,
+            UTC).
+
+        :rtype: int
+        :return: The number of (re)computed scores.
+        """
+        if day is None:
+            (day,) = self._cur.execute("SELECT DATE('now')").fetchone()
+        if self._read_only:
+            # The scores are refreshed by the process that writes the database
+            logging.debug("Read-only database: scores of the tracks not refreshed")
+            return 0
+        self._cur.execute(scores.SQL_DELETE_OUTDATED_SCORES, {"now": day})
+        self._cur.execute(scores.SQL_REFRESH_SCORES, {"now": day})
+        count = self._cur.rowcount
+        # When all the scores changed (e.g. new day), update the statistics of
+        # the table so the query planner can scan the score indexes
+        self._cur.execute("SELECT COUNT(*) FROM track_scores")
+        if count and count == self._cur.fetchone()[0]:
+            self._cur.execute("ANALYZE track_scores")
+        self._con.commit()
+        logging.debug("Computed the scores of %i track(s) for %s" % (count, day))
+        return count
+
+    def is_outdated(self, day=None):
+        """Checks, without writing anything, whether the database must be
+        migrated or the scores of its tracks refreshed (see
+        :meth:`refresh_track_scores`) before generating playlists.
+
+        :param str day: The reference day (``YYYY-MM-DD``, default: today,
+            UTC).
+
+        :rtype: bool
+        """
+        (version,) = self._cur.execute("PRAGMA user_version").fetchone()
+        if version < len(_SQL_MIGRATIONS):
+            return True
+        if day is None:
+            (day,) = self._cur.execute("SELECT DATE('now')").fetchone()
+        self._cur.execute(scores.SQL_SCORES_OUTDATED, {"now": day})
+        return bool(self._cur.fetchone()[0])
+
+    def compute_track_ignore_masks(self, patterns):
+        """Matches the names of all the tracks against the given
+        ``ignore_tracks_matching`` patterns, in a single pass, and stores
+        which patterns match each track as a bitmask in the
+        ``temp.track_ignore_masks`` table (only tracks matching at least one
+        pattern are stored).
+
+        Nothing is done if the masks of all the patterns are already known.
+        Empty patterns are ignored (they do not filter anything). Only the
+        first :attr:`MAX_TRACK_IGNORE_PATTERNS` patterns are matched, the
+        other ones are matched by the next pass, when one of them is requested
+        (see :meth:`get_track_ignore_mask`).
+
+        :param list patterns: The patterns.
+        """
+        patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+        max_patterns = self.MAX_TRACK_IGNORE_PATTERNS
+        self._pending_track_ignore_patterns = patterns[max_patterns:]
+        patterns = patterns[:max_patterns]
+        if all(pattern in self._track_ignore_patterns for pattern in patterns):
+            return
+        known_patterns = list(self._track_ignore_patterns)
+        all_patterns = known_patterns + [
+            pattern for pattern in patterns if pattern not in known_patterns
+        ]
+        if len(all_patterns) > max_patterns:
+            all_patterns = patterns
+        logging.debug(
+            "Matching track names against %i ignore pattern(s)..." % len(all_patterns)
+        )
+        matcher = TrackIgnoreMatcher(all_patterns)
+        masks = (
+            (track_id, mask)
+            for track_id, name in self._con.execute("SELECT id, name FROM tracks")
+            if (mask := matcher.get_mask(name))
+        )
+        self._cur.execute("DELETE FROM temp.track_ignore_masks")
+        self._cur.executemany(
+            "INSERT INTO temp.track_ignore_masks VALUES (?, ?)", masks
+        )
+        self._con.commit()
+        self._track_ignore_patterns = {
+            pattern: 1 << i for i, pattern in enumerate(all_patterns)
+        }
+
+    def get_track_ignore_mask(self, pattern):
+        """Returns the bit of the given ``ignore_tracks_matching`` pattern in
+        the ``temp.track_ignore_masks`` table, computing the masks if needed.
+
+        Tracks matching the pattern are the ones where ``mask & bit != 0``.
+
+        :param str pattern: The pattern.
+
+        :rtype: int
+        :return: The bit of the pattern (``0`` for an empty pattern).
+        """
+        if not pattern:
+            return 0
+        if pattern not in self._track_ignore_patterns:
+            self.compute_track_ignore_masks(
+                [pattern] + self._pending_track_ignore_patterns
+            )
+        return self._track_ignore_patterns[pattern]
+
+    def get_albums_signatures(self):
+        """Returns the values used to detect changes on the stored albums.
+
+        :rtype: dict
+        :return: ``{album_id: (created, songCount, duration)}``.
+        """
+        query = """
+        SELECT id, created, songCount, duration
+        FROM albums
+        WHERE id != :defaultAlbumId
+        """
+        self._cur.execute(query, {"defaultAlbumId": self._DEFAULT_ALBUM["id_"]})
+        return {
+            id_: (created, songCount, duration)
+            for id_, created, songCount, duration in self._cur.fetchall()
+        }
+
+    def get_stale_album_ids(self, max_age, limit=None):
+        """Returns the IDs of the albums whose tracks were fetched more than
+        ``max_age`` days ago (or never), the oldest first.
+
+        :param int max_age: The maximum age of the tracks, in days.
+        :param int limit: The maximum number of IDs to return (default: no
+            limit).
+
+        :rtype: list
+        :return: The IDs of the albums.
+        """
+        query = """
+        SELECT albums.id
+        FROM albums
+        LEFT JOIN album_syncs ON album_syncs.albumId = albums.id
+        WHERE albums.id != :defaultAlbumId
+          AND (album_syncs.tracksSynced IS NULL
+               OR album_syncs.tracksSynced < DATETIME('now', :age))
+        ORDER BY album_syncs.tracksSynced
+        LIMIT :limit
+        """
+        self._cur.execute(
+            query,
+            {
+                "defaultAlbumId": self._DEFAULT_ALBUM["id_"],
+                "age": "-%i days" % max_age,
+                "limit": -1 if limit is None else limit,
+            },
+        )
+        return [row[0] for row in self._cur.fetchall()]
+
+    def delete_artists(self, *, keep_ids):
+        """Deletes all the artists except the given ones (and the default
+        artist).
+
+        :param set keep_ids: The IDs of the artists to keep.
+
+        :rtype: int
+        :return: The number of deleted artists.
+        """
+        self._cur.execute("CREATE TEMP TABLE IF NOT EXISTS keep_ids (id TEXT)")
+        self._cur.execute("DELETE FROM temp.keep_ids")
+        self._cur.executemany(
+            "INSERT INTO temp.keep_ids VALUES(?)", ((id_,) for id_ in keep_ids)
+        )
+        query = """
+        DELETE FROM artists
+        WHERE id != :defaultArtistId
+          AND id NOT IN (SELECT id FROM temp.keep_ids)
+        """
+        self._cur.execute(query, {"defaultArtistId": self._DEFAULT_ARTIST["id_"]})
+        count = self._cur.rowcount
+        self._cur.execute("DELETE FROM temp.keep_ids")
+        return count
+
+    def delete_albums(self, album_ids):
+        """Deletes the given albums and their tracks.
+
+        :param album_ids: The IDs of the albums to delete.
+        """
+        for album_id in album_ids:
+            self._cur.execute("DELETE FROM albums WHERE id = ?", (album_id,))
+            self._cur.execute("DELETE FROM album_syncs WHERE albumId = ?", (album_id,))
+            self.delete_album_tracks(album_id)
+
+    def delete_album_tracks(self, album_id):
+        """Deletes the tracks of the given album.
+
+        :param str album_id: The ID of the album.
+        """
+        self._track_ignore_patterns.clear()
+        self._cur.execute(
+            "DELETE FROM track_genres "
+            "WHERE trackId IN (SELECT id FROM tracks WHERE albumId = ?)",
+            (album_id,),
+        )
+        self._cur.execute("DELETE FROM tracks WHERE albumId = ?", (album_id,))
+
+    def update_track_genres(self, tracks=None, replace=True):
+        """Resolves the genres of tracks to genre IDs (genres and genre
+        aliases), and stores them in the ``track_genres`` table. The genre of
+        a track can contain several genres (e.g. ``"rock; folk"``). Genres
+        that are not in the genre graph are stored in the ``custom_genres``
+        table (see :meth:`get_custom_genre_id`).
+
+        :param tracks: An iterable of ``(trackId, genreName)`` tuples
+            (default: all the tracks).
+        :param bool replace: Remove the previous genres of the tracks.
+
+        :rtype: int
+        :return: The number of stored track genres.
+        """
+        if tracks is None:
+            self._cur.execute("DELETE FROM track_genres")
+            tracks = self._con.execute("SELECT id, genreName FROM tracks").fetchall()
+        elif replace:
+            tracks = list(tracks)
+            self._cur.executemany(
+                "DELETE FROM track_genres WHERE trackId = ?",
+                ((track_id,) for track_id, _ in tracks),
+            )
+        genre_graph = self.get_genre_graph()
+        # Genres were not imported yet
+        if not len(genre_graph):
+            return 0
+        custom_genre_ids = {
+            name: -id_
+            for id_, name in self._con.execute("SELECT id, name FROM custom_genres")
+        }
+
+        def _get_genre_id(name):
+            genre_id = genre_graph.get_genre_id(name)
+            if genre_id is None:
+                if name not in custom_genre_ids:
+                    self._cur.execute(
+                        "INSERT INTO custom_genres (name) VALUES (?)", (name,)
+                    )
+                    custom_genre_ids[name] = -self._cur.lastrowid
+                genre_id = custom_genre_ids[name]
+            return genre_id
+
+        # Most of the tracks share the same genres
+        genre_ids = {}
+        rows = []
+        for track_id, genre_name in tracks:
+            if genre_name not in genre_ids:
+                genre_ids[genre_name] = {
+                    _get_genre_id(name) for name in split_genre_names(genre_name)
+                }
+            rows.extend((track_id, genre_id) for genre_id in genre_ids[genre_name])
+        self._cur.executemany(
+            "INSERT OR IGNORE INTO track_genres (trackId, genreId) VALUES (?, ?)",
+            rows,
+        )
+        return len(rows)
+
+    def get_custom_genre_id(self, genre_name):
+        """Returns the ID of a genre of the tracks that is not in the genre
+        graph (e.g. a custom tag), as stored in the ``track_genres`` table.
+
+        :param str genre_name: The genre name.
+
+        :rtype: int or None
+        :return: The (negative) ID of the genre, or ``None`` if no track has
+            this genre.
+        """
+        query = "SELECT id FROM custom_genres WHERE name = :genre_name"
+        params = {"genre_name": normalize_genre_name(genre_name, first_only=False)}
+        row = self._cur.execute(query, params).fetchone()
+        return -row[0] if row else None
+
+    def set_genre_filter(self, genre_ids):
+        """Stores the IDs of the genres to select in the ``temp.genre_filter``
+        table (used to filter the tracks by genre, joined to the
+        ``track_genres`` table).
+
+        :param set genre_ids: The IDs of the genres.
+        """
+        self._cur.execute("DELETE FROM temp.genre_filter")
+        self._cur.executemany(
+            "INSERT INTO temp.genre_filter (genreId) VALUES (?)",
+            ((genre_id,) for genre_id in genre_ids),
+        )
+
+    def set_batch_playlists(self, playlists, genre_filters):
+        """Stores the filters and the pool sizes of playlists generated
+        together in the ``temp.batch_playlists`` table, and the IDs of the
+        genres they select in the ``temp.batch_genre_filter`` table (see
+        :class:`~flozz_daily_mix.playlist.PlaylistBatchGenerator`).
+
+        :param playlists: An iterable of tuples whose values follow the
+            columns of the ``temp.batch_playlists`` table.
+        :param genre_filters: An iterable of ``(playlistId, genreId)`` tuples.
+        """
+        self._cur.execute("DELETE FROM temp.batch_playlists")
+        self._cur.execute("DELETE FROM temp.batch_genre_filter")
+        self._cur.executemany(
+            "INSERT INTO temp.batch_playlists VALUES (%s)" % ", ".join(["?"] * 11),
+            playlists,
+        )
+        self._cur.executemany(
+            "INSERT OR IGNORE INTO temp.batch_genre_filter VALUES (?, ?)",
+            genre_filters,
+        )
+
+    def attach_genre_db(self, db_path):
+        """Attaches a genre database (see :mod:`flozz_daily_mix.genre_db`)
+        read-only. Its genres, aliases and relations are used instead of the
+        ones of this database (they are shadowed by temporary views).
+
+        :param str db_path: The path of the genre database.
+        """
+        self._con.commit()
+        self._cur.execute(
+            "ATTACH DATABASE ? AS genre_db",
+            (
+                "file:%s?mode=ro"
+                % urllib.request.pathname2url(os.path.abspath(db_path)),
+            ),
+        )
+        self._genre_db_attached = True
+        self._create_temp_objects()
+        self._genre_graph = None
+
+    def get_genre_graph(self):
+        """Returns the genres, their aliases and their relations, loaded in
+        memory (the graph is loaded once, and loaded again when genres are
+        inserted).
+
+        :rtype: flozz_daily_mix.genres.GenreGraph
+        """
+        if self._genre_graph is None:
+            self._genre_graph = GenreGraph(
+                genres=self._con.execute("SELECT id, name FROM genres"),
+                aliases=self._con.execute("SELECT genreId, name FROM genre_aliases"),
+                relations=self._con.execute(
+                    "SELECT parentGenreId, childGenreId FROM genre_relations"
+                ),
+            )
+        return self._genre_graph
 
     def is_genre(self, genre_name):
         """Check if the given genre name is an existing genre.
@@ -440,49 +1359,40 @@ class Database:
                 ):
                     yield subsubgenre_name
 
-    def get_genre_tree(self):
-        genre_tree = []
+    def get_genre_tree(self, root_genre_name=None):
+        """Returns the tree of the genres. The tree is built in memory, from
+        the genre graph (see :meth:`get_genre_graph`).
 
-        # Find root genres
-        params = {}
-        query = """
-        SELECT genres.id AS genreId,
-               genres.name as genreName,
-               genre_relations.parentGenreId as parentGenreId
-        FROM genres
-        LEFT JOIN genre_relations ON genres.id = genre_relations.childGenreId
-        WHERE parentGenreId IS NULL
-        ORDER BY genreName ASC
-        """
-        self._cur.execute(query, params)
+        :param str root_genre_name: Only return the subtree of this genre (a
+            genre name or alias, optional).
 
-        for genreId, genreName, parentGenreId in self._cur.fetchall():
-            genre_tree.append(
-                {
-                    "name": genreName,
-                    "children": [],
-                    "aliases": list(self.get_genre_aliases(genre_name=genreName)),
-                }
-            )
+        :raise ValueError: If the root genre does not exist.
 
-        def _recursive_subgenre_list(root_genres):
-            for genre in root_genres:
-                genre["children"] = [
-                    {
-                        "name": sg,
-                        "children": [],
-                        "aliases": list(self.get_genre_aliases(genre_name=sg)),
-                    }
-                    for sg in self.get_genre_subgenres(
-                        genre_name=genre["name"],
-                        with_aliases=False,
-                        recursive=False,
-                        include_input_genre_name=False,
-                    )
-                ]
-                _recursive_subgenre_list(genre["children"])
+        :rtype: list<dict>
+        :return: The root genres (``{"name": str, "aliases": [str],
+            "children": [dict]}``), sorted by name.
+        """
+        genre_graph = self.get_genre_graph()
+        genre_ids = None
+        if root_genre_name is not None:
+            genre_id = genre_graph.get_genre_id(root_genre_name)
+            if genre_id is None:
+                raise ValueError("Unknown genre '%s'" % root_genre_name)
+            genre_ids = [genre_id]
 
-        _recursive_subgenre_list(genre_tree)
+        genre_tree = []
+        # Children lists of the genres of the current path
+        path = [genre_tree]
+        for genre_id, positions in genre_graph.walk(genre_ids):
+            depth = len(positions)
+            del path[depth:]
+            genre = {
+                "name": genre_graph.get_genre_name(genre_id),
+                "children": [],
+                "aliases": genre_graph.get_genre_aliases(genre_id),
+            }
+            path[-1].append(genre)
+            path.append(genre["children"])
 
         return genre_tree
 
@@ -492,5 +1402,28 @@ class Database:
     def commit(self):
         self._con.commit()
 
+    def is_read_only(self):
+        """Whether the database was opened in read-only mode.
+
+        :rtype: bool
+        """
+        return self._read_only
+
+    def backup(self, db_path):
+        """Copies the database to a file (e.g. to share an in-memory
+        database with other processes).
+
+        :param str db_path: The path of the destination database file.
+        """
+        self._con.commit()
+        con = sqlite3.connect(db_path)
+        try:
+            self._con.backup(con)
+        finally:
+            con.close()
+
+    def close(self):
+        self._con.close()
+
     def __del__(self):
         self._con.close()
@@ -0,0 +1,201 @@
+import os
+import hashlib
+import logging
+import sqlite3
+import tempfile
+
+from .helpers import get_data_file_path, normalize_genre_name
+from .musicbrainz_db import (
+    get_genres,
+    get_genre_aliases,
+    get_l_genre_genre,
+    GENRE_LINK_TYPES,
+)
+
+# Prebuilt SQLite database of the MusicBrainz genres.
+#
+# The genres, their aliases and their relations are read from the MusicBrainz
+# dumps once, and stored in a small database that is attached read-only to the
+# library databases (see Database.attach_genre_db()). The database is stored in
+# a cache directory, and its name contains a hash of the dumps: it is built
+# again when the dumps are updated.
+
+#: Version of the schema of the genre database (part of its file name)
+GENRE_DB_VERSION = 1
+
+#: MusicBrainz dumps the genre database is built from
+GENRE_DATA_FILES = (
+    "musicbrainz_db/genre",
+    "musicbrainz_db/genre_alias",
+    "musicbrainz_db/l_genre_genre",
+)
+
+# Same tables as in the library databases (see flozz_daily_mix.db)
+_SQL_CREATE_TABLES = """
+CREATE TABLE "genres" (
+    "id"            INTEGER NOT NULL UNIQUE,
+    "name"          TEXT NOT NULL UNIQUE,
+    PRIMARY KEY("id" AUTOINCREMENT)
+);
+
+--
+
+CREATE TABLE "genre_aliases" (
+    "id"            INTEGER NOT NULL UNIQUE,
+    "genreId"       INTEGER DEFAULT NULL,
+    "name"          TEXT NOT NULL UNIQUE,
+    PRIMARY KEY("id" AUTOINCREMENT)
+);
+
+--
+
+CREATE TABLE "genre_relations" (
+    "id"            INTEGER NOT NULL UNIQUE,
+    "parentGenreId" INTEGER DEFAULT NULL,
+    "childGenreId"  INTEGER DEFAULT NULL,
+    PRIMARY KEY("id" AUTOINCREMENT)
+);
+
+--
+
+CREATE INDEX "genre_relations_parentGenreId"
+    ON "genre_relations" ("parentGenreId");
+
+--
+
+CREATE INDEX "genre_relations_childGenreId"
+    ON "genre_relations" ("childGenreId");
+
+--
+
+CREATE INDEX "genre_aliases_genreId"
+    ON "genre_aliases" ("genreId");
+"""
+
+
+def iter_genres():
+    """Returns the genres of the MusicBrainz dumps, with normalized names.
+
+    :rtype: generator<(int, str)>
+    :return: ``(id, name)`` tuples.
+    """
+    for genre in get_genres():
+        yield (genre["id"], normalize_genre_name(genre["name"]))
+
+
+def iter_genre_aliases():
+    """Returns the genre aliases of the MusicBrainz dumps, with normalized
+    names.
+
+    :rtype: generator<(int, int, str)>
+    :return: ``(id, genreId, name)`` tuples.
+    """
+    for alias in get_genre_aliases():
+        yield (alias["id"], alias["genre"], normalize_genre_name(alias["name"]))
+
+
+def iter_genre_relations():
+    """Returns the relations between the genres of the MusicBrainz dumps. A
+    genre is the parent of its subgenres, and of the fusion genres it is part
+    of.
+
+    :rtype: generator<(int, int, int)>
+    :return: ``(id, parentGenreId, childGenreId)`` tuples.
+    """
+    for rel in get_l_genre_genre():
+        if rel["link"] == GENRE_LINK_TYPES.SUBGENRE_OF.value:
+            yield (rel["id"], rel["entity0"], rel["entity1"])
+        if rel["link"] == GENRE_LINK_TYPES.FUSION_OF.value:
+            yield (rel["id"], rel["entity1"], rel["entity0"])
+
+
+def get_data_files_hash():
+    """Returns a hash of the MusicBrainz dumps.
+
+    :rtype: str
+    """
+    sha256 = hashlib.sha256()
+    for filename in GENRE_DATA_FILES:
+        with open(get_data_file_path(filename), "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                sha256.update(chunk)
+    return sha256.hexdigest()[:16]
+
+
+def get_default_cache_dir():
+    """Returns the directory where the genre database is stored by default
+    (``$XDG_CACHE_HOME/flozz-daily-mix``, or ``~/.cache/flozz-daily-mix``).
+
+    :rtype: str
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(cache_home, "flozz-daily-mix")
+
+
+def build_genre_db(db_path):
+    """Builds a genre database from the MusicBrainz dumps. The database is
+    built in a temporary file, that replaces the given file once complete.
+
+    :param str db_path: The path of the genre database.
+    """
+    logging.info("Building the genre database '%s'..." % db_path)
+    fd, tmp_db_path = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(db_path),
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(db_path)),
+    )
+    os.close(fd)
+    try:
+        con = sqlite3.connect(tmp_db_path)
+        try:
+            for statement in _SQL_CREATE_TABLES.split("--"):
+                con.execute(statement)
+            con.executemany(
+                "INSERT INTO genres (id, name) VALUES (?, ?)", iter_genres()
+            )
+            con.executemany(
+                "INSERT INTO genre_aliases (id, genreId, name) VALUES (?, ?, ?)",
+                iter_genre_aliases(),
+            )
+            con.executemany(
+                "INSERT INTO genre_relations (id, parentGenreId, childGenreId) "
+                "VALUES (?, ?, ?)",
+                iter_genre_relations(),
+            )
+            con.execute("PRAGMA user_version = %i" % GENRE_DB_VERSION)
+            con.commit()
+            con.execute("VACUUM")
+        finally:
+            con.close()
+        # The database can be shared with other users
+        os.chmod(tmp_db_path, 0o644)
+        os.replace(tmp_db_path, db_path)
+    except BaseException:
+        if os.path.isfile(tmp_db_path):
+            os.unlink(tmp_db_path)
+        raise
+
+
+def get_genre_db_path(cache_dir=None):
+    """Returns the path of the genre database matching the MusicBrainz dumps,
+    and builds it if it does not exist yet.
+
+    :param str cache_dir: The directory of the genre database (default: see
+        :func:`get_default_cache_dir`).
+
+    :raise OSError: If the database cannot be built (e.g. read-only cache
+        directory).
+
+    :rtype: str
+    """
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir()
+    db_path = os.path.join(
+        cache_dir, "genres-v%i-%s.db" % (GENRE_DB_VERSION, get_data_files_hash())
+    )
+    if not os.path.isfile(db_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        build_genre_db(db_path)
+    return db_path
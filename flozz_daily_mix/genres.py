@@ -0,0 +1,236 @@
+from .helpers import normalize_genre_name
+
+
+class GenreGraph:
+    """In-memory graph of the genres, their aliases and their relations (see
+    :meth:`flozz_daily_mix.db.Database.get_genre_graph`).
+
+    The subgenres of a genre (its transitive closure) are computed once and
+    memoized. Relations can form cycles (e.g. with "fusion of" links): each
+    genre is only visited once.
+
+    All the given genre names are normalized (see
+    :func:`flozz_daily_mix.helpers.normalize_genre_name`).
+
+    :param genres: An iterable of ``(id, name)`` tuples.
+    :param aliases: An iterable of ``(genreId, name)`` tuples.
+    :param relations: An iterable of ``(parentGenreId, childGenreId)``
+        tuples.
+
+    >>> graph = GenreGraph(
+    ...     genres=[(1, "rock"), (2, "hard rock"), (3, "metal")],
+    ...     aliases=[(1, "rock music")],
+    ...     relations=[(1, 2), (2, 3), (3, 2)],
+    ... )
+    >>> sorted(graph.expand_genre("Rock Music"))
+    ['hard rock', 'metal', 'rock', 'rock music']
+    >>> sorted(graph.expand_genre("metal"))
+    ['hard rock', 'metal']
+    """
+
+    def __init__(self, genres, aliases, relations):
+        #: Genre names by ID
+        self._names = {}
+        #: Genre IDs by name
+        self._ids = {}
+        #: Genre IDs by alias
+        self._alias_ids = {}
+        #: Aliases by genre ID
+        self._aliases = {}
+        #: Direct subgenre IDs by genre ID
+        self._children = {}
+        #: IDs of the genres that are the subgenre of another genre
+        self._subgenre_ids = set()
+        # Memoized transitive closures (frozensets of genre IDs)
+        self._closures = {}
+
+        for genre_id, name in genres:
+            self._names[genre_id] = name
+            self._ids[name] = genre_id
+        for genre_id, name in aliases:
+            self._alias_ids[name] = genre_id
+            self._aliases.setdefault(genre_id, []).append(name)
+        for parent_id, child_id in relations:
+            if parent_id is None or child_id is None:
+                continue
+            self._children.setdefault(parent_id, []).append(child_id)
+            self._subgenre_ids.add(child_id)
+
+    def __len__(self):
+        return len(self._names)
+
+    def is_genre(self, genre_name):
+        """Checks if the given genre name is an existing genre.
+
+        :param str genre_name: The genre name.
+
+        :rtype: bool
+        """
+        return normalize_genre_name(genre_name, first_only=False) in self._ids
+
+    def is_genre_alias(self, genre_name):
+        """Checks if the given genre name is an existing genre alias.
+
+        :param str genre_name: The genre name.
+
+        :rtype: bool
+        """
+        return normalize_genre_name(genre_name, first_only=False) in self._alias_ids
+
+    def get_genre_id(self, genre_name):
+        """Returns the ID of a genre, from its name or one of its aliases.
+
+        :param str genre_name: The genre name (or alias).
+
+        :rtype: int or None
+        """
+        genre_name = normalize_genre_name(genre_name, first_only=False)
+        if genre_name in self._ids:
+            return self._ids[genre_name]
+        return self._alias_ids.get(genre_name)
+
+    def get_genre_name(self, genre_id):
+        """Returns the name of a genre.
+
+        :param int genre_id: The ID of the genre.
+
+        :rtype: str or None
+        """
+        return self._names.get(genre_id)
+
+    def get_genre_aliases(self, genre_id):
+        """Returns the aliases of a genre.
+
+        :param int genre_id: The ID of the genre.
+
+        :rtype: list<str>
+        """
+        return list(self._aliases.get(genre_id, []))
+
+    def get_subgenres(self, genre_id):
+        """Returns the IDs of the direct subgenres of a genre.
+
+        :param int genre_id: The ID of the genre.
+
+        :rtype: list<int>
+        """
+        return list(self._children.get(genre_id, []))
+
+    def get_root_genres(self):
+        """Returns the IDs of the genres that are not the subgenre of another
+        genre, sorted by name.
+
+        :rtype: list<int>
+        """
+        return sorted(
+            (
+                genre_id
+                for genre_id in self._names
+                if genre_id not in self._subgenre_ids
+            ),
+            key=self._names.__getitem__,
+        )
+
+    def walk(self, genre_ids=None):
+        """Walks the tree of the genres, depth first: each genre is yielded
+        before its subgenres. A genre is not walked again below itself
+        (cycles).
+
+        :param list genre_ids: The IDs of the genres to start from (default:
+            the root genres, see :meth:`get_root_genres`).
+
+        :rtype: generator<(int, tuple)>
+        :return: The ID of each genre, with its position (``(index,
+            count)``) among its siblings and the ones of its ancestors,
+            starting with the root genre.
+
+        >>> graph = GenreGraph([(1, "rock"), (2, "metal"), (3, "pop")], [], [(1, 2)])
+        >>> for genre_id, positions in graph.walk():
+        ...     print(graph.get_genre_name(genre_id), positions)
+        pop ((0, 2),)
+        rock ((1, 2),)
+        metal ((1, 2), (0, 1))
+        """
+        if genre_ids is None:
+            genre_ids = self.get_root_genres()
+        # Stack of (genre ID, positions, IDs of the genres of the path)
+        stack = [
+            (genre_id, ((index, len(genre_ids)),), frozenset([genre_id]))
+            for index, genre_id in reversed(list(enumerate(genre_ids)))
+        ]
+        while stack:
+            genre_id, positions, path = stack.pop()
+            yield genre_id, positions
+            children = [
+                child_id
+                for child_id in self._children.get(genre_id, [])
+                if child_id in self._names and child_id not in path
+            ]
+            for index in reversed(range(len(children))):
+                stack.append(
+                    (
+                        children[index],
+                        positions + ((index, len(children)),),
+                        path | {children[index]},
+                    )
+                )
+
+    def get_closure(self, genre_id):
+        """Returns the IDs of a genre and of all its subgenres, recursively.
+
+        :param int genre_id: The ID of the genre.
+
+        :rtype: frozenset<int>
+        """
+        if genre_id in self._closures:
+            return self._closures[genre_id]
+        closure = {genre_id}
+        stack = [genre_id]
+        while stack:
+            for child_id in self._children.get(stack.pop(), []):
+                if child_id in closure:
+                    continue
+                if child_id in self._closures:
+                    # Already complete: no need to walk it again
+                    closure.update(self._closures[child_id])
+                    continue
+                closure.add(child_id)
+                stack.append(child_id)
+        self._closures[genre_id] = frozenset(closure)
+        return self._closures[genre_id]
+
+    def expand_genre_ids(self, genre_name):
+        """Returns the IDs of a genre and of all its subgenres, recursively.
+
+        :param str genre_name: The genre name (or alias).
+
+        :rtype: frozenset<int>
+        :return: The IDs (empty for unknown genres).
+        """
+        genre_id = self.get_genre_id(genre_name)
+        if genre_id is None:
+            return frozenset()
+        return self.get_closure(genre_id)
+
+    def expand_genre(self, genre_name, with_aliases=True):
+        """Returns the names of a genre and of all its subgenres, recursively.
+
+        Unknown genres are returned as is.
+
+        :param str genre_name: The genre name (or alias).
+        :param bool with_aliases: Whether to include the aliases of the genres
+            (default: ``True``).
+
+        :rtype: set<str>
+        """
+        genre_name = normalize_genre_name(genre_name, first_only=False)
+        genre_id = self.get_genre_id(genre_name)
+        if genre_id is None:
+            return {genre_name}
+        names = set()
+        for subgenre_id in self.get_closure(genre_id):
+            if subgenre_id in self._names:
+                names.add(self._names[subgenre_id])
+            if with_aliases:
+                names.update(self._aliases.get(subgenre_id, []))
+        return names
@@ -42,11 +42,14 @@ def get_data_file_path(filename):
     return root / "data" / filename
 
 
-def normalize_genre_name(genre):
+def normalize_genre_name(genre, first_only=True):
     """Try to normalize the given gnre by removing extra-spaces, converting it
     to lower case,...
 
     :param str genre: The genre name.
+    :param bool first_only: Only keep the first genre of multi-valued genres
+        (separated by ``;``, ``,`` or ``|``, default: ``True``). Set it to
+        ``False`` for a single genre name, which can contain a comma.
 
     :rtype: str
 
@@ -56,8 +59,10 @@ def normalize_genre_name(genre):
     'celtic rock'
     >>> normalize_genre_name("post_punk")
     'post punk'
+    >>> normalize_genre_name("Rock, Pop & Soul", first_only=False)
+    'rock, pop & soul'
     """
-    for separator in (";", ",", "|"):
+    for separator in (";", ",", "|") if first_only else ():
         if separator in genre:
             genre = genre.split(separator)[0]
     genre = genre.strip()
@@ -65,3 +70,50 @@ def normalize_genre_name(genre):
     genre = re.sub(r"[\s _]+", " ", genre)
     genre = re.sub(r"[-–—]+", "-", genre)
     return genre
+
+
+def split_genre_names(genre):
+    """Splits a multi-valued genre (e.g. ``"Rock; Folk"``) and normalizes each
+    of the genre names (see :func:`normalize_genre_name`). Genres are only
+    separated by ``;``, as a genre name can contain a comma.
+
+    :param str genre: The genre(s).
+
+    :rtype: list<str>
+
+    >>> split_genre_names(" Celtic  Rock; Folk Rock ")
+    ['celtic rock', 'folk rock']
+    >>> split_genre_names("Rock;rock ; Post_Punk")
+    ['rock', 'post punk']
+    >>> split_genre_names("Rock, Pop & Soul; Folk")
+    ['rock, pop & soul', 'folk']
+    >>> split_genre_names("")
+    []
+    """
+    genres = []
+    for name in (genre or "").split(";"):
+        name = normalize_genre_name(name, first_only=False)
+        if name and name not in genres:
+            genres.append(name)
+    return genres
+
+
+def format_size(size):
+    """Formats a size in bytes to a human readable string.
+
+    :param int size: The size in bytes.
+
+    :rtype: str
+
+    >>> format_size(42)
+    '42 B'
+    >>> format_size(2048)
+    '2.0 KiB'
+    >>> format_size(5 * 1024**3)
+    '5.0 GiB'
+    """
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return "%i %s" % (size, unit) if unit == "B" else "%.1f %s" % (size, unit)
+        size /= 1024
+    return "%.1f GiB" % size
@@ -0,0 +1,676 @@
+import io
+import ssl
+import time
+import zlib
+import asyncio
+import threading
+import contextlib
+import http.client
+import urllib.error
+import urllib.parse
+
+# Errors raised when a kept-alive connection has been closed by the server
+# while it was idle in the pool
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionError,
+)
+
+_ASYNC_STALE_CONNECTION_ERRORS = (
+    ConnectionError,
+    asyncio.IncompleteReadError,
+)
+
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class TransferStats:
+    """Counts bytes received from the network and bytes obtained once
+    decompressed (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes_received = 0
+        self.bytes_decoded = 0
+
+    def add(self, received, decoded):
+        with self._lock:
+            self.bytes_received += received
+            self.bytes_decoded += decoded
+
+
+class _Decompressor:
+    """Streaming decompressor for the ``gzip`` and ``deflate`` content
+    encodings.
+
+    The ``deflate`` encoding should be zlib-wrapped data, but some servers
+    send raw deflate data: the format is detected from the first bytes.
+
+    :param str content_encoding: The value of the ``Content-Encoding`` header.
+    """
+
+    def __init__(self, content_encoding):
+        self._encoding = (content_encoding or "identity").strip().lower()
+        self._decompressobj = None
+        if self._encoding in ("gzip", "x-gzip"):
+            self._decompressobj = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self._encoding not in ("deflate", "identity"):
+            raise ValueError("Unsupported content encoding '%s'" % self._encoding)
+
+    def decompress(self, data):
+        if self._encoding == "identity":
+            return data
+        if self._decompressobj is None:
+            is_zlib = (
+                len(data) >= 2
+                and data[0] & 0x0F == 8
+                and ((data[0] << 8) | data[1]) % 31 == 0
+            )
+            self._decompressobj = zlib.decompressobj(
+                zlib.MAX_WBITS if is_zlib else -zlib.MAX_WBITS
+            )
+        return self._decompressobj.decompress(data)
+
+    def flush(self):
+        if self._decompressobj is None:
+            return b""
+        return self._decompressobj.flush()
+
+
+def iter_decoded_body(response, stats=None, chunk_size=64 * 1024):
+    """Reads the body of a response chunk by chunk, decompressing it if
+    required.
+
+    :param response: The response (:class:`PooledResponse`).
+    :param TransferStats stats: Counts received and decoded bytes (optional).
+    :param int chunk_size: The size of chunks read from the network.
+
+    :rtype: generator<bytes>
+    """
+    decompressor = _Decompressor(response.headers.get("Content-Encoding"))
+    while True:
+        chunk = response.read(chunk_size)
+        data = decompressor.decompress(chunk) if chunk else decompressor.flush()
+        if stats:
+            stats.add(len(chunk), len(data))
+        if data:
+            yield data
+        if not chunk:
+            break
+
+
+async def iter_decoded_body_async(response, stats=None):
+    """Async version of :func:`iter_decoded_body`.
+
+    :param response: The response (:class:`AsyncStreamedResponse`).
+    :param TransferStats stats: Counts received and decoded bytes (optional).
+
+    :rtype: async_generator<bytes>
+    """
+    decompressor = _Decompressor(response.headers.get("Content-Encoding"))
+    async for chunk in response.iter_chunks():
+        data = decompressor.decompress(chunk)
+        if stats:
+            stats.add(len(chunk), len(data))
+        if data:
+            yield data
+    data = decompressor.flush()
+    if stats:
+        stats.add(0, len(data))
+    if data:
+        yield data
+
+
+class _HostPool:
+    """Idle connections to a single host.
+
+    :param str scheme: The URL scheme (``"http"`` or ``"https"``).
+    :param str netloc: The host (and port) to connect to.
+    :param int pool_size: Maximum number of connections opened to the host.
+    :param float idle_timeout: Idle connections older than this (in seconds)
+        are closed instead of being reused.
+    :param float timeout: Timeout (in seconds) of the socket operations.
+    """
+
+    def __init__(self, scheme, netloc, pool_size, idle_timeout, timeout=None):
+        self._scheme = scheme
+        self._netloc = netloc
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._idle = []  # [(connection, last_used), ...]
+        self._lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(pool_size)
+
+    def new_connection(self):
+        if self._scheme == "https":
+            return http.client.HTTPSConnection(self._netloc, timeout=self._timeout)
+        return http.client.HTTPConnection(self._netloc, timeout=self._timeout)
+
+    def checkout(self):
+        """Returns an idle connection if there is a recent one, or a new
+        connection.
+
+        :rtype: (http.client.HTTPConnection, bool)
+        :return: The connection and whether it is a reused one.
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                connection, last_used = self._idle.pop()
+                if now - last_used <= self._idle_timeout:
+                    return connection, True
+                connection.close()
+        return self.new_connection(), False
+
+    def checkin(self, connection):
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+
+    def close(self):
+        with self._lock:
+            for connection, _ in self._idle:
+                connection.close()
+            self._idle = []
+
+
+class PooledResponse:
+    """An HTTP response whose connection goes back to the pool once the
+    response has been read and closed.
+
+    Use it as a context manager to be sure the connection is released::
+
+        with pool.request("GET", url) as response:
+            data = response.read()
+    """
+
+    def __init__(self, host_pool, connection, response):
+        self._host_pool = host_pool
+        self._connection = connection
+        self._response = response
+        self._released = False
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self._response.read(amt)
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        # The connection can only be reused if the whole body was read and if
+        # the server did not ask to close it
+        if self._response.isclosed() and not self._response.will_close:
+            self._host_pool.checkin(self._connection)
+        else:
+            self._response.close()
+            self._connection.close()
+        self._host_pool.semaphore.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HTTPConnectionPool:
+    """A pool of persistent HTTP/1.1 connections, that can be shared between
+    threads.
+
+    At most ``pool_size`` connections are opened to each host: requests wait
+    for a connection to be available when they are all in use.
+
+    :param int pool_size: Maximum number of connections opened to each host
+        (default: ``4``).
+    :param float idle_timeout: Connections that stayed idle longer than this
+        (in seconds) are closed instead of being reused (default: ``60``).
+    :param int max_redirects: Maximum number of redirects to follow (default:
+        ``5``).
+    :param float timeout: Timeout (in seconds) of the connection and of each
+        read on the socket (default: ``None``, no timeout).
+    """
+
+    def __init__(self, pool_size=4, idle_timeout=60, max_redirects=5, timeout=None):
+        self._pool_size = max(1, pool_size)
+        self._idle_timeout = idle_timeout
+        self._max_redirects = max_redirects
+        self._timeout = timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _get_host_pool(self, scheme, netloc):
+        with self._lock:
+            if (scheme, netloc) not in self._hosts:
+                self._hosts[(scheme, netloc)] = _HostPool(
+                    scheme,
+                    netloc,
+                    self._pool_size,
+                    self._idle_timeout,
+                    timeout=self._timeout,
+                )
+            return self._hosts[(scheme, netloc)]
+
+    def _request(self, method, url, headers):
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.scheme not in ("http", "https"):
+            raise ValueError("Unsupported URL scheme: '%s'" % parsed_url.scheme)
+        host_pool = self._get_host_pool(parsed_url.scheme, parsed_url.netloc)
+        path = urllib.parse.urlunsplit(
+            ("", "", parsed_url.path or "/", parsed_url.query, "")
+        )
+
+        host_pool.semaphore.acquire()
+        connection = None
+        try:
+            connection, reused = host_pool.checkout()
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused:
+                    raise
+                # The server closed the idle socket, retry once with a fresh
+                # connection
+                connection = host_pool.new_connection()
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            host_pool.semaphore.release()
+            raise
+
+        return PooledResponse(host_pool, connection, response)
+
+    def request(self, method, url, headers={}):
+        """Sends an HTTP request, following redirects.
+
+        :param str method: The HTTP method (``"GET"``,...).
+        :param str url: The URL to request.
+        :param dict headers: Additional HTTP headers.
+
+        :raise urllib.error.HTTPError: If the server answered with an error
+            status.
+
+        :rtype: PooledResponse
+        """
+        for _ in range(self._max_redirects + 1):
+            response = self._request(method, url, headers)
+            location = response.headers.get("Location")
+            if response.status in _REDIRECT_STATUSES and location:
+                response.read()
+                response.close()
+                url = urllib.parse.urljoin(url, location)
+                continue
+            if response.status >= 400:
+                response.read()
+                response.close()
+                raise urllib.error.HTTPError(
+                    url, response.status, response.reason, response.headers, None
+                )
+            return response
+        raise urllib.error.HTTPError(
+            url, response.status, "Too many redirects", response.headers, None
+        )
+
+    def close(self):
+        """Closes all the idle connections."""
+        with self._lock:
+            for host_pool in self._hosts.values():
+                host_pool.close()
+
+
+class AsyncHTTPResponse:
+    """A (fully read) HTTP response returned by
+    :class:`AsyncHTTPConnectionPool`.
+
+    :param int status: The HTTP status code.
+    :param str reason: The HTTP reason phrase.
+    :param http.client.HTTPMessage headers: The response headers.
+    :param bytes body: The response body.
+    """
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class AsyncStreamedResponse:
+    """An HTTP response returned by :meth:`AsyncHTTPConnectionPool.stream`,
+    whose body is read on demand.
+
+    :param int status: The HTTP status code.
+    :param str reason: The HTTP reason phrase.
+    :param http.client.HTTPMessage headers: The response headers.
+    :param chunks: The chunks of the body (async generator).
+    :param float timeout: Timeout (in seconds) of each read (optional).
+    """
+
+    def __init__(self, status, reason, headers, chunks, timeout=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._chunks = chunks
+        self._timeout = timeout
+        #: Whether the whole body has been read
+        self.consumed = False
+
+    async def iter_chunks(self):
+        """Reads the (raw) body chunk by chunk.
+
+        :rtype: async_generator<bytes>
+        """
+        while not self.consumed:
+            try:
+                chunk = await asyncio.wait_for(anext(self._chunks), self._timeout)
+            except StopAsyncIteration:
+                self.consumed = True
+                return
+            yield chunk
+
+    async def read(self):
+        """Reads the whole (raw) body.
+
+        :rtype: bytes
+        """
+        return b"".join([chunk async for chunk in self.iter_chunks()])
+
+
+class _AsyncHostPool:
+    """Idle asyncio stream connections to a single host.
+
+    :param str scheme: The URL scheme (``"http"`` or ``"https"``).
+    :param str netloc: The host (and port) to connect to.
+    :param float idle_timeout: Idle connections older than this (in seconds)
+        are closed instead of being reused.
+    :param float timeout: Timeout (in seconds) of the connection.
+    """
+
+    def __init__(self, scheme, netloc, idle_timeout, timeout=None):
+        parsed_netloc = urllib.parse.urlsplit("//%s" % netloc)
+        self._host = parsed_netloc.hostname
+        self._port = parsed_netloc.port or (443 if scheme == "https" else 80)
+        self._ssl = ssl.create_default_context() if scheme == "https" else None
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._idle = []  # [((reader, writer), last_used), ...]
+
+    async def new_connection(self):
+        return await asyncio.wait_for(
+            asyncio.open_connection(self._host, self._port, ssl=self._ssl),
+            self._timeout,
+        )
+
+    def checkout(self):
+        """Returns an idle connection if there is a recent one.
+
+        :rtype: (asyncio.StreamReader, asyncio.StreamWriter) or None
+        """
+        now = time.monotonic()
+        while self._idle:
+            connection, last_used = self._idle.pop()
+            if now - last_used <= self._idle_timeout:
+                return connection
+            connection[1].close()
+        return None
+
+    def checkin(self, connection):
+        self._idle.append((connection, time.monotonic()))
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for (_, writer), _ in idle:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+
+async def _iter_exactly(reader, size, chunk_size):
+    while size > 0:
+        data = await reader.read(min(size, chunk_size))
+        if not data:
+            raise asyncio.IncompleteReadError(b"", size)
+        size -= len(data)
+        yield data
+
+
+def _has_body(method, status):
+    return not (method == "HEAD" or status in (204, 304) or 100 <= status < 200)
+
+
+async def _iter_body_chunks(reader, method, status, headers, chunk_size=64 * 1024):
+    """Reads the body of a response from the connection, chunk by chunk.
+
+    :rtype: async_generator<bytes>
+    """
+    if not _has_body(method, status):
+        return
+    if headers.get("Transfer-Encoding", "").lower() == "chunked":
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";")[0].strip(), 16)
+            if size == 0:
+                # Skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            async for data in _iter_exactly(reader, size, chunk_size):
+                yield data
+            await reader.readexactly(2)  # CRLF
+    elif headers.get("Content-Length") is not None:
+        async for data in _iter_exactly(
+            reader, int(headers["Content-Length"]), chunk_size
+        ):
+            yield data
+    else:
+        while data := await reader.read(chunk_size):
+            yield data
+
+
+async def _send_request(connection, method, request):
+    """Sends a request on the connection and reads the status line and the
+    headers of the response (see :func:`_iter_body_chunks` to read its body).
+
+    :rtype: (int, str, http.client.HTTPMessage, bool)
+    :return: The status, the reason and the headers of the response, and
+        whether the connection can be reused once its body is read.
+    """
+    reader, writer = connection
+    writer.write(request)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("Connection closed by the server")
+    version, status, reason = (status_line.decode("latin-1").split(None, 2) + [""])[:3]
+    status = int(status)
+
+    raw_headers = b""
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionResetError("Connection closed by the server")
+        raw_headers += line
+        if line in (b"\r\n", b"\n"):
+            break
+    headers = http.client.parse_headers(io.BytesIO(raw_headers))
+
+    keep_alive = (
+        version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+    )
+    # Bodies without length are read until the connection is closed
+    if (
+        _has_body(method, status)
+        and headers.get("Transfer-Encoding", "").lower() != "chunked"
+        and headers.get("Content-Length") is None
+    ):
+        keep_alive = False
+
+    return status, reason.strip(), headers, keep_alive
+
+
+class AsyncHTTPConnectionPool:
+    """A pool of persistent HTTP/1.1 connections, based on asyncio streams.
+
+    :param int pool_size: Maximum number of requests in flight (default:
+        ``16``).
+    :param float idle_timeout: Connections that stayed idle longer than this
+        (in seconds) are closed instead of being reused (default: ``60``).
+    :param int max_redirects: Maximum number of redirects to follow (default:
+        ``5``).
+    :param float timeout: Timeout (in seconds) of the connection, of the
+        headers of each response, and of each read of its body (default:
+        ``None``, no timeout).
+    """
+
+    def __init__(self, pool_size=16, idle_timeout=60, max_redirects=5, timeout=None):
+        self._pool_size = max(1, pool_size)
+        self._idle_timeout = idle_timeout
+        self._max_redirects = max_redirects
+        self._timeout = timeout
+        self._hosts = {}
+        self._semaphore = None
+
+    def _get_host_pool(self, scheme, netloc):
+        if (scheme, netloc) not in self._hosts:
+            self._hosts[(scheme, netloc)] = _AsyncHostPool(
+                scheme, netloc, self._idle_timeout, timeout=self._timeout
+            )
+        return self._hosts[(scheme, netloc)]
+
+    async def _send(self, host_pool, method, request):
+        """Sends the request on an idle connection (or a new one), and reads
+        the head of the response.
+
+        :rtype: ((asyncio.StreamReader, asyncio.StreamWriter), tuple)
+        :return: The connection and the head of the response (see
+            :func:`_send_request`).
+        """
+        connection = host_pool.checkout()
+        reused = connection is not None
+        if not reused:
+            connection = await host_pool.new_connection()
+        try:
+            try:
+                head = await asyncio.wait_for(
+                    _send_request(connection, method, request), self._timeout
+                )
+            except _ASYNC_STALE_CONNECTION_ERRORS:
+                connection[1].close()
+                if not reused:
+                    raise
+                # The server closed the idle socket, retry once with a fresh
+                # connection
+                connection = await host_pool.new_connection()
+                head = await asyncio.wait_for(
+                    _send_request(connection, method, request), self._timeout
+                )
+        except BaseException:
+            connection[1].close()
+            raise
+        return connection, head
+
+    @contextlib.asynccontextmanager
+    async def _stream(self, method, url, headers):
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.scheme not in ("http", "https"):
+            raise ValueError("Unsupported URL scheme: '%s'" % parsed_url.scheme)
+        host_pool = self._get_host_pool(parsed_url.scheme, parsed_url.netloc)
+        path = urllib.parse.urlunsplit(
+            ("", "", parsed_url.path or "/", parsed_url.query, "")
+        )
+        request = "".join(
+            ["%s %s HTTP/1.1\r\n" % (method, path), "Host: %s\r\n" % parsed_url.netloc]
+            + ["%s: %s\r\n" % (name, value) for name, value in headers.items()]
+            + ["\r\n"]
+        ).encode("latin-1")
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._pool_size)
+
+        async with self._semaphore:
+            connection, head = await self._send(host_pool, method, request)
+            status, reason, response_headers, keep_alive = head
+            chunks = _iter_body_chunks(connection[0], method, status, response_headers)
+            response = AsyncStreamedResponse(
+                status, reason, response_headers, chunks, timeout=self._timeout
+            )
+            reusable = False
+            try:
+                yield response
+                # The connection can only be reused if the whole body was read
+                reusable = keep_alive and response.consumed
+            finally:
+                await chunks.aclose()
+                if reusable:
+                    host_pool.checkin(connection)
+                else:
+                    connection[1].close()
+
+    @contextlib.asynccontextmanager
+    async def stream(self, method, url, headers={}):
+        """Sends an HTTP request, following redirects, and returns the
+        response before its body is read. The connection goes back to the
+        pool when the block exits, if the whole body was read::
+
+            async with pool.stream("GET", url) as response:
+                async for chunk in response.iter_chunks():
+                    ...
+
+        :param str method: The HTTP method (``"GET"``,...).
+        :param str url: The URL to request.
+        :param dict headers: Additional HTTP headers.
+
+        :raise urllib.error.HTTPError: If the server answered with an error
+            status.
+
+        :rtype: AsyncStreamedResponse
+        """
+        for _ in range(self._max_redirects + 1):
+            async with self._stream(method, url, headers) as response:
+                location = response.headers.get("Location")
+                if response.status in _REDIRECT_STATUSES and location:
+                    await response.read()
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+                if response.status >= 400:
+                    await response.read()
+                    raise urllib.error.HTTPError(
+                        url, response.status, response.reason, response.headers, None
+                    )
+                yield response
+                return
+        raise urllib.error.HTTPError(
+            url, response.status, "Too many redirects", response.headers, None
+        )
+
+    async def request(self, method, url, headers={}):
+        """Sends an HTTP request, following redirects, and reads the whole
+        response.
+
+        :param str method: The HTTP method (``"GET"``,...).
+        :param str url: The URL to request.
+        :param dict headers: Additional HTTP headers.
+
+        :raise urllib.error.HTTPError: If the server answered with an error
+            status.
+
+        :rtype: AsyncHTTPResponse
+        """
+        async with self.stream(method, url, headers) as response:
+            body = await response.read()
+        return AsyncHTTPResponse(
+            response.status, response.reason, response.headers, body
+        )
+
+    async def close(self):
+        """Closes all the idle connections."""
+        for host_pool in self._hosts.values():
+            await host_pool.close()
@@ -0,0 +1,64 @@
+import re
+
+# Back-references cannot be used in a combined pattern as the groups are
+# renumbered
+_BACKREFERENCE_REGEXP = re.compile(r"\\[1-9]|\(\?P=")
+
+
+class TrackIgnoreMatcher:
+    """Matches track names against several ``ignore_tracks_matching``
+    patterns at once, and returns which of them match as a bitmask (bit ``i``
+    is set if the ``i``-th pattern matches).
+
+    Patterns are compiled once (case insensitive, matched from the beginning
+    of the name), and they are also combined in a single pattern that rejects
+    most of the names with one test. Empty patterns never match.
+
+    :param list patterns: The patterns.
+
+    >>> matcher = TrackIgnoreMatcher(["^.*intro.*$", "", "live"])
+    >>> matcher.get_mask("Intro")
+    1
+    >>> matcher.get_mask("Live (intro)")
+    5
+    >>> matcher.get_mask("Foo")
+    0
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._regexps = [
+            (1 << i, re.compile(pattern, re.I))
+            for i, pattern in enumerate(self.patterns)
+            if pattern
+        ]
+        self._combined_regexp = None
+        if len(self._regexps) > 1 and not any(
+            _BACKREFERENCE_REGEXP.search(pattern) for pattern in self.patterns
+        ):
+            try:
+                self._combined_regexp = re.compile(
+                    "|".join(
+                        "(?:%s)" % pattern for pattern in self.patterns if pattern
+                    ),
+                    re.I,
+                )
+            except re.error:  # e.g. global flags not at the start
+                pass
+
+    def get_mask(self, name):
+        """Returns the bitmask of the patterns matching the given name.
+
+        :param str name: The name of the track.
+
+        :rtype: int
+        """
+        if not self._regexps:
+            return 0
+        if self._combined_regexp and not self._combined_regexp.match(name):
+            return 0
+        mask = 0
+        for bit, regexp in self._regexps:
+            if regexp.match(name):
+                mask |= bit
+        return mask
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import threading
+
+
+class _AIMDState:
+    """Computes the concurrency limit of :class:`AIMDLimiter` and
+    :class:`AsyncAIMDLimiter`.
+
+    The limit grows by one request each time a whole "window" of requests
+    (``limit`` requests) succeeded, and it is multiplied by
+    ``decrease_factor`` when a request fails with a transient error or when its
+    latency exceeds ``latency_tolerance`` times the usual latency.
+
+    The limit is decreased at most once per window: requests started before
+    the last decrease do not decrease it again.
+    """
+
+    #: Weight of a new sample in the moving average of the latency
+    LATENCY_SMOOTHING = 0.1
+    #: Number of samples required before latency is used as a signal
+    LATENCY_MIN_SAMPLES = 5
+
+    def __init__(
+        self,
+        max_limit,
+        min_limit=1,
+        initial_limit=None,
+        decrease_factor=0.5,
+        latency_tolerance=2.0,
+    ):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        if initial_limit is None:
+            initial_limit = min(4, self.max_limit)
+        self.limit = float(max(self.min_limit, min(initial_limit, self.max_limit)))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.epoch = 0
+        self._latency = None
+        self._latency_samples = 0
+
+    def _is_congested(self, latency):
+        if latency is None:
+            return False
+        congested = (
+            self._latency_samples >= self.LATENCY_MIN_SAMPLES
+            and latency > self._latency * self.latency_tolerance
+        )
+        if not congested:
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += self.LATENCY_SMOOTHING * (latency - self._latency)
+            self._latency_samples += 1
+        return congested
+
+    def update(self, epoch, latency, error):
+        if error or self._is_congested(latency):
+            if epoch != self.epoch:
+                return
+            self.epoch += 1
+            limit = max(self.min_limit, self.limit * self.decrease_factor)
+            logging.debug(
+                "Too many requests (%s), concurrency limit: %i -> %i"
+                % ("error" if error else "slow response", self.limit, limit)
+            )
+            self.limit = limit
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / int(self.limit))
+
+    def can_start(self):
+        return self.in_flight < int(self.limit)
+
+
+class AIMDLimiter:
+    """Limits the number of requests sent in parallel, adapting the limit to
+    the server capacity (Additive Increase / Multiplicative Decrease)
+    (thread-safe).
+
+    Usage::
+
+        token = limiter.acquire()
+        try:
+            ...  # send the request, measure its latency
+        finally:
+            limiter.release(token, latency=latency, error=failed)
+
+    :param int max_limit: Maximum number of requests in flight.
+    :param int min_limit: Minimum number of requests in flight (default:
+        ``1``).
+    :param int initial_limit: Initial number of requests in flight (default:
+        ``4`` or ``max_limit`` if lower).
+    :param float decrease_factor: Factor applied to the limit when the server
+        seems overloaded (default: ``0.5``).
+    :param float latency_tolerance: A request is considered too slow when its
+        latency exceeds the usual latency multiplied by this value (default:
+        ``2.0``).
+    """
+
+    def __init__(self, max_limit, **kwargs):
+        self._state = _AIMDState(max_limit, **kwargs)
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """The current concurrency limit.
+
+        :rtype: int
+        """
+        return int(self._state.limit)
+
+    def acquire(self):
+        """Waits until a request can be sent.
+
+        :return: A token to pass to :meth:`release`.
+        """
+        with self._condition:
+            self._condition.wait_for(self._state.can_start)
+            self._state.in_flight += 1
+            return self._state.epoch
+
+    def release(self, token, latency=None, error=False):
+        """Signals a request is finished.
+
+        :param token: The token returned by :meth:`acquire`.
+        :param float latency: The latency of the request in seconds (if
+            known).
+        :param bool error: Whether the request failed with a transient error
+            (overloaded server, timeout,...).
+        """
+        with self._condition:
+            self._state.in_flight -= 1
+            self._state.update(token, latency, error)
+            self._condition.notify_all()
+
+
+class AsyncAIMDLimiter:
+    """Asyncio version of :class:`AIMDLimiter` (:meth:`acquire` and
+    :meth:`release` are coroutines). It takes the same parameters.
+
+    .. NOTE::
+
+        The limiter is bound to the event loop it is first used in.
+    """
+
+    def __init__(self, max_limit, **kwargs):
+        self._state = _AIMDState(max_limit, **kwargs)
+        self._condition = None
+
+    @property
+    def limit(self):
+        return int(self._state.limit)
+
+    async def acquire(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(self._state.can_start)
+            self._state.in_flight += 1
+            return self._state.epoch
+
+    async def release(self, token, latency=None, error=False):
+        async with self._condition:
+            self._state.in_flight -= 1
+            self._state.update(token, latency, error)
+            self._condition.notify_all()
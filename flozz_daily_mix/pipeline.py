@@ -0,0 +1,255 @@
+import time
+import queue
+import asyncio
+import logging
+import threading
+
+# Marks the end of the records in the queue
+_END = object()
+
+# Asks the writer to commit the records written so far
+_COMMIT = object()
+
+
+class StageStats:
+    """Throughput counters of a pipeline stage (thread-safe).
+
+    :param str name: The name of the stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        #: Time (in seconds) spent waiting on the other stage
+        self.wait_time = 0.0
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def add(self, count=1, wait_time=0.0):
+        with self._lock:
+            if self._started is None:
+                self._started = time.monotonic()
+            self._finished = time.monotonic()
+            self.count += count
+            self.wait_time += wait_time
+
+    @property
+    def rate(self):
+        """Number of items processed per second.
+
+        :rtype: float
+        """
+        with self._lock:
+            if self._started is None or self._finished == self._started:
+                return float(self.count)
+            return self.count / (self._finished - self._started)
+
+    def __str__(self):
+        return "%s: %i record(s), %.0f/s, waited %.2fs" % (
+            self.name,
+            self.count,
+            self.rate,
+            self.wait_time,
+        )
+
+
+class DatabaseWriter:
+    """Writes records to the database from a dedicated thread, so fetching
+    data from the network and writing it to the database overlap.
+
+    Fetchers push records to a bounded queue: :meth:`put` and :meth:`put_row`
+    block when the queue is full, slowing down the fetchers if the database
+    cannot keep up. The writer thread is the only one to use the database
+    until :meth:`close` is called. It commits every ``batch_size`` records.
+
+    Rows pushed with :meth:`put_row` are grouped, and consecutive rows for the
+    same method are written with a single call (e.g.
+    :meth:`~flozz_daily_mix.db.Database.insert_tracks_many`).
+
+    Usage::
+
+        with DatabaseWriter(db) as writer:
+            writer.put_row("insert_artists_many", ("1", "Foo", "Foo", False, 3))
+            writer.put("delete_album_tracks", album_id="2")
+
+    :param flozz_daily_mix.db.Database db: The database to write to.
+    :param int queue_size: Maximum number of records waiting to be written
+        (default: ``1000``).
+    :param int batch_size: Number of records written per transaction
+        (default: ``500``). If ``None``, records are only committed when
+        :meth:`commit` or :meth:`close` is called.
+    """
+
+    def __init__(self, db, queue_size=1000, batch_size=500):
+        self._db = db
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._batch_size = max(1, batch_size) if batch_size else None
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._run, name="DatabaseWriter", daemon=True
+        )
+        # Rows waiting to be written: [method_name, kwargs, [row, ...]]
+        self._rows = None
+        self._pending = 0
+        #: Records pushed by the fetchers
+        self.fetch_stats = StageStats("fetch")
+        #: Records written to the database
+        self.write_stats = StageStats("write")
+        #: Number of transactions committed
+        self.commit_count = 0
+
+    def start(self):
+        self._thread.start()
+
+    def _commit(self):
+        self._db.commit()
+        self.commit_count += 1
+        self._pending = 0
+
+    def _flush_rows(self):
+        if not self._rows:
+            return
+        method_name, kwargs, rows = self._rows
+        self._rows = None
+        getattr(self._db, method_name)(rows, **kwargs)
+        self._pending += len(rows)
+        if self._batch_size and self._pending >= self._batch_size:
+            self._commit()
+
+    def _write(self, record):
+        if record is _COMMIT:
+            self._flush_rows()
+            self._commit()
+            return
+        method_name, row, kwargs = record
+        if row is None:
+            self._flush_rows()
+            getattr(self._db, method_name)(**kwargs)
+            self._pending += 1
+            if self._batch_size and self._pending >= self._batch_size:
+                self._commit()
+            return
+        if self._rows and self._rows[:2] != [method_name, kwargs]:
+            self._flush_rows()
+        if not self._rows:
+            self._rows = [method_name, kwargs, []]
+        self._rows[2].append(row)
+        # Rows are written in chunks of at most 1000 rows
+        if len(self._rows[2]) >= (self._batch_size or 1000):
+            self._flush_rows()
+
+    def _run(self):
+        while True:
+            start = time.monotonic()
+            record = self._queue.get()
+            wait_time = time.monotonic() - start
+            if record is _END:
+                break
+            # After an error, records are discarded so the fetchers are not
+            # blocked by a full queue
+            if self._error is not None:
+                continue
+            try:
+                self._write(record)
+            except Exception as error:
+                self._error = error
+                continue
+            if record is not _COMMIT:
+                self.write_stats.add(wait_time=wait_time)
+        if self._error is None:
+            try:
+                self._flush_rows()
+                if self._pending:
+                    self._commit()
+            except Exception as error:
+                self._error = error
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _enqueue(self, record):
+        self._check_error()
+        start = time.monotonic()
+        self._queue.put(record)
+        self.fetch_stats.add(wait_time=time.monotonic() - start)
+
+    async def _enqueue_async(self, record):
+        self._check_error()
+        try:
+            self._queue.put_nowait(record)
+            self.fetch_stats.add()
+        except queue.Full:
+            await asyncio.to_thread(self._enqueue, record)
+
+    def put(self, method_name, **kwargs):
+        """Queues a call to a database method, waiting for room in the queue
+        if it is full.
+
+        :param str method_name: The name of the database method to call
+            (e.g. ``"delete_album_tracks"``).
+        :param kwargs: The arguments of the method.
+
+        :raise Exception: The error raised by the writer thread, if any.
+        """
+        self._enqueue((method_name, None, kwargs))
+
+    def put_row(self, method_name, row, **kwargs):
+        """Queues a row to insert, waiting for room in the queue if it is
+        full.
+
+        :param str method_name: The name of the database method that inserts
+            the rows (e.g. ``"insert_tracks_many"``).
+        :param tuple row: The row.
+        :param kwargs: Other arguments of the method (e.g. ``upsert=True``).
+
+        :raise Exception: The error raised by the writer thread, if any.
+        """
+        self._enqueue((method_name, row, kwargs))
+
+    def commit(self):
+        """Asks the writer to commit the records queued so far (e.g. at the
+        end of a phase of the import)."""
+        self._check_error()
+        self._queue.put(_COMMIT)
+
+    async def put_async(self, method_name, **kwargs):
+        """Same as :meth:`put`, but does not block the event loop when the
+        queue is full."""
+        await self._enqueue_async((method_name, None, kwargs))
+
+    async def put_row_async(self, method_name, row, **kwargs):
+        """Same as :meth:`put_row`, but does not block the event loop when the
+        queue is full."""
+        await self._enqueue_async((method_name, row, kwargs))
+
+    def close(self):
+        """Waits for all the queued records to be written and stops the writer
+        thread.
+
+        :raise Exception: The error raised by the writer thread, if any.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_END)
+            self._thread.join()
+        self._check_error()
+
+    def log_stats(self):
+        logging.debug("  * Pipeline %s" % self.fetch_stats)
+        logging.debug(
+            "  * Pipeline %s, %i commit(s)" % (self.write_stats, self.commit_count)
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Stop the writer without hiding the original error
+        self._error = self._error or exc_value
+        self._queue.put(_END)
+        self._thread.join()
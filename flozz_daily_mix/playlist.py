@@ -1,7 +1,22 @@
 import random
 import logging
+import sqlite3
 from enum import Enum
 
+from .sampling import WeightedReservoir
+from .columnar import ColumnarLibrary
+
+#: Ways to draw the candidates of the regular pool:
+#:
+#: * ``"sql"``: the tracks with the best ``random * score`` values, sorted by
+#:   SQLite,
+#: * ``"reservoir"``: a random sample proportional to the score, drawn while
+#:   streaming the tracks (see :class:`~flozz_daily_mix.sampling.WeightedReservoir`),
+#: * ``"numpy"``: all the pools are selected in memory, from NumPy arrays,
+#:   without SQL queries (see :class:`~flozz_daily_mix.columnar.ColumnarLibrary`).
+#:   The regular pool is drawn like with ``"reservoir"``.
+SAMPLING_ENGINES = ("sql", "reservoir", "numpy")
+
 
 class TrackRole(Enum):
     REGULAR = "regular"
@@ -10,6 +25,120 @@ class TrackRole(Enum):
     BACKCATALOG = "backcatalog"
 
 
+def print_playlist(playlist):
+    """Prints a playlist (the tracks returned by
+    :meth:`PlaylistGenerator.get_playlist`) to stdout.
+
+    :param list playlist: The tracks of the playlist.
+    """
+    ROLES = {
+        # fmt: off
+        TrackRole.REGULAR:     {"symbol": "🎝", "color": "\x1B[37;44m"},
+        TrackRole.INTEREST:    {"symbol": "✚", "color": "\x1B[37;43m"},
+        TrackRole.FRESHNESS:   {"symbol": "❊", "color": "\x1B[37;42m"},
+        TrackRole.BACKCATALOG: {"symbol": "⮜", "color": "\x1B[37;45m"},
+        # fmt: on
+    }
+    total_duration = 0
+    print(
+        "%s %s %-5s %s %s %6s %6s %-20s %-35s \x1b[0m"
+        % (
+            "\x1b[1;7m",
+            "R",
+            "Rate",
+            "S",
+            "Regul.",
+            "Inter.",
+            "Fresh.",
+            "Artist Name (Album)",
+            "Track Name",
+        )
+    )
+    for track in playlist:
+        total_duration += track["duration"]
+        print(
+            "%s %s %5s %s %01.4f %01.4f %01.4f %-20s %-35s \x1b[0m"
+            % (
+                ROLES[track["role"]]["color"],
+                ROLES[track["role"]]["symbol"],
+                ("★" * track["rating"]) + (" " * (5 - track["rating"])),
+                "♥" if track["starred"] else "♡",
+                track["fzzRegularScore"],
+                track["fzzInterestScore"],
+                track["fzzFreshnessScore"],
+                track["albumArtistName"][:20],
+                track["trackName"][:35],
+            )
+        )
+    print(
+        "\x1b[1;7m Total duration:\x1b[0;7m %i hr %i min %s sec \x1b[0m"
+        % (
+            total_duration // 3600,
+            total_duration % 3600 // 60,
+            total_duration % 60,
+        )
+    )
+
+
+class TrackPool:
+    """A pool of candidate tracks, from which random tracks can be drawn and
+    removed in constant time.
+
+    :param tracks: Initial tracks (dicts with a ``"trackId"`` key).
+
+    >>> pool = TrackPool([{"trackId": "a"}, {"trackId": "b"}])
+    >>> pool.remove("a")
+    >>> pool.choice()
+    {'trackId': 'b'}
+    >>> "a" in pool, len(pool)
+    (False, 1)
+    """
+
+    def __init__(self, tracks=[]):
+        self._tracks = []
+        self._indexes = {}
+        for track in tracks:
+            self.add(track)
+
+    def add(self, track):
+        """Adds a track (replacing the track with the same id if any).
+
+        :param dict track: The track.
+        """
+        if track["trackId"] in self._indexes:
+            self._tracks[self._indexes[track["trackId"]]] = track
+            return
+        self._indexes[track["trackId"]] = len(self._tracks)
+        self._tracks.append(track)
+
+    def remove(self, track_id):
+        """Removes a track, by replacing it with the last track of the pool.
+
+        :param str track_id: The ID of the track.
+        """
+        index = self._indexes.pop(track_id)
+        last_track = self._tracks.pop()
+        if index < len(self._tracks):
+            self._tracks[index] = last_track
+            self._indexes[last_track["trackId"]] = index
+
+    def choice(self):
+        """Returns a random track of the pool (without removing it).
+
+        :rtype: dict
+        """
+        return self._tracks[random.randrange(len(self._tracks))]
+
+    def values(self):
+        return iter(self._tracks)
+
+    def __contains__(self, track_id):
+        return track_id in self._indexes
+
+    def __len__(self):
+        return len(self._tracks)
+
+
 class PlaylistGenerator:
 
     _SQL_SELECT_FIELDS = [
@@ -26,14 +155,15 @@ class PlaylistGenerator:
         ("starred", "tracks.starred"),
         ("playCount", "tracks.playCount"),
         ("lastPlayed", "tracks.lastPlayed"),
-        ("fzzInterestScore", "%s AS fzzInterestScore"),
-        ("fzzFreshnessScore", "%s AS fzzFreshnessScore"),
-        ("fzzRegularScore", "%s AS fzzRegularScore"),
+        ("fzzInterestScore", "track_scores.interestScore AS fzzInterestScore"),
+        ("fzzFreshnessScore", "track_scores.freshnessScore AS fzzFreshnessScore"),
+        ("fzzRegularScore", "track_scores.regularScore AS fzzRegularScore"),
         ("rand", "ABS(RANDOM()) AS RAND"),
     ]
 
     _SQL_FROM_JOINTS = """
-    FROM tracks
+    FROM track_scores
+    JOIN tracks ON tracks.id = track_scores.trackId
     LEFT JOIN artists ON artists.id = tracks.albumArtistId
     LEFT JOIN albums ON albums.id = tracks.albumId
     """
@@ -42,25 +172,39 @@ class PlaylistGenerator:
         "tracks.rating >= :min_rate",
         "tracks.duration >= :min_duration",
         "tracks.duration <= :max_duration",
-        "NOT REGEXP_MATCH(:track_ignore_pattern, tracks.name)",
+        # Tracks matching the ignore pattern (see
+        # Database.compute_track_ignore_masks())
+        "tracks.id NOT IN (SELECT trackId FROM temp.track_ignore_masks"
+        " WHERE mask & :track_ignore_mask)",
     ]
 
-    _SQL_FRESHNESS_SCORE = """(
-            (1+(LOG(366) - LOG(1+JULIANDAY('now') - MAX(JULIANDAY(tracks.created), 365))) / LOG(365))  -- recently added score
-            + (1+LOG(6)-LOG(1+MIN(STRFTIME("%Y", DATE('now'))-tracks.year, 5)))  -- recently released score
-            + 1+LOG(11)-LOG(1+MIN(tracks.playCount,10))  -- low play count score
-           )"""
-
-    _SQL_INTEREST_SCORE = """(
-            (LOG(tracks.rating)*(1+1.2*tracks.starred))  -- rating score A
-            + 1+LOG(11)-LOG(1+MIN(tracks.playCount,10)) / 10  -- low play count score
-            + (LOG(1+MIN(JULIANDAY('now') - JULIANDAY(IFNULL(tracks.lastPlayed, JULIANDAY('1970-01-01'))), 30))) / LOG(30) / 50  -- rotation score
-           )"""
-
-    _SQL_REGULAR_SCORE = """(
-            (1 + LOG(POWER(tracks.rating, 2)))  -- rating score B
-            + (LOG(1+MIN(JULIANDAY('now') - JULIANDAY(IFNULL(tracks.lastPlayed, JULIANDAY('1970-01-01'))), 30))) / LOG(30) / 4  -- rotation score
-           )"""
+    # Tracks of the genres stored by Database.set_genre_filter() (the CROSS
+    # JOIN makes SQLite look up each genre in the track_genres_genreId index)
+    _SQL_GENRE_FILTER_WHERE_CLAUSE = (
+        "tracks.id IN (SELECT track_genres.trackId FROM temp.genre_filter "
+        "CROSS JOIN track_genres ON track_genres.genreId = genre_filter.genreId)"
+    )
+
+    # Ranking of the tracks in each pool
+    _SQL_POOLS_WINDOWS = [
+        (
+            TrackRole.INTEREST,
+            "ROW_NUMBER() OVER (ORDER BY fzzInterestScore DESC, rand DESC)",
+        ),
+        (
+            TrackRole.FRESHNESS,
+            "ROW_NUMBER() OVER (ORDER BY fzzFreshnessScore DESC, rand DESC)",
+        ),
+        (
+            TrackRole.BACKCATALOG,
+            "CASE WHEN lastPlayed IS NOT NULL THEN ROW_NUMBER() OVER ("
+            "PARTITION BY lastPlayed IS NULL ORDER BY lastPlayed, rand DESC) END",
+        ),
+        (
+            TrackRole.REGULAR,
+            "ROW_NUMBER() OVER (ORDER BY rand * fzzRegularScore DESC)",
+        ),
+    ]
 
     def __init__(
         self,
@@ -71,140 +215,105 @@ class PlaylistGenerator:
         genres=["all"],
         track_ignore_pattern=None,
         min_rate=2,
+        sampling_engine="sql",
+        library=None,
     ):
+        if sampling_engine not in SAMPLING_ENGINES:
+            raise ValueError("Unknown sampling engine '%s'" % sampling_engine)
         self._db = db
+        self._sampling_engine = sampling_engine
+        # The in-memory library used by the "numpy" engine (can be shared
+        # between generators)
+        self._library = library
         self._length = length
         self._min_duration = min_duration
         self._max_duration = max_duration
         self._track_ignore_pattern = track_ignore_pattern
         self._min_rate = min_rate
         self._genres = genres
-        self._genres_expanded = set()
-        self._tracks_interest = {}
-        self._tracks_freshness = {}
-        self._tracks_backcatalog = {}
-        self._tracks_regular = {}
+        # IDs of the genres (and subgenres) to select (None: all the genres)
+        self._genre_ids = None
+        self._tracks_interest = TrackPool()
+        self._tracks_freshness = TrackPool()
+        self._tracks_backcatalog = TrackPool()
+        self._tracks_regular = TrackPool()
         self._playlist = []
         self._expand_genres()
 
     def print(self):
-        ROLES = {
-            # fmt: off
-            TrackRole.REGULAR:     {"symbol": "🎝", "color": "\x1B[37;44m"},
-            TrackRole.INTEREST:    {"symbol": "✚", "color": "\x1B[37;43m"},
-            TrackRole.FRESHNESS:   {"symbol": "❊", "color": "\x1B[37;42m"},
-            TrackRole.BACKCATALOG: {"symbol": "⮜", "color": "\x1B[37;45m"},
-            # fmt: on
-        }
-        total_duration = 0
-        print(
-            "%s %s %-5s %s %s %6s %6s %-20s %-35s \x1b[0m"
-            % (
-                "\x1b[1;7m",
-                "R",
-                "Rate",
-                "S",
-                "Regul.",
-                "Inter.",
-                "Fresh.",
-                "Artist Name (Album)",
-                "Track Name",
-            )
-        )
-        for track in self._playlist:
-            total_duration += track["duration"]
-            print(
-                "%s %s %5s %s %01.4f %01.4f %01.4f %-20s %-35s \x1b[0m"
-                % (
-                    ROLES[track["role"]]["color"],
-                    ROLES[track["role"]]["symbol"],
-                    ("★" * track["rating"]) + (" " * (5 - track["rating"])),
-                    "♥" if track["starred"] else "♡",
-                    track["fzzRegularScore"],
-                    track["fzzInterestScore"],
-                    track["fzzFreshnessScore"],
-                    track["albumArtistName"][:20],
-                    track["trackName"][:35],
-                )
-            )
-        print(
-            "\x1b[1;7m Total duration:\x1b[0;7m %i hr %i min %s sec \x1b[0m"
-            % (
-                total_duration // 3600,
-                total_duration % 3600 // 60,
-                total_duration % 60,
-            )
-        )
+        print_playlist(self._playlist)
 
     def generate(self):
-        self._tracks_interest = {}
-        self._tracks_freshness = {}
-        self._tracks_regular = {}
-        self._playlist = []
+        self._reset()
+        self._fetch_musics()
+        self._draw_tracks()
 
+    def _reset(self):
+        self._tracks_interest = TrackPool()
+        self._tracks_freshness = TrackPool()
+        self._tracks_regular = TrackPool()
+        self._tracks_backcatalog = TrackPool()
+        self._playlist = []
         self._generate_skeleton()
-        self._fetch_musics()
+
+    def _get_pools(self):
+        return {
+            TrackRole.REGULAR: self._tracks_regular,
+            TrackRole.INTEREST: self._tracks_interest,
+            TrackRole.FRESHNESS: self._tracks_freshness,
+            TrackRole.BACKCATALOG: self._tracks_backcatalog,
+        }
+
+    def _fill_pools(self, candidates):
+        # A track can be in several pools, with a different role in each one
+        for role, pool in self._get_pools().items():
+            for track in candidates[role]:
+                pool.add(dict(track, role=role))
+
+    def _draw_tracks(self):
+        pools = self._get_pools()
+        # IDs of the tracks already in the playlist. They are removed from the
+        # other pools only when they are drawn from them.
+        taken_ids = set()
 
         prev_artist_id = None
         for i in range(self._length):
-            retry_count = 3
-            track = None
+            role = self._playlist[i]["role"]
 
             # Stop if the regular music list goes empty
-            if not self._tracks_regular:
+            if self._draw_track(self._tracks_regular, taken_ids) is None:
                 self._playlist = self._playlist[:i]
                 break
 
             # Change the track role if the corresponding list is empty
-            if (
-                (
-                    self._playlist[i]["role"] == TrackRole.INTEREST
-                    and not self._tracks_interest
-                )
-                or (
-                    self._playlist[i]["role"] == TrackRole.FRESHNESS
-                    and not self._tracks_freshness
-                )
-                or (
-                    self._playlist[i]["role"] == TrackRole.BACKCATALOG
-                    and not self._tracks_backcatalog
-                )
-            ):
-                self._playlist[i]["role"] = TrackRole.REGULAR
-
-            # Pick a track
-            while retry_count:
-                if self._playlist[i]["role"] == TrackRole.REGULAR:
-                    track_id = random.choice(list(self._tracks_regular.keys()))
-                    track = self._tracks_regular[track_id]
-                elif self._playlist[i]["role"] == TrackRole.INTEREST:
-                    track_id = random.choice(list(self._tracks_interest.keys()))
-                    track = self._tracks_interest[track_id]
-                elif self._playlist[i]["role"] == TrackRole.FRESHNESS:
-                    track_id = random.choice(list(self._tracks_freshness.keys()))
-                    track = self._tracks_freshness[track_id]
-                elif self._playlist[i]["role"] == TrackRole.BACKCATALOG:
-                    track_id = random.choice(list(self._tracks_backcatalog.keys()))
-                    track = self._tracks_backcatalog[track_id]
-
-                if track["artistId"] == prev_artist_id:
-                    retry_count -= 1
-                    continue
-                else:
-                    break
+            track = self._draw_track(pools[role], taken_ids)
+            if track is None:
+                role = TrackRole.REGULAR
+                track = self._draw_track(pools[role], taken_ids)
+
+            # Pick another track (up to 3 tries) if the artist is the same as
+            # the previous track one
+            retry_count = 2
+            while retry_count and track["artistId"] == prev_artist_id:
+                retry_count -= 1
+                track = self._draw_track(pools[role], taken_ids)
 
             self._playlist[i] = track
             prev_artist_id = track["artistId"]
 
-            # Removed picked tracks from lists
-            if track["trackId"] in self._tracks_regular:
-                del self._tracks_regular[track["trackId"]]
-            if track["trackId"] in self._tracks_interest:
-                del self._tracks_interest[track["trackId"]]
-            if track["trackId"] in self._tracks_freshness:
-                del self._tracks_freshness[track["trackId"]]
-            if track["trackId"] in self._tracks_backcatalog:
-                del self._tracks_backcatalog[track["trackId"]]
+            # Removed picked track from its list
+            pools[role].remove(track["trackId"])
+            taken_ids.add(track["trackId"])
+
+    def _draw_track(self, pool, taken_ids):
+        # Tracks already in the playlist are discarded from the pool when they
+        # are drawn, so each track is discarded only once
+        while len(pool):
+            track = pool.choice()
+            if track["trackId"] not in taken_ids:
+                return track
+            pool.remove(track["trackId"])
+        return None
 
     def get_playlist(self):
         return list(self._playlist)
@@ -213,17 +322,20 @@ class PlaylistGenerator:
         return [track["trackId"] for track in self._playlist]
 
     def _expand_genres(self):
+        genre_graph = None
         for genre in self._genres:
             if genre == "all" or not genre:
                 continue
-            self._genres_expanded.update(
-                self._db.get_genre_subgenres(
-                    genre_name=genre,
-                    with_aliases=True,
-                    recursive=True,
-                    include_input_genre_name=True,
-                )
-            )
+            if genre_graph is None:
+                genre_graph = self._db.get_genre_graph()
+                self._genre_ids = set()
+            genre_ids = genre_graph.expand_genre_ids(genre)
+            # Genres that are not in the genre graph (e.g. custom tags)
+            if not genre_ids:
+                custom_genre_id = self._db.get_custom_genre_id(genre)
+                if custom_genre_id is not None:
+                    genre_ids = {custom_genre_id}
+            self._genre_ids.update(genre_ids)
 
     def _generate_sql_query(
         self,
@@ -237,11 +349,6 @@ class PlaylistGenerator:
 
         sql += "\n"
         sql += self._SQL_FROM_JOINTS.rstrip()
-        sql = sql % (
-            self._SQL_INTEREST_SCORE,
-            self._SQL_FRESHNESS_SCORE,
-            self._SQL_REGULAR_SCORE,
-        )
 
         if where:
             sql += "\n\n"
@@ -260,84 +367,141 @@ class PlaylistGenerator:
 
         return sql
 
-    def _execute_sql_query(self, query, params={}):
-        logging.debug("Executing query: \n%s" % query)
-        logging.debug("... with params: \n%s" % str(params))
-        response = self._db.execute_query(query, params)
-        for row in response.fetchall():
-            yield {f[0]: v for f, v in zip(self._SQL_SELECT_FIELDS, row)}
+    def _generate_pools_sql_query(self, where=[], windows=None, all_rows=False):
+        """Generates a query that returns the candidate tracks of all the
+        pools in a single pass: the filtered tracks are ranked for each role
+        with a window function, and the rows ranked within the limit of at
+        least one pool are returned (with their ranks after the
+        :attr:`_SQL_SELECT_FIELDS` fields).
+
+        :param list where: The filters.
+        :param list windows: The ranking of the pools (default:
+            :attr:`_SQL_POOLS_WINDOWS`).
+        :param bool all_rows: Return all the filtered tracks (e.g. to sample
+            them in Python), not only the ranked ones.
+        """
+        if windows is None:
+            windows = self._SQL_POOLS_WINDOWS
+        # Materialize the candidates so RANDOM() is evaluated once per track
+        # (with older SQLite versions, the windows may draw other random
+        # values than the returned ones, the pools are still random)
+        materialized = "MATERIALIZED " if sqlite3.sqlite_version_info >= (3, 35) else ""
+        sql = "    WITH candidates AS %s(\n" % materialized
+        sql += self._generate_sql_query(where=where).rstrip(";")
+        sql += "\n    ),\n"
+        sql += "    ranked AS (\n"
+        sql += "    SELECT *,\n           "
+        sql += ",\n           ".join(
+            "%s AS %sRank" % (window, role.value) for role, window in windows
+        )
+        sql += "\n    FROM candidates\n    )\n"
+        sql += "    SELECT *\n    FROM ranked\n"
+        if not all_rows:
+            sql += "    WHERE "
+            sql += "\n       OR ".join(
+                "%sRank <= :%s_limit" % (role.value, role.value) for role, _ in windows
+            )
+        sql += ";"
+        return sql
+
+    def _get_pools_limits(self):
+        return {
+            TrackRole.INTEREST: self._length // 2,
+            TrackRole.FRESHNESS: self._length // 2,
+            TrackRole.BACKCATALOG: self._length // 4,
+            TrackRole.REGULAR: self._length * 2,
+        }
+
+    def _fetch_musics_columnar(self):
+        if self._library is None:
+            self._library = ColumnarLibrary(self._db)
+        candidates = self._library.select_pools(
+            self._get_pools_limits(),
+            min_rate=self._min_rate,
+            min_duration=self._min_duration,
+            max_duration=self._max_duration,
+            genre_ids=self._genre_ids,
+            ignore_bit=self._db.get_track_ignore_mask(self._track_ignore_pattern),
+        )
+        self._fill_pools(candidates)
+
+    def _fetch_musics(self, refresh_scores=True):
+        if self._sampling_engine == "numpy":
+            self._fetch_musics_columnar()
+            return
 
-    def _fetch_musics(self):
         params = {
             "min_rate": self._min_rate,
             "min_duration": self._min_duration,
             "max_duration": self._max_duration,
-            "track_ignore_pattern": self._track_ignore_pattern,
+            "track_ignore_mask": self._db.get_track_ignore_mask(
+                self._track_ignore_pattern
+            ),
         }
 
-        additional_where_clauses = []
-
-        # Handle genres
-        # XXX Not very pretty to build SQL statement this way, but there is no
-        # XXX good choice to parametrize a tuple/list/set...
-        if len(self._genres_expanded) == 1:
-            additional_where_clauses.append(
-                "tracks.genreName = '%s'"
-                % self._genres_expanded.copy().pop().replace("'", "''")
-            )
-        elif len(self._genres_expanded) > 1:
-            additional_where_clauses.append(
-                "tracks.genreName IN (%s)"
-                % ", ".join(
-                    ["'%s'" % i.replace("'", "''") for i in self._genres_expanded]
-                )
-            )
+        # Scores are stored in the database (computed once a day, and for the
+        # tracks whose stats changed)
+        if refresh_scores:
+            self._db.refresh_track_scores()
 
-        # Interest
-        query = self._generate_sql_query(
-            where=self._SQL_WHERE_CLAUSES + additional_where_clauses,
-            order_by=["fzzInterestScore DESC", "rand DESC"],
-            limit=self._length // 2,
-        )
-        tracks = self._execute_sql_query(query, params)
-        for track in tracks:
-            track["role"] = TrackRole.INTEREST
-            self._tracks_interest[track["trackId"]] = track
+        additional_where_clauses = []
 
-        # Freshness
-        query = self._generate_sql_query(
+        # Handle genres (the IDs of the genres are joined from a temporary
+        # table, so the query does not depend on the genres)
+        if self._genre_ids is not None:
+            self._db.set_genre_filter(self._genre_ids)
+            additional_where_clauses.append(self._SQL_GENRE_FILTER_WHERE_CLAUSE)
+
+        # With the "reservoir" engine, the regular pool is sampled while
+        # streaming all the filtered tracks instead of being sorted by SQLite
+        windows = self._SQL_POOLS_WINDOWS
+        reservoir = None
+        if self._sampling_engine == "reservoir":
+            windows = [w for w in windows if w[0] != TrackRole.REGULAR]
+            reservoir = WeightedReservoir(self._get_pools_limits()[TrackRole.REGULAR])
+
+        query = self._generate_pools_sql_query(
             where=self._SQL_WHERE_CLAUSES + additional_where_clauses,
-            order_by=["fzzFreshnessScore DESC", "rand DESC"],
-            limit=self._length // 2,
+            windows=windows,
+            all_rows=reservoir is not None,
         )
-        tracks = self._execute_sql_query(query, params)
-        for track in tracks:
-            track["role"] = TrackRole.FRESHNESS
-            self._tracks_freshness[track["trackId"]] = track
-
-        # Back Catalog
-        query = self._generate_sql_query(
-            where=self._SQL_WHERE_CLAUSES
-            + ["tracks.lastPlayed NOT NULL"]
-            + additional_where_clauses,
-            order_by=["tracks.lastPlayed", "rand DESC"],
-            limit=self._length // 4,
+        limits = self._get_pools_limits()
+        params.update(
+            {"%s_limit" % role.value: limit for role, limit in limits.items()}
         )
-        tracks = self._execute_sql_query(query, params)
-        for track in tracks:
-            track["role"] = TrackRole.BACKCATALOG
-            self._tracks_backcatalog[track["trackId"]] = track
-
-        # Regular
-        query = self._generate_sql_query(
-            where=self._SQL_WHERE_CLAUSES + additional_where_clauses,
-            order_by=["rand * fzzRegularScore DESC"],
-            limit=self._length * 2,
+        candidates = {role: [] for role in TrackRole}
+        roles = [role for role, _ in windows]
+        fields_count = len(self._SQL_SELECT_FIELDS)
+        logging.debug("Executing query: \n%s" % query)
+        logging.debug("... with params: \n%s" % str(params))
+        for row in self._db.execute_query(query, params):
+            track = {f[0]: v for f, v in zip(self._SQL_SELECT_FIELDS, row)}
+            ranks = dict(zip(roles, row[fields_count:]))
+            self._add_candidate(candidates, limits, track, ranks, reservoir)
+        self._fill_candidates(candidates, reservoir)
+
+    def _add_candidate(self, candidates, limits, track, ranks, reservoir=None):
+        # Keeps a track in the pools where it is ranked within the limit (the
+        # regular pool is drawn by the reservoir, if any)
+        for role, rank in ranks.items():
+            if role == TrackRole.REGULAR and reservoir is not None:
+                continue
+            if rank is not None and rank <= limits[role]:
+                candidates[role].append((rank, track))
+        if reservoir is not None:
+            reservoir.add(track, track["fzzRegularScore"])
+
+    def _fill_candidates(self, candidates, reservoir=None):
+        if reservoir is not None:
+            candidates[TrackRole.REGULAR] = list(
+                enumerate(reservoir.get_items(), start=1)
+            )
+        self._fill_pools(
+            {
+                role: [track for _, track in sorted(tracks, key=lambda item: item[0])]
+                for role, tracks in candidates.items()
+            }
         )
-        tracks = self._execute_sql_query(query, params)
-        for track in tracks:
-            track["role"] = TrackRole.REGULAR
-            self._tracks_regular[track["trackId"]] = track
 
     def _generate_skeleton(self):
         self._playlist = []
@@ -375,3 +539,211 @@ class PlaylistGenerator:
                     "role": role,
                 }
             )
+
+
+class PlaylistBatchGenerator:
+    """Generates several playlists, sharing the work that does not depend on
+    the playlist.
+
+    The scores of the tracks are refreshed once, and the candidate pools of
+    all the playlists using the ``"sql"`` and ``"reservoir"`` engines are
+    selected by a single query: the scored tracks are read once, then each
+    playlist's rating, duration, genre and ignore pattern filters are applied
+    to them and the pools are ranked per playlist (``PARTITION BY``) with the
+    same windows as :class:`PlaylistGenerator`. The regular pool of the
+    ``"reservoir"`` playlists is drawn by their own
+    :class:`~flozz_daily_mix.sampling.WeightedReservoir`. Playlists using the
+    ``"numpy"`` engine select their pools from their (shared)
+    :class:`~flozz_daily_mix.columnar.ColumnarLibrary`.
+
+    The ignore masks of the playlists of a query must be stored at the same
+    time: one query is run per group of
+    :attr:`~flozz_daily_mix.db.Database.MAX_TRACK_IGNORE_PATTERNS` patterns.
+
+    :param flozz_daily_mix.db.Database db: The database.
+    :param list generators: The :class:`PlaylistGenerator` of each playlist.
+    """
+
+    def __init__(self, db, generators):
+        self._db = db
+        self._generators = list(generators)
+
+    def generate(self):
+        """Generates all the playlists."""
+        for generator in self._generators:
+            generator._reset()
+
+        sql_generators = [
+            generator
+            for generator in self._generators
+            if generator._sampling_engine != "numpy"
+        ]
+        if sql_generators:
+            self._db.refresh_track_scores()
+            for generators in self._group_by_ignore_patterns(sql_generators):
+                self._fetch_musics(generators)
+
+        numpy_generators = [
+            generator
+            for generator in self._generators
+            if generator._sampling_engine == "numpy"
+        ]
+        self._db.compute_track_ignore_masks(
+            [generator._track_ignore_pattern for generator in numpy_generators]
+        )
+        for generator in numpy_generators:
+            generator._fetch_musics_columnar()
+
+        for generator in self._generators:
+            generator._draw_tracks()
+
+    def _group_by_ignore_patterns(self, generators):
+        groups = [[]]
+        patterns = set()
+        for generator in generators:
+            pattern = generator._track_ignore_pattern
+            if (
+                pattern
+                and pattern not in patterns
+                and len(patterns) == self._db.MAX_TRACK_IGNORE_PATTERNS
+            ):
+                groups.append([])
+                patterns = set()
+            if pattern:
+                patterns.add(pattern)
+            groups[-1].append(generator)
+        return groups
+
+    @staticmethod
+    def _partition_window(window):
+        # Ranks the tracks of each playlist separately
+        if "PARTITION BY " in window:
+            return window.replace("PARTITION BY ", "PARTITION BY playlistId, ")
+        return window.replace("OVER (", "OVER (PARTITION BY playlistId ")
+
+    def _generate_sql_query(self):
+        fields = PlaylistGenerator._SQL_SELECT_FIELDS
+        columns = [alias for alias, _ in fields if alias != "rand"]
+        playlist_filters = """
+      AND candidates.rating >= batch_playlists.minRate
+      AND candidates.duration >= batch_playlists.minDuration
+      AND candidates.duration <= batch_playlists.maxDuration
+      AND candidates.ignoreMask & batch_playlists.ignoreMask = 0"""
+        playlist_columns = ",\n           ".join(
+            ["batch_playlists.playlistId"]
+            + ["candidates.%s" % column for column in columns]
+            + ["ABS(RANDOM()) AS rand"]
+        )
+        materialized = "MATERIALIZED " if sqlite3.sqlite_version_info >= (3, 35) else ""
+
+        # The scored tracks matching the filters of at least one playlist
+        sql = "    WITH candidates AS %s(\n" % materialized
+        sql += "    SELECT "
+        sql += ",\n           ".join(
+            field if " AS " in field else "%s AS %s" % (field, alias)
+            for alias, field in fields
+            if alias != "rand"
+        )
+        sql += ",\n           IFNULL(track_ignore_masks.mask, 0) AS ignoreMask"
+        sql += PlaylistGenerator._SQL_FROM_JOINTS.rstrip()
+        sql += "\n    LEFT JOIN temp.track_ignore_masks"
+        sql += " ON track_ignore_masks.trackId = tracks.id"
+        sql += "\n    WHERE tracks.rating >= :min_rate"
+        sql += "\n      AND tracks.duration >= :min_duration"
+        sql += "\n      AND tracks.duration <= :max_duration"
+        sql += "\n    ),\n"
+        # The tracks of each playlist (with their own random value)
+        sql += "    playlist_candidates AS %s(\n" % materialized
+        sql += "    SELECT %s\n" % playlist_columns
+        sql += "    FROM temp.batch_playlists\n"
+        sql += "    CROSS JOIN candidates\n"
+        sql += "    WHERE NOT batch_playlists.genreFiltered"
+        sql += playlist_filters
+        sql += "\n    UNION ALL\n"
+        sql += "    SELECT %s\n" % playlist_columns
+        sql += "    FROM temp.batch_genre_filter\n"
+        sql += "    JOIN track_genres"
+        sql += " ON track_genres.genreId = batch_genre_filter.genreId\n"
+        sql += "    JOIN temp.batch_playlists"
+        sql += " ON batch_playlists.playlistId = batch_genre_filter.playlistId\n"
+        sql += "    JOIN candidates ON candidates.trackId = track_genres.trackId\n"
+        sql += "    WHERE batch_playlists.genreFiltered"
+        sql += playlist_filters
+        sql += "\n    GROUP BY batch_playlists.playlistId, candidates.trackId"
+        sql += "\n    ),\n"
+        sql += "    ranked AS (\n"
+        sql += "    SELECT *,\n           "
+        sql += ",\n           ".join(
+            "%s AS %sRank" % (self._partition_window(window), role.value)
+            for role, window in PlaylistGenerator._SQL_POOLS_WINDOWS
+        )
+        sql += "\n    FROM playlist_candidates\n    )\n"
+        sql += "    SELECT ranked.*\n    FROM ranked\n"
+        sql += "    JOIN temp.batch_playlists USING (playlistId)\n"
+        sql += "    WHERE batch_playlists.allRows\n       OR "
+        sql += "\n       OR ".join(
+            "%sRank <= batch_playlists.%sLimit" % (role.value, role.value)
+            for role, _ in PlaylistGenerator._SQL_POOLS_WINDOWS
+        )
+        sql += ";"
+        return sql
+
+    def _fetch_musics(self, generators):
+        self._db.compute_track_ignore_masks(
+            [generator._track_ignore_pattern for generator in generators]
+        )
+        playlists = []
+        genre_filters = []
+        limits = []
+        reservoirs = []
+        for playlist_id, generator in enumerate(generators):
+            limits.append(generator._get_pools_limits())
+            reservoirs.append(
+                WeightedReservoir(limits[-1][TrackRole.REGULAR])
+                if generator._sampling_engine == "reservoir"
+                else None
+            )
+            playlists.append(
+                (
+                    playlist_id,
+                    generator._min_rate,
+                    generator._min_duration,
+                    generator._max_duration,
+                    self._db.get_track_ignore_mask(generator._track_ignore_pattern),
+                    generator._genre_ids is not None,
+                    reservoirs[-1] is not None,
+                    limits[-1][TrackRole.INTEREST],
+                    limits[-1][TrackRole.FRESHNESS],
+                    limits[-1][TrackRole.BACKCATALOG],
+                    limits[-1][TrackRole.REGULAR],
+                )
+            )
+            if generator._genre_ids is not None:
+                genre_filters.extend(
+                    (playlist_id, genre_id) for genre_id in generator._genre_ids
+                )
+        self._db.set_batch_playlists(playlists, genre_filters)
+
+        query = self._generate_sql_query()
+        params = {
+            "min_rate": min(generator._min_rate for generator in generators),
+            "min_duration": min(generator._min_duration for generator in generators),
+            "max_duration": max(generator._max_duration for generator in generators),
+        }
+        candidates = [{role: [] for role in TrackRole} for _ in generators]
+        aliases = [alias for alias, _ in PlaylistGenerator._SQL_SELECT_FIELDS]
+        roles = [role for role, _ in PlaylistGenerator._SQL_POOLS_WINDOWS]
+        fields_end = 1 + len(aliases)
+        logging.debug("Executing query: \n%s" % query)
+        logging.debug("... with params: \n%s" % str(params))
+        for row in self._db.execute_query(query, params):
+            playlist_id = row[0]
+            generators[playlist_id]._add_candidate(
+                candidates[playlist_id],
+                limits[playlist_id],
+                dict(zip(aliases, row[1:fields_end])),
+                dict(zip(roles, row[fields_end:])),
+                reservoirs[playlist_id],
+            )
+        for generator, tracks, reservoir in zip(generators, candidates, reservoirs):
+            generator._fill_candidates(tracks, reservoir)
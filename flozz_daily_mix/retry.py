@@ -0,0 +1,80 @@
+import random
+import asyncio
+import http.client
+import urllib.error
+
+# HTTP statuses worth retrying: the server is overloaded or temporarily
+# unavailable
+RETRYABLE_HTTP_STATUSES = (429, 500, 502, 503, 504)
+
+_TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+    asyncio.IncompleteReadError,
+    http.client.HTTPException,
+)
+
+
+def is_transient_error(error):
+    """Checks if an error raised by a request is likely to be temporary (the
+    request may succeed if it is sent again).
+
+    :param Exception error: The error raised by the request.
+
+    :rtype: bool
+
+    >>> is_transient_error(ConnectionResetError())
+    True
+    >>> is_transient_error(ValueError())
+    False
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in RETRYABLE_HTTP_STATUSES
+    return isinstance(error, _TRANSIENT_ERRORS)
+
+
+class RetryPolicy:
+    """Decides when a failed request should be sent again, and how long to
+    wait before retrying (exponential backoff with "full jitter").
+
+    :param int max_retries: Maximum number of retries of a request (default:
+        ``3``).
+    :param float backoff_base: Maximum delay (in seconds) before the first
+        retry; it doubles on each retry (default: ``0.5``).
+    :param float backoff_max: Upper bound of the delay (in seconds) between
+        two attempts (default: ``30``).
+    """
+
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_max=30):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def should_retry(self, error, attempt):
+        """Checks if a request should be retried.
+
+        :param Exception error: The error raised by the request.
+        :param int attempt: The number of the attempt that failed (starting
+            at ``0``).
+
+        :rtype: bool
+        """
+        return attempt < self.max_retries and is_transient_error(error)
+
+    def get_delay(self, error, attempt):
+        """Returns the time to wait before retrying a request. The
+        ``Retry-After`` header sent by the server is honoured (up to
+        ``backoff_max``).
+
+        :param Exception error: The error raised by the request.
+        :param int attempt: The number of the attempt that failed (starting
+            at ``0``).
+
+        :rtype: float
+        """
+        if isinstance(error, urllib.error.HTTPError) and error.headers:
+            retry_after = error.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
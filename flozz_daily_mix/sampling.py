@@ -0,0 +1,103 @@
+import heapq
+import math
+import random
+
+
+class WeightedReservoir:
+    """Draws a weighted random sample of ``k`` items from a stream of items
+    of unknown length, in a single pass and using a memory proportional to
+    ``k`` (Efraimidis–Spirakis reservoir sampling with exponential jumps,
+    "A-ExpJ").
+
+    Each item is drawn with a probability proportional to its weight, without
+    replacement. Items with a weight lower than or equal to zero are never
+    drawn.
+
+    :param int k: The size of the sample.
+    :param random.Random rng: The random number generator (default: the
+        :mod:`random` module).
+
+    >>> reservoir = WeightedReservoir(2)
+    >>> for item, weight in [("a", 1.0), ("b", 0), ("c", 2.5)]:
+    ...     reservoir.add(item, weight)
+    >>> sorted(reservoir.get_items())
+    ['a', 'c']
+    """
+
+    def __init__(self, k, rng=random):
+        self.k = k
+        self._rng = rng
+        # Min-heap of (key, counter, item): the item with the lowest key is the
+        # next one to be replaced
+        self._heap = []
+        self._counter = 0
+        # Remaining weight to skip before the next item enters the reservoir
+        self._skip = None
+
+    def _random(self):
+        # Uniform in (0, 1]: 0 would break the logarithms
+        return 1.0 - self._rng.random()
+
+    def _update_skip(self):
+        threshold = self._heap[0][0]
+        if threshold <= 0:  # Underflow of the key of a low-weight item
+            self._skip = 0.0
+        elif threshold >= 1:
+            self._skip = math.inf
+        else:
+            self._skip = math.log(self._random()) / math.log(threshold)
+
+    def add(self, item, weight):
+        """Offers an item to the reservoir.
+
+        :param item: The item.
+        :param float weight: The weight of the item.
+        """
+        if not weight or weight <= 0 or self.k <= 0:
+            return
+        self._counter += 1
+        # Fill the reservoir
+        if len(self._heap) < self.k:
+            key = self._random() ** (1 / weight)
+            heapq.heappush(self._heap, (key, self._counter, item))
+            if len(self._heap) == self.k:
+                self._update_skip()
+            return
+        # Skip items until the accumulated weight exceeds the jump
+        self._skip -= weight
+        if self._skip > 0:
+            return
+        # The item replaces the one with the lowest key. Its key is drawn
+        # between the threshold and 1.
+        threshold = self._heap[0][0] ** weight
+        key = self._rng.uniform(threshold, 1.0) ** (1 / weight)
+        heapq.heapreplace(self._heap, (key, self._counter, item))
+        self._update_skip()
+
+    def get_items(self):
+        """Returns the items of the sample, by decreasing key (the items that
+        would be drawn with a smaller ``k`` first).
+
+        :rtype: list
+        """
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
+
+
+def weighted_sample(items, k, weight, rng=random):
+    """Draws a weighted random sample of ``k`` items (without replacement)
+    from an iterable, in a single pass (see :class:`WeightedReservoir`).
+
+    :param items: The items (any iterable, e.g. a database cursor).
+    :param int k: The size of the sample.
+    :param weight: A function returning the weight of an item.
+    :param random.Random rng: The random number generator.
+
+    :rtype: list
+
+    >>> sorted(weighted_sample(range(10), 3, weight=lambda i: 1 if i < 3 else 0))
+    [0, 1, 2]
+    """
+    reservoir = WeightedReservoir(k, rng=rng)
+    for item in items:
+        reservoir.add(item, weight(item))
+    return reservoir.get_items()
@@ -0,0 +1,73 @@
+# Scores of the tracks, used by the playlist generator to pick tracks.
+#
+# Scores depend on the statistics of the tracks (rating, play count,...) and on
+# a reference day (":now" parameter, e.g. "2024-06-01"). They are stored in the
+# "track_scores" table by Database.refresh_track_scores().
+
+FRESHNESS_SCORE = """(
+            (1+(LOG(366) - LOG(1+JULIANDAY(:now) - MAX(JULIANDAY(tracks.created), 365))) / LOG(365))  -- recently added score
+            + (1+LOG(6)-LOG(1+MIN(STRFTIME("%Y", DATE(:now))-tracks.year, 5)))  -- recently released score
+            + 1+LOG(11)-LOG(1+MIN(tracks.playCount,10))  -- low play count score
+           )"""
+
+INTEREST_SCORE = """(
+            (LOG(tracks.rating)*(1+1.2*tracks.starred))  -- rating score A
+            + 1+LOG(11)-LOG(1+MIN(tracks.playCount,10)) / 10  -- low play count score
+            + (LOG(1+MIN(JULIANDAY(:now) - JULIANDAY(IFNULL(tracks.lastPlayed, JULIANDAY('1970-01-01'))), 30))) / LOG(30) / 50  -- rotation score
+           )"""
+
+REGULAR_SCORE = """(
+            (1 + LOG(POWER(tracks.rating, 2)))  -- rating score B
+            + (LOG(1+MIN(JULIANDAY(:now) - JULIANDAY(IFNULL(tracks.lastPlayed, JULIANDAY('1970-01-01'))), 30))) / LOG(30) / 4  -- rotation score
+           )"""
+
+#: Statistics of the tracks the scores depend on. Scores of a track are only
+#: computed again if one of them changed (or if the reference day changed).
+SCORED_FIELDS = ("rating", "starred", "playCount", "lastPlayed", "created", "year")
+
+# Scores that are outdated: all of them if the reference day changed, and the
+# ones of removed tracks
+_SQL_OUTDATED_SCORES_WHERE = """
+WHERE day != :now
+   OR trackId NOT IN (SELECT id FROM tracks)
+"""
+
+# Tracks whose scores must be computed: new tracks and tracks whose statistics
+# changed
+_SQL_UNSCORED_TRACKS = """
+FROM tracks
+LEFT JOIN track_scores ON track_scores.trackId = tracks.id
+WHERE track_scores.trackId IS NULL
+   OR %s
+""" % "\n   OR ".join(
+    "track_scores.%s IS NOT tracks.%s" % (field, field) for field in SCORED_FIELDS
+)
+
+# Removes outdated scores
+SQL_DELETE_OUTDATED_SCORES = "DELETE FROM track_scores" + _SQL_OUTDATED_SCORES_WHERE
+
+# Computes the scores of new tracks and of tracks whose statistics changed
+SQL_REFRESH_SCORES = """
+INSERT OR REPLACE INTO track_scores
+SELECT tracks.id,
+       :now,
+       %(fields)s,
+       %(interest)s,
+       %(freshness)s,
+       %(regular)s
+%(unscored)s""" % {
+    "fields": ", ".join("tracks.%s" % field for field in SCORED_FIELDS),
+    "interest": INTEREST_SCORE,
+    "freshness": FRESHNESS_SCORE,
+    "regular": REGULAR_SCORE,
+    "unscored": _SQL_UNSCORED_TRACKS.lstrip("\n"),
+}
+
+# Whether refreshing the scores would change anything (without writing them)
+SQL_SCORES_OUTDATED = """
+SELECT EXISTS (SELECT 1 FROM track_scores%s)
+    OR EXISTS (SELECT 1%s)
+""" % (
+    _SQL_OUTDATED_SCORES_WHERE.rstrip(),
+    _SQL_UNSCORED_TRACKS.rstrip(),
+)
@@ -1,20 +1,146 @@
-import urllib.request
 import urllib.parse
 import json
+import time
+import asyncio
+import logging
 import pathlib
+import contextlib
+import xml.etree.ElementTree
 
 from .helpers import custom_urlencode
+from .retry import RetryPolicy, is_transient_error
+from .limiter import AIMDLimiter, AsyncAIMDLimiter
+from .http_pool import (
+    HTTPConnectionPool,
+    AsyncHTTPConnectionPool,
+    TransferStats,
+    iter_decoded_body,
+    iter_decoded_body_async,
+)
 
+# Requests that must not be sent twice: they are not retried on errors
+_NON_IDEMPOTENT_ENDPOINTS = ("createPlaylist", "updatePlaylist")
 
-class SubsonicClient:
+# Types of the attributes of XML responses (other attributes are strings)
+_XML_ATTRIBUTE_TYPES = {
+    "albumCount": int,
+    "averageRating": float,
+    "bitRate": int,
+    "discNumber": int,
+    "duration": int,
+    "isDir": lambda value: value == "true",
+    "isVideo": lambda value: value == "true",
+    "playCount": int,
+    "rating": int,
+    "size": int,
+    "songCount": int,
+    "track": int,
+    "userRating": int,
+    "year": int,
+}
+
+
+def _xml_local_name(tag):
+    """Removes the namespace of an XML tag.
+
+    >>> _xml_local_name("{http://subsonic.org/restapi}artist")
+    'artist'
+    >>> _xml_local_name("artist")
+    'artist'
+    """
+    return tag.rsplit("}", 1)[-1]
+
+
+def _xml_attributes(element):
+    return {
+        key: (
+            _XML_ATTRIBUTE_TYPES[key](value) if key in _XML_ATTRIBUTE_TYPES else value
+        )
+        for key, value in element.attrib.items()
+    }
+
+
+class _XMLElementReader:
+    """Parses an XML response incrementally, and returns the elements with
+    the given tags as soon as they are complete. Returned elements are then
+    dropped, so the memory used does not depend on the size of the response.
+
+    :param tuple tags: The (local) names of the elements to return.
+    """
+
+    def __init__(self, tags):
+        self._tags = tags
+        self._parser = xml.etree.ElementTree.XMLPullParser(events=("start", "end"))
+        self._parents = []
+        #: The attributes of the error element of the response, if any
+        self.error = None
+
+    def feed(self, data):
+        """Parses a chunk of the response.
+
+        :param bytes data: The chunk.
+
+        :rtype: list<(str, dict)>
+        :return: The tag and the attributes of the completed elements.
+        """
+        self._parser.feed(data)
+        return self._read_events()
+
+    def close(self):
+        """Parses the end of the response.
+
+        :rtype: list<(str, dict)>
+        """
+        self._parser.close()
+        return self._read_events()
+
+    def _read_events(self):
+        elements = []
+        for event, element in self._parser.read_events():
+            tag = _xml_local_name(element.tag)
+            if event == "start":
+                self._parents.append(element)
+                continue
+            self._parents.pop()
+            if tag == "error":
+                self.error = _xml_attributes(element)
+            elif tag in self._tags:
+                elements.append((tag, _xml_attributes(element)))
+                if self._parents:
+                    self._parents[-1].remove(element)
+        return elements
+
+    def raise_error(self):
+        """Raises the error returned by the API, if any."""
+        if self.error is None:
+            return
+        message = str(self.error.get("message", ""))
+        if "code" in self.error:
+            message += " (code: %s)" % str(self.error["code"])
+        raise Exception(message)  # XXX
+
+
+class _SubsonicClientBase:
+    """Builds Subsonic API requests and parses their responses (common part of
+    the sync and async clients)."""
 
     def __init__(
-        self, api_base_url, username, password, client_name="FLOZz Subsonic Client/0"
+        self,
+        api_base_url,
+        username,
+        password,
+        client_name,
+        cache=None,
+        retry_policy=None,
     ):
         self._api_base_url = api_base_url
         self._username = username
         self._password = password
         self._client_name = client_name
+        self._cache = cache
+        self._retry_policy = retry_policy or RetryPolicy()
+        #: Bytes received from the API, and once decompressed
+        self.transfer_stats = TransferStats()
 
     def _build_url(self, endpoint_name, **kwargs):
         parsed_base_url = urllib.parse.urlparse(self._api_base_url)
@@ -40,16 +166,58 @@ class SubsonicClient:
             )
         )
 
-    def _get_json(self, url):
-        request = urllib.request.Request(
+    def _get_headers(self):
+        return {
+            "User-Agent": self._client_name,
+            "Accept-Encoding": "gzip, deflate",
+        }
+
+    def _should_retry(self, url, error, attempt):
+        endpoint = urllib.parse.urlsplit(url).path.rsplit("/", 1)[-1]
+        if endpoint in _NON_IDEMPOTENT_ENDPOINTS:
+            return False
+        if not self._retry_policy.should_retry(error, attempt):
+            return False
+        logging.debug(
+            "Request to the '%s' endpoint failed (%s), retrying..."
+            % (endpoint, str(error) or type(error).__name__)
+        )
+        return True
+
+    def _get_cached_response(self, url):
+        """Returns the cached response of an URL, if the endpoint is cacheable.
+
+        :rtype: flozz_daily_mix.cache.CacheEntry or None
+        """
+        if self._cache is None or not self._cache.is_cacheable(url):
+            return None
+        return self._cache.get(url)
+
+    def _cache_response(self, url, body, headers):
+        if self._cache is None or not self._cache.is_cacheable(url):
+            return
+        self._cache.put(
             url,
-            headers={
-                "User-Agent": self._client_name,
-            },
+            body,
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
         )
-        http_response = urllib.request.urlopen(request)
-        # TODO handle errors
-        json_string = http_response.read()
+
+    def _parse_json_response(self, url, json_string):
+        """Parses a JSON response, removing it from the cache if it is an
+        error."""
+        try:
+            return self._parse_json(json_string)
+        except Exception:
+            if self._cache is not None:
+                self._cache.delete(url)
+            raise
+
+    def _invalidate_playlists_cache(self):
+        if self._cache is not None:
+            self._cache.invalidate("getPlaylists")
+
+    def _parse_json(self, json_string):
         parsed_json = json.loads(json_string)
         if "subsonic-response" not in parsed_json:
             raise Exception("Invalid response from the Subsonic API")  # XXX
@@ -65,10 +233,8 @@ class SubsonicClient:
             raise Exception(error)  # XXX
         return parsed_json["subsonic-response"]
 
-    def getArtists(self, **kwargs):
-        query = kwargs
-        url = self._build_url("getArtists", **query)
-        response = self._get_json(url)
+    @staticmethod
+    def _parse_artists(response):
         if "artists" in response and "index" in response["artists"]:
             artists = response["artists"]["index"]
         else:
@@ -78,27 +244,30 @@ class SubsonicClient:
                 index["name"] = "#"
             if "artist" not in index:
                 index["artist"] = []
-            for i in range(len(index["artist"])):
-                index["artist"][i] = {
-                    "id": None,
-                    "name": "Unknown artist",
-                    "sortName": None,
-                    "albumCount": 0,
-                    "rating": None,
-                    "starred": None,
-                } | index["artist"][i]
+            index["artist"] = [
+                _SubsonicClientBase._parse_artist(artist) for artist in index["artist"]
+            ]
         return artists
 
-    def getAlbumList(self, type_="alphabeticalByName", offset=0, size=100, **kwargs):
-        query = {"type": type_, "offset": offset, "size": size, **kwargs}
-        url = self._build_url("getAlbumList", **query)
-        response = self._get_json(url)
+    @staticmethod
+    def _parse_artist(artist):
+        return {
+            "id": None,
+            "name": "Unknown artist",
+            "sortName": None,
+            "albumCount": 0,
+            "rating": None,
+            "starred": None,
+        } | artist
+
+    @staticmethod
+    def _parse_album_list(response):
         if "albumList" in response and "album" in response["albumList"]:
             albums = response["albumList"]["album"]
         else:
             albums = []
-        for album in albums:
-            yield {
+        return [
+            {
                 "id": None,
                 "parent": None,
                 "artist": "Unknown artist",
@@ -110,15 +279,48 @@ class SubsonicClient:
                 "created": "1970-01-01T00:00:00.000Z",
                 "rating": None,
                 "starred": None,
+                "songCount": 0,
+                "duration": 0,
                 "isDir": True,
-            } | album
+            }
+            | album
+            for album in albums
+        ]
 
-    def getAlbum(self, id_=None, **kwargs):
-        if not id_:
-            raise ValueError()  # XXX
-        query = {"id": id_, **kwargs}
-        url = self._build_url("getAlbum", **query)
-        response = self._get_json(url)
+    @staticmethod
+    def _parse_song(song):
+        return {
+            "id": None,
+            "album": "Unknown album",
+            "albumId": None,
+            "artist": "Unknown artist",
+            "artistId": None,
+            "bitRate": 0,
+            "contentType": "audio/x-unknown",
+            "coverArt": None,
+            "created": "1970-01-01T00:00:00.000Z",
+            "discNumber": 1,
+            "duration": 0,
+            "genre": "(Unknown genre)",
+            "isVideo": False,
+            "parent": None,
+            "playCount": 0,
+            "played": "",
+            "track": 0,
+            "title": "Unknown song",
+            "sortName": None,
+            "path": None,
+            "suffix": "",
+            "type": "music",
+            "size": 0,
+            "year": 0,
+            "userRating": None,
+            "starred": None,
+            "isDir": False,
+        } | song
+
+    @staticmethod
+    def _parse_album(response):
         album = {
             "id": None,
             "artistId": None,
@@ -135,48 +337,31 @@ class SubsonicClient:
             "duration": 0,
             "song": [],
         } | (response["album"] if "album" in response else {})
-        for i in range(len(album["song"])):
-            album["song"][i] = {
-                "id": None,
-                "album": "Unknown album",
-                "albumId": None,
-                "artist": "Unknown artist",
-                "artistId": None,
-                "bitRate": 0,
-                "contentType": "audio/x-unknown",
-                "coverArt": None,
-                "created": "1970-01-01T00:00:00.000Z",
-                "discNumber": 1,
-                "duration": 0,
-                "genre": "(Unknown genre)",
-                "isVideo": False,
-                "parent": None,
-                "playCount": 0,
-                "played": "",
-                "track": 0,
-                "title": "Unknown song",
-                "sortName": None,
-                "path": None,
-                "suffix": "",
-                "type": "music",
-                "size": 0,
-                "year": 0,
-                "userRating": None,
-                "starred": None,
-                "isDir": False,
-            } | album["song"][i]
+        album["song"] = [
+            _SubsonicClientBase._parse_song(song) for song in album["song"]
+        ]
         return album
 
-    def getPlaylists(self, **kwargs):
-        query = kwargs
-        url = self._build_url("getPlaylists", **query)
-        response = self._get_json(url)
+    @staticmethod
+    def _parse_search_result(response):
+        result = {
+            "artist": [],
+            "album": [],
+            "song": [],
+        } | (response["searchResult3"] if "searchResult3" in response else {})
+        result["song"] = [
+            _SubsonicClientBase._parse_song(song) for song in result["song"]
+        ]
+        return result
+
+    @staticmethod
+    def _parse_playlists(response):
         if "playlists" in response and "playlist" in response["playlists"]:
             playlists = response["playlists"]["playlist"]
         else:
             playlists = []
-        for playlist in playlists:
-            yield {
+        return [
+            {
                 "id": None,
                 "changed": "1970-01-01T00:00:00.000Z",
                 "comment": "",
@@ -187,14 +372,13 @@ class SubsonicClient:
                 "owner": None,
                 "public": False,
                 "songCount": 0,
-            } | playlist
+            }
+            | playlist
+            for playlist in playlists
+        ]
 
-    def createPlaylist(self, name=None, songId=[], **kwargs):
-        if not name:
-            raise ValueError()  # XXX
-        query = {"name": name, "songId": songId, **kwargs}
-        url = self._build_url("createPlaylist", **query)
-        response = self._get_json(url)
+    @staticmethod
+    def _parse_playlist(response):
         playlist = response["playlist"] if "playlist" in response else {}
         return {
             "id": None,
@@ -209,12 +393,297 @@ class SubsonicClient:
             "entry": [],  # TODO enforce track fileds if we ever use them
         } | playlist
 
+    @staticmethod
+    def _update_playlist_query(
+        playlistId, name, comment, public, songIdToAdd, songIndexToRemove, kwargs
+    ):
+        if not playlistId:
+            raise ValueError()  # XXX
+        query = {
+            "playlistId": playlistId,
+            "songIdToAdd": songIdToAdd,
+            "songIndexToRemove": songIndexToRemove,
+            **kwargs,
+        }
+        if name is not None:
+            query["name"] = name
+        if comment is not None:
+            query["comment"] = comment
+        if public is not None:
+            query["public"] = public
+        return query
+
+
+class SubsonicClient(_SubsonicClientBase):
+    """Client for the Subsonic API.
+
+    The client keeps persistent connections to the server and can be shared
+    between threads.
+
+    :param str api_base_url: The URL of the Subsonic API.
+    :param str username: The name of the user.
+    :param str password: The password of the user.
+    :param str client_name: The name of the client, sent to the API.
+    :param int pool_size: Maximum number of connections kept open to the
+        server (default: ``4``).
+    :param float pool_idle_timeout: Time (in seconds) after which an idle
+        connection is closed instead of being reused (default: ``60``).
+    :param flozz_daily_mix.cache.ResponseCache cache: Cache for the responses
+        of the read endpoints (optional).
+    :param float timeout: Timeout (in seconds) of the connection and of each
+        read on the socket (default: ``30``).
+    :param flozz_daily_mix.retry.RetryPolicy retry_policy: When and how
+        requests failing with a transient error are retried (default:
+        ``RetryPolicy()``).
+
+    The number of parallel requests is adapted to the server capacity (up to
+    ``pool_size``), using an :class:`~flozz_daily_mix.limiter.AIMDLimiter`.
+    """
+
+    def __init__(
+        self,
+        api_base_url,
+        username,
+        password,
+        client_name="FLOZz Subsonic Client/0",
+        pool_size=4,
+        pool_idle_timeout=60,
+        cache=None,
+        timeout=30,
+        retry_policy=None,
+    ):
+        super().__init__(
+            api_base_url,
+            username,
+            password,
+            client_name,
+            cache=cache,
+            retry_policy=retry_policy,
+        )
+        self._pool = HTTPConnectionPool(
+            pool_size=pool_size, idle_timeout=pool_idle_timeout, timeout=timeout
+        )
+        self._limiter = AIMDLimiter(pool_size)
+        self._supports_song_listing = None
+
+    @contextlib.contextmanager
+    def _limited_request(self, url, headers):
+        """Sends a GET request once the concurrency limiter allows it.
+
+        :rtype: flozz_daily_mix.http_pool.PooledResponse
+        """
+        token = self._limiter.acquire()
+        start = time.monotonic()
+        latency = None
+        error = False
+        try:
+            with self._pool.request("GET", url, headers=headers) as http_response:
+                latency = time.monotonic() - start
+                yield http_response
+        except Exception as request_error:
+            error = is_transient_error(request_error)
+            raise
+        finally:
+            self._limiter.release(token, latency=latency, error=error)
+
+    def _iter_body(self, url, stream=True):
+        """Yields the (decoded) body of the response, reading it from the
+        cache when possible.
+
+        Requests failing with a transient error are retried, as long as no
+        data has been yielded.
+
+        :param str url: The URL to request.
+        :param bool stream: If ``True``, the body is yielded in chunks as it
+            is received, else it is yielded at once, which allows to retry the
+            request if the connection breaks while reading the body.
+
+        :rtype: generator<bytes>
+        """
+        cached = self._get_cached_response(url)
+        if cached is not None and cached.fresh:
+            yield cached.body
+            return
+
+        headers = self._get_headers()
+        if cached is not None:
+            headers.update(cached.get_validation_headers())
+
+        attempt = 0
+        while True:
+            chunks = []
+            yielded = False
+            try:
+                with self._limited_request(url, headers) as http_response:
+                    if http_response.status == 304 and cached is not None:
+                        http_response.read()
+                        self._cache.touch(url)
+                        yielded = True
+                        yield cached.body
+                        return
+                    for chunk in iter_decoded_body(
+                        http_response, stats=self.transfer_stats
+                    ):
+                        # Streamed bodies are only kept to be cached
+                        if not stream or self._cache is not None:
+                            chunks.append(chunk)
+                        if stream:
+                            yielded = True
+                            yield chunk
+                    response_headers = http_response.headers
+                break
+            except Exception as error:
+                if yielded or not self._should_retry(url, error, attempt):
+                    raise
+                time.sleep(self._retry_policy.get_delay(error, attempt))
+                attempt += 1
+
+        # Only reached if the whole body was consumed
+        body = b"".join(chunks)
+        self._cache_response(url, body, response_headers)
+        if not stream:
+            yield body
+
+    def _get_json(self, url):
+        json_string = b"".join(self._iter_body(url, stream=False))
+        return self._parse_json_response(url, json_string)
+
+    def getArtists(self, **kwargs):
+        query = kwargs
+        url = self._build_url("getArtists", **query)
+        response = self._get_json(url)
+        return self._parse_artists(response)
+
+    def _iter_xml_elements(self, endpoint_name, tags, **kwargs):
+        """Requests the endpoint in XML format and parses the response
+        incrementally, yielding the elements with the given tags as soon as
+        they are received (see :class:`_XMLElementReader`).
+
+        :param str endpoint_name: The API endpoint.
+        :param tuple tags: The (local) names of the elements to yield.
+
+        :rtype: generator<(str, dict)>
+        :return: The tag and the attributes of the elements.
+        """
+        url = self._build_url(endpoint_name, **kwargs, f="xml")
+        reader = _XMLElementReader(tags)
+        body = self._iter_body(url)
+        try:
+            for chunk in body:
+                yield from reader.feed(chunk)
+                if reader.error is not None:
+                    break
+            else:
+                yield from reader.close()
+        finally:
+            body.close()
+        reader.raise_error()
+
+    def iterArtists(self, **kwargs):
+        """Streaming version of :meth:`getArtists`: yields artists one at a
+        time, without loading the whole response in memory.
+
+        :rtype: generator<dict>
+        """
+        for _, artist in self._iter_xml_elements("getArtists", ("artist",), **kwargs):
+            yield self._parse_artist(artist)
+
+    def getAlbumList(self, type_="alphabeticalByName", offset=0, size=100, **kwargs):
+        query = {"type": type_, "offset": offset, "size": size, **kwargs}
+        url = self._build_url("getAlbumList", **query)
+        response = self._get_json(url)
+        for album in self._parse_album_list(response):
+            yield album
+
+    def getAlbum(self, id_=None, **kwargs):
+        if not id_:
+            raise ValueError()  # XXX
+        query = {"id": id_, **kwargs}
+        url = self._build_url("getAlbum", **query)
+        response = self._get_json(url)
+        return self._parse_album(response)
+
+    def search3(
+        self,
+        query="",
+        artistCount=20,
+        artistOffset=0,
+        albumCount=20,
+        albumOffset=0,
+        songCount=20,
+        songOffset=0,
+        **kwargs,
+    ):
+        query = {
+            "query": query,
+            "artistCount": artistCount,
+            "artistOffset": artistOffset,
+            "albumCount": albumCount,
+            "albumOffset": albumOffset,
+            "songCount": songCount,
+            "songOffset": songOffset,
+            **kwargs,
+        }
+        url = self._build_url("search3", **query)
+        response = self._get_json(url)
+        return self._parse_search_result(response)
+
+    def iterSearch3Songs(self, query="", songCount=20, songOffset=0, **kwargs):
+        """Streaming version of :meth:`search3`, that only yields songs.
+
+        :rtype: generator<dict>
+        """
+        query = {
+            "query": query,
+            "artistCount": 0,
+            "albumCount": 0,
+            "songCount": songCount,
+            "songOffset": songOffset,
+            **kwargs,
+        }
+        for _, song in self._iter_xml_elements("search3", ("song",), **query):
+            yield self._parse_song(song)
+
+    def supports_song_listing(self):
+        """Checks (once) if the server returns all the songs when calling
+        ``search3`` with an empty query, which allows to list the songs of the
+        library without fetching each album.
+
+        :rtype: bool
+        """
+        if self._supports_song_listing is None:
+            try:
+                result = self.search3(
+                    query="", artistCount=0, albumCount=0, songCount=1
+                )
+                self._supports_song_listing = bool(result["song"])
+            except Exception:
+                self._supports_song_listing = False
+        return self._supports_song_listing
+
+    def getPlaylists(self, **kwargs):
+        query = kwargs
+        url = self._build_url("getPlaylists", **query)
+        response = self._get_json(url)
+        for playlist in self._parse_playlists(response):
+            yield playlist
+
+    def createPlaylist(self, name=None, songId=[], **kwargs):
+        if not name:
+            raise ValueError()  # XXX
+        query = {"name": name, "songId": songId, **kwargs}
+        url = self._build_url("createPlaylist", **query)
+        response = self._get_json(url)
+        self._invalidate_playlists_cache()
+        return self._parse_playlist(response)
+
     def deletePlaylist(self, id_=None, **kwargs):
         if not id_:
             raise ValueError()  # XXX
         query = {"id": id_, **kwargs}
         url = self._build_url("deletePlaylist", **query)
         self._get_json(url)
+        self._invalidate_playlists_cache()
 
     def updatePlaylist(
         self,
@@ -226,19 +695,310 @@ class SubsonicClient:
         songIndexToRemove=[],
         **kwargs,
     ):
-        if not playlistId:
+        query = self._update_playlist_query(
+            playlistId, name, comment, public, songIdToAdd, songIndexToRemove, kwargs
+        )
+        url = self._build_url("updatePlaylist", **query)
+        self._get_json(url)
+        self._invalidate_playlists_cache()
+
+    def close(self):
+        """Closes the connections kept open to the server."""
+        self._pool.close()
+
+
+class AsyncSubsonicClient(_SubsonicClientBase):
+    """Asyncio client for the Subsonic API.
+
+    It provides the same methods as :class:`SubsonicClient`, as coroutines.
+    Methods that return a generator in :class:`SubsonicClient`
+    (``getAlbumList()`` and ``getPlaylists()``) return a list here, except the
+    streaming ones (``iterArtists()`` and ``iterSearch3Songs()``), that are
+    async generators.
+
+    Requests are made using asyncio streams, on persistent connections.
+
+    :param str api_base_url: The URL of the Subsonic API.
+    :param str username: The name of the user.
+    :param str password: The password of the user.
+    :param str client_name: The name of the client, sent to the API.
+    :param int max_connections: Maximum number of requests in flight
+        (default: ``16``).
+    :param float pool_idle_timeout: Time (in seconds) after which an idle
+        connection is closed instead of being reused (default: ``60``).
+    :param flozz_daily_mix.cache.ResponseCache cache: Cache for the responses
+        of the read endpoints (optional).
+    :param float timeout: Timeout (in seconds) of the connection and of each
+        request (default: ``30``).
+    :param flozz_daily_mix.retry.RetryPolicy retry_policy: When and how
+        requests failing with a transient error are retried (default:
+        ``RetryPolicy()``).
+
+    The number of requests in flight is adapted to the server capacity (up to
+    ``max_connections``), using an
+    :class:`~flozz_daily_mix.limiter.AsyncAIMDLimiter`.
+
+    .. NOTE::
+
+        Connections are bound to the running event loop: call :meth:`close`
+        before the loop is closed.
+    """
+
+    def __init__(
+        self,
+        api_base_url,
+        username,
+        password,
+        client_name="FLOZz Subsonic Client/0",
+        max_connections=16,
+        pool_idle_timeout=60,
+        cache=None,
+        timeout=30,
+        retry_policy=None,
+    ):
+        super().__init__(
+            api_base_url,
+            username,
+            password,
+            client_name,
+            cache=cache,
+            retry_policy=retry_policy,
+        )
+        self._pool = AsyncHTTPConnectionPool(
+            pool_size=max_connections,
+            idle_timeout=pool_idle_timeout,
+            timeout=timeout,
+        )
+        self._limiter = AsyncAIMDLimiter(max_connections)
+        self._supports_song_listing = None
+
+    @contextlib.asynccontextmanager
+    async def _limited_stream(self, url, headers):
+        """Sends a GET request once the concurrency limiter allows it.
+
+        :rtype: flozz_daily_mix.http_pool.AsyncStreamedResponse
+        """
+        token = await self._limiter.acquire()
+        start = time.monotonic()
+        latency = None
+        error = False
+        try:
+            async with self._pool.stream("GET", url, headers=headers) as response:
+                latency = time.monotonic() - start
+                yield response
+        except Exception as request_error:
+            error = is_transient_error(request_error)
+            raise
+        finally:
+            await self._limiter.release(token, latency=latency, error=error)
+
+    async def _iter_body(self, url, stream=True):
+        """Asyncio version of :meth:`SubsonicClient._iter_body`.
+
+        :rtype: async_generator<bytes>
+        """
+        cached = self._get_cached_response(url)
+        if cached is not None and cached.fresh:
+            yield cached.body
+            return
+
+        headers = self._get_headers()
+        if cached is not None:
+            headers.update(cached.get_validation_headers())
+
+        attempt = 0
+        while True:
+            chunks = []
+            yielded = False
+            try:
+                async with self._limited_stream(url, headers) as http_response:
+                    if http_response.status == 304 and cached is not None:
+                        await http_response.read()
+                        self._cache.touch(url)
+                        yielded = True
+                        yield cached.body
+                        return
+                    async for chunk in iter_decoded_body_async(
+                        http_response, stats=self.transfer_stats
+                    ):
+                        # Streamed bodies are only kept to be cached
+                        if not stream or self._cache is not None:
+                            chunks.append(chunk)
+                        if stream:
+                            yielded = True
+                            yield chunk
+                    response_headers = http_response.headers
+                break
+            except Exception as error:
+                if yielded or not self._should_retry(url, error, attempt):
+                    raise
+                await asyncio.sleep(self._retry_policy.get_delay(error, attempt))
+                attempt += 1
+
+        # Only reached if the whole body was consumed
+        body = b"".join(chunks)
+        self._cache_response(url, body, response_headers)
+        if not stream:
+            yield body
+
+    async def _get_json(self, url):
+        json_string = b"".join(
+            [chunk async for chunk in self._iter_body(url, stream=False)]
+        )
+        return self._parse_json_response(url, json_string)
+
+    async def _iter_xml_elements(self, endpoint_name, tags, **kwargs):
+        """Asyncio version of :meth:`SubsonicClient._iter_xml_elements`.
+
+        :rtype: async_generator<(str, dict)>
+        """
+        url = self._build_url(endpoint_name, **kwargs, f="xml")
+        reader = _XMLElementReader(tags)
+        body = self._iter_body(url)
+        try:
+            async for chunk in body:
+                for element in reader.feed(chunk):
+                    yield element
+                if reader.error is not None:
+                    break
+            else:
+                for element in reader.close():
+                    yield element
+        finally:
+            await body.aclose()
+        reader.raise_error()
+
+    async def getArtists(self, **kwargs):
+        query = kwargs
+        url = self._build_url("getArtists", **query)
+        response = await self._get_json(url)
+        return self._parse_artists(response)
+
+    async def iterArtists(self, **kwargs):
+        """Streaming version of :meth:`getArtists` (see
+        :meth:`SubsonicClient.iterArtists`).
+
+        :rtype: async_generator<dict>
+        """
+        async for _, artist in self._iter_xml_elements(
+            "getArtists", ("artist",), **kwargs
+        ):
+            yield self._parse_artist(artist)
+
+    async def getAlbumList(
+        self, type_="alphabeticalByName", offset=0, size=100, **kwargs
+    ):
+        query = {"type": type_, "offset": offset, "size": size, **kwargs}
+        url = self._build_url("getAlbumList", **query)
+        response = await self._get_json(url)
+        return self._parse_album_list(response)
+
+    async def getAlbum(self, id_=None, **kwargs):
+        if not id_:
             raise ValueError()  # XXX
+        query = {"id": id_, **kwargs}
+        url = self._build_url("getAlbum", **query)
+        response = await self._get_json(url)
+        return self._parse_album(response)
+
+    async def search3(
+        self,
+        query="",
+        artistCount=20,
+        artistOffset=0,
+        albumCount=20,
+        albumOffset=0,
+        songCount=20,
+        songOffset=0,
+        **kwargs,
+    ):
         query = {
-            "playlistId": playlistId,
-            "songIdToAdd": songIdToAdd,
-            "songIndexToRemove": songIndexToRemove,
+            "query": query,
+            "artistCount": artistCount,
+            "artistOffset": artistOffset,
+            "albumCount": albumCount,
+            "albumOffset": albumOffset,
+            "songCount": songCount,
+            "songOffset": songOffset,
             **kwargs,
         }
-        if name is not None:
-            query["name"] = name
-        if comment is not None:
-            query["comment"] = comment
-        if public is not None:
-            query["public"] = public
+        url = self._build_url("search3", **query)
+        response = await self._get_json(url)
+        return self._parse_search_result(response)
+
+    async def iterSearch3Songs(self, query="", songCount=20, songOffset=0, **kwargs):
+        """Streaming version of :meth:`search3`, that only yields songs (see
+        :meth:`SubsonicClient.iterSearch3Songs`).
+
+        :rtype: async_generator<dict>
+        """
+        query = {
+            "query": query,
+            "artistCount": 0,
+            "albumCount": 0,
+            "songCount": songCount,
+            "songOffset": songOffset,
+            **kwargs,
+        }
+        async for _, song in self._iter_xml_elements("search3", ("song",), **query):
+            yield self._parse_song(song)
+
+    async def supports_song_listing(self):
+        """Checks (once) if the server returns all the songs when calling
+        ``search3`` with an empty query.
+
+        :rtype: bool
+        """
+        if self._supports_song_listing is None:
+            try:
+                result = await self.search3(
+                    query="", artistCount=0, albumCount=0, songCount=1
+                )
+                self._supports_song_listing = bool(result["song"])
+            except Exception:
+                self._supports_song_listing = False
+        return self._supports_song_listing
+
+    async def getPlaylists(self, **kwargs):
+        query = kwargs
+        url = self._build_url("getPlaylists", **query)
+        response = await self._get_json(url)
+        return self._parse_playlists(response)
+
+    async def createPlaylist(self, name=None, songId=[], **kwargs):
+        if not name:
+            raise ValueError()  # XXX
+        query = {"name": name, "songId": songId, **kwargs}
+        url = self._build_url("createPlaylist", **query)
+        response = await self._get_json(url)
+        self._invalidate_playlists_cache()
+        return self._parse_playlist(response)
+
+    async def deletePlaylist(self, id_=None, **kwargs):
+        if not id_:
+            raise ValueError()  # XXX
+        query = {"id": id_, **kwargs}
+        url = self._build_url("deletePlaylist", **query)
+        await self._get_json(url)
+        self._invalidate_playlists_cache()
+
+    async def updatePlaylist(
+        self,
+        playlistId=None,
+        name=None,
+        comment=None,
+        public=None,
+        songIdToAdd=[],
+        songIndexToRemove=[],
+        **kwargs,
+    ):
+        query = self._update_playlist_query(
+            playlistId, name, comment, public, songIdToAdd, songIndexToRemove, kwargs
+        )
         url = self._build_url("updatePlaylist", **query)
-        self._get_json(url)
+        await self._get_json(url)
+        self._invalidate_playlists_cache()
+
+    async def close(self):
+        """Closes the connections kept open to the server."""
+        await self._pool.close()
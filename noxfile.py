@@ -104,7 +104,7 @@ def stop_nextcloud_docker(session):
 @nox.session(python=PYTHON_VERSIONS, reuse_venv=True)
 def test(session):
     session.install("pytest")
-    session.install("-e", ".")
+    session.install("-e", ".[numpy]")
     # fmt:off
 
     print("\n\n:: Run all tests excepted the Subsonic API\n\n")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmark of the track picking of the playlist generator.
+
+Candidate pools are filled with synthetic tracks (no database is used), so
+only the time spent drawing tracks from the pools is measured. The time per
+track should not depend on the length of the playlist.
+
+USAGE:
+
+    ./scripts/benchmark-playlist.py [LENGTH ...]
+"""
+
+import sys
+import time
+import random
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
+from flozz_daily_mix.playlist import PlaylistGenerator, TrackRole  # noqa: E402
+
+DEFAULT_LENGTHS = [50, 500, 2000, 8000]
+REPEAT = 5
+
+
+class SyntheticPlaylistGenerator(PlaylistGenerator):
+    """Playlist generator whose pools are filled with synthetic tracks, with
+    the sizes the database query would return."""
+
+    def _fetch_musics(self):
+        pools = [
+            (TrackRole.INTEREST, self._tracks_interest, self._length // 2),
+            (TrackRole.FRESHNESS, self._tracks_freshness, self._length // 2),
+            (TrackRole.BACKCATALOG, self._tracks_backcatalog, self._length // 4),
+            (TrackRole.REGULAR, self._tracks_regular, self._length * 2),
+        ]
+        # Pools share some tracks, like the ones returned by the database
+        track_count = self._length * 3
+        for role, pool, size in pools:
+            for i in random.sample(range(track_count), size):
+                pool.add(
+                    {
+                        "trackId": "track-%i" % i,
+                        "artistId": "artist-%i" % (i % 100),
+                        "role": role,
+                    }
+                )
+
+
+def benchmark(length):
+    generator = SyntheticPlaylistGenerator(None, length=length)
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        generator.generate()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def main(args):
+    lengths = [int(arg) for arg in args] or DEFAULT_LENGTHS
+    print("%8s %12s %16s" % ("Length", "Time (ms)", "Per track (µs)"))
+    for length in lengths:
+        duration = benchmark(length)
+        print(
+            "%8i %12.2f %16.2f" % (length, duration * 1000, duration / length * 1000000)
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
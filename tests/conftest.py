@@ -0,0 +1,229 @@
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import threading
+import http.server
+import urllib.parse
+import xml.etree.ElementTree
+
+import pytest
+
+
+def _to_xml(parent, payload):
+    for key, value in payload.items():
+        if isinstance(value, dict):
+            _to_xml(xml.etree.ElementTree.SubElement(parent, key), value)
+        elif isinstance(value, list):
+            for item in value:
+                _to_xml(xml.etree.ElementTree.SubElement(parent, key), item)
+        elif isinstance(value, bool):
+            parent.set(key, "true" if value else "false")
+        else:
+            parent.set(key, str(value))
+
+
+class FakeSubsonicLibrary:
+    """A small fake music library served by :class:`FakeSubsonicHandler`."""
+
+    def __init__(self, artist_count=3, albums_per_artist=2, songs_per_album=3):
+        self.artists = []
+        self.albums = []
+        self.songs = {}
+        self.playlists = []
+        self.search3_enabled = True
+        for artist_index in range(artist_count):
+            artist_id = "artist-%i" % artist_index
+            self.artists.append(
+                {
+                    "id": artist_id,
+                    "name": "Artist %i" % artist_index,
+                    "albumCount": albums_per_artist,
+                }
+            )
+            for album_index in range(albums_per_artist):
+                album_id = "album-%i-%i" % (artist_index, album_index)
+                self.albums.append(
+                    {
+                        "id": album_id,
+                        "parent": artist_id,
+                        "artist": "Artist %i" % artist_index,
+                        "title": "Album %i-%i" % (artist_index, album_index),
+                        "genre": "Rock",
+                        "year": 2000 + album_index,
+                        "created": "2024-01-01T00:00:00.000Z",
+                        "isDir": True,
+                    }
+                )
+                self.songs[album_id] = [
+                    {
+                        "id": "%s-track-%i" % (album_id, song_index),
+                        "album": "Album %i-%i" % (artist_index, album_index),
+                        "albumId": album_id,
+                        "artist": "Artist %i" % artist_index,
+                        "artistId": artist_id,
+                        "title": "Song %i" % song_index,
+                        "track": song_index + 1,
+                        "duration": 180,
+                        "genre": "Rock",
+                        "playCount": song_index,
+                        "created": "2024-01-01T00:00:00.000Z",
+                    }
+                    for song_index in range(songs_per_album)
+                ]
+
+    def get_artists(self, query):
+        return {"artists": {"index": [{"name": "A", "artist": self.artists}]}}
+
+    def get_album_list(self, query):
+        offset = int(query.get("offset", 0))
+        end = offset + int(query.get("size", 10))
+        return {"albumList": {"album": self.albums[offset:end]}}
+
+    def get_album(self, query):
+        album_id = query["id"]
+        album = dict(next(a for a in self.albums if a["id"] == album_id))
+        album["song"] = self.songs[album_id]
+        album["songCount"] = len(album["song"])
+        return {"album": album}
+
+    def search3(self, query):
+        if not self.search3_enabled:
+            return {"searchResult3": {}}
+        songs = [song for album in self.albums for song in self.songs[album["id"]]]
+        offset = int(query.get("songOffset", 0))
+        end = offset + int(query.get("songCount", 20))
+        return {"searchResult3": {"song": songs[offset:end]}}
+
+    def get_playlists(self, query):
+        return {"playlists": {"playlist": self.playlists}}
+
+    def create_playlist(self, query):
+        playlist = {"id": "playlist-%i" % len(self.playlists), "name": query["name"]}
+        self.playlists.append(playlist)
+        return {"playlist": playlist}
+
+
+class FakeSubsonicHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    ENDPOINTS = {
+        "getArtists": "get_artists",
+        "getAlbumList": "get_album_list",
+        "getAlbum": "get_album",
+        "search3": "search3",
+        "getPlaylists": "get_playlists",
+        "createPlaylist": "create_playlist",
+    }
+
+    def do_GET(self):
+        parsed_url = urllib.parse.urlsplit(self.path)
+        endpoint = parsed_url.path.rsplit("/", 1)[-1]
+        query = dict(urllib.parse.parse_qsl(parsed_url.query))
+        self.server.requests.append((endpoint, query))
+        self.server.connections.add(self.client_address)
+
+        if self.server.delays:
+            time.sleep(self.server.delays.pop(0))
+
+        if self.server.failures:
+            status = self.server.failures.pop(0)
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            if status in (429, 503):
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        if endpoint in self.ENDPOINTS:
+            payload = getattr(self.server.library, self.ENDPOINTS[endpoint])(query)
+        else:
+            payload = {}
+        payload = {"status": "ok", "version": "1.8.0", **payload}
+        if query.get("f") == "xml":
+            root = xml.etree.ElementTree.Element(
+                "subsonic-response", xmlns="http://subsonic.org/restapi"
+            )
+            _to_xml(root, payload)
+            body = xml.etree.ElementTree.tostring(root, xml_declaration=True)
+        else:
+            body = json.dumps({"subsonic-response": payload}).encode("utf-8")
+
+        if self.server.etags:
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if self.server.etags:
+            self.send_header("ETag", etag)
+        if self.server.compression and self.server.compression in self.headers.get(
+            "Accept-Encoding", ""
+        ):
+            if self.server.compression == "gzip":
+                compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+            else:
+                compressor = zlib.compressobj(wbits=self.server.deflate_wbits)
+            body = compressor.compress(body) + compressor.flush()
+            self.send_header("Content-Encoding", self.server.compression)
+        if self.server.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 100):
+                chunk = body[i:][:100]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def subsonic_server():
+    """Runs a fake Subsonic API server, whose URL is available as the
+    ``url`` attribute."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeSubsonicHandler)
+    server.library = FakeSubsonicLibrary()
+    server.requests = []
+    server.connections = set()
+    server.chunked = False
+    server.compression = None
+    server.deflate_wbits = zlib.MAX_WBITS
+    server.etags = False
+    server.failures = []  # HTTP statuses returned to the next requests
+    server.delays = []  # Delays (in seconds) before answering the next requests
+    server.url = "http://127.0.0.1:%i/subsonic" % server.server_address[1]
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """Stores the genre database in a temporary cache directory (shared by all
+    the tests)."""
+    cache_home = tmp_path_factory.getbasetemp() / "cache"
+    monkeypatch.setenv("XDG_CACHE_HOME", str(cache_home))
+    return cache_home / "flozz-daily-mix"
+
+
+@pytest.fixture
+def music_db_path(tmp_path):
+    # Work on a copy as opening the database may apply migrations to it
+    db_path = tmp_path / "music.db"
+    shutil.copy("./tests/fixtures/music.db", db_path)
+    return str(db_path)
@@ -0,0 +1,119 @@
+import time
+import asyncio
+
+import pytest
+
+from flozz_daily_mix.cache import ResponseCache
+from flozz_daily_mix.subsonic import SubsonicClient, AsyncSubsonicClient
+
+
+class TestResponseCache:
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return ResponseCache(str(tmp_path / "cache.db"))
+
+    def test_key_without_credentials(self):
+        key = ResponseCache.get_key(
+            "http://x/rest/getAlbum?u=foo&p=bar&t=abc&s=def&c=app&id=1"
+        )
+        assert key == "http://x/rest/getAlbum?u=foo&c=app&id=1"
+
+    def test_get_put(self, cache):
+        assert cache.get("http://x/rest/getAlbum?id=1") is None
+        cache.put("http://x/rest/getAlbum?id=1&p=secret", b"foo", etag='"1"')
+        entry = cache.get("http://x/rest/getAlbum?id=1&p=other")
+        assert entry.body == b"foo"
+        assert entry.fresh
+        assert entry.get_validation_headers() == {"If-None-Match": '"1"'}
+
+    def test_ttl(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), ttls={"getAlbum": 0.1})
+        cache.put("http://x/rest/getAlbum?id=1", b"foo")
+        assert cache.get("http://x/rest/getAlbum?id=1").fresh
+        time.sleep(0.15)
+        assert not cache.get("http://x/rest/getAlbum?id=1").fresh
+        cache.touch("http://x/rest/getAlbum?id=1")
+        assert cache.get("http://x/rest/getAlbum?id=1").fresh
+
+    def test_not_cacheable(self, cache):
+        assert cache.is_cacheable("http://x/rest/getAlbum?id=1")
+        assert not cache.is_cacheable("http://x/rest/createPlaylist?name=a")
+
+    def test_lru_eviction(self, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), max_size=10)
+        cache.put("http://x/rest/getAlbum?id=1", b"1234")
+        cache.put("http://x/rest/getAlbum?id=2", b"1234")
+        cache.get("http://x/rest/getAlbum?id=1")
+        cache.put("http://x/rest/getAlbum?id=3", b"1234")
+        assert cache.get("http://x/rest/getAlbum?id=1") is not None
+        assert cache.get("http://x/rest/getAlbum?id=2") is None
+        assert cache.get("http://x/rest/getAlbum?id=3") is not None
+
+    def test_invalidate(self, cache):
+        cache.put("http://x/rest/getPlaylists", b"foo")
+        cache.put("http://x/rest/getAlbum?id=1", b"foo")
+        cache.invalidate("getPlaylists")
+        assert cache.get("http://x/rest/getPlaylists") is None
+        assert cache.get("http://x/rest/getAlbum?id=1") is not None
+
+
+class TestCachedSubsonicClient:
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return ResponseCache(str(tmp_path / "cache.db"))
+
+    def _count(self, subsonic_server, endpoint):
+        return len([r for r in subsonic_server.requests if r[0] == endpoint])
+
+    def test_fresh_response(self, subsonic_server, cache):
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password", cache=cache)
+        album = subsonic.getAlbum(id_="album-0-0")
+        assert subsonic.getAlbum(id_="album-0-0") == album
+        assert [a["id"] for a in subsonic.iterArtists()] == [
+            a["id"] for a in subsonic.iterArtists()
+        ]
+        assert self._count(subsonic_server, "getAlbum") == 1
+        assert self._count(subsonic_server, "getArtists") == 1
+
+    def test_shared_between_runs(self, subsonic_server, cache):
+        SubsonicClient(subsonic_server.url, "user", "pw1", cache=cache).getAlbum(
+            id_="album-0-0"
+        )
+        SubsonicClient(subsonic_server.url, "user", "pw2", cache=cache).getAlbum(
+            id_="album-0-0"
+        )
+        assert self._count(subsonic_server, "getAlbum") == 1
+
+    def test_revalidation(self, subsonic_server, tmp_path):
+        subsonic_server.etags = True
+        cache = ResponseCache(str(tmp_path / "cache.db"), ttls={"getAlbum": 0})
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password", cache=cache)
+        album = subsonic.getAlbum(id_="album-0-0")
+        received = subsonic.transfer_stats.bytes_received
+        assert subsonic.getAlbum(id_="album-0-0") == album
+        # The server answered "304 Not Modified", without body
+        assert subsonic.transfer_stats.bytes_received == received
+        assert self._count(subsonic_server, "getAlbum") == 2
+
+    def test_playlists_invalidated(self, subsonic_server, tmp_path):
+        cache = ResponseCache(str(tmp_path / "cache.db"), ttls={"getPlaylists": 3600})
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password", cache=cache)
+        assert list(subsonic.getPlaylists()) == []
+        subsonic.createPlaylist(name="Mix")
+        assert len(list(subsonic.getPlaylists())) == 1
+
+    def test_async_client(self, subsonic_server, cache):
+        async def _run():
+            subsonic = AsyncSubsonicClient(
+                subsonic_server.url, "user", "password", cache=cache
+            )
+            try:
+                await subsonic.getAlbum(id_="album-0-0")
+                return await subsonic.getAlbum(id_="album-0-0")
+            finally:
+                await subsonic.close()
+
+        assert asyncio.run(_run())["id"] == "album-0-0"
+        assert self._count(subsonic_server, "getAlbum") == 1
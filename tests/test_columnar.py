@@ -0,0 +1,105 @@
+import pytest
+
+from flozz_daily_mix.db import Database
+from flozz_daily_mix.playlist import PlaylistGenerator, TrackRole
+
+numpy = pytest.importorskip("numpy")
+
+from flozz_daily_mix.columnar import ColumnarLibrary  # noqa: E402
+
+
+class TestColumnarLibrary:
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        # Various stats to cover all the terms of the scores
+        db.execute_query(
+            "UPDATE tracks SET duration = 60 + rowid * 10, "
+            "rating = 1 + rowid % 5, "
+            "starred = rowid % 2, "
+            "playCount = rowid % 13, "
+            "year = 2015 + rowid % 12, "
+            "lastPlayed = CASE WHEN rowid % 3 = 0 THEN NULL "
+            "ELSE DATE('2024-01-01', '+' || rowid || ' days') END"
+        )
+        db.commit()
+        return db
+
+    @pytest.mark.parametrize("day", ["2024-03-01", "2025-06-01"])
+    def test_scores_parity(self, db, day):
+        library = ColumnarLibrary(db)
+        db.refresh_track_scores(day=day)
+        rows = db.execute_query(
+            "SELECT trackId, interestScore, freshnessScore, regularScore "
+            "FROM track_scores"
+        ).fetchall()
+        assert len(rows) == len(library)
+        indexes = [library._indexes[row[0]] for row in rows]
+        for i, scores in enumerate(library.get_scores(day=day), start=1):
+            expected = numpy.array([row[i] for row in rows], dtype=numpy.float64)
+            numpy.testing.assert_allclose(scores[indexes], expected, rtol=1e-12)
+
+    def test_select_pools(self, db):
+        library = ColumnarLibrary(db)
+        limits = {
+            TrackRole.INTEREST: 10,
+            TrackRole.FRESHNESS: 10,
+            TrackRole.BACKCATALOG: 5,
+            TrackRole.REGULAR: 20,
+        }
+        pools = library.select_pools(limits, min_rate=3, max_duration=600)
+        for role, limit in limits.items():
+            assert len(pools[role]) == limit
+            for track in pools[role]:
+                assert track["rating"] >= 3
+                assert track["duration"] <= 600
+            assert len({track["trackId"] for track in pools[role]}) == limit
+
+        interest = [track["fzzInterestScore"] for track in pools[TrackRole.INTEREST]]
+        assert interest == sorted(interest, reverse=True)
+        last_played = [track["lastPlayed"] for track in pools[TrackRole.BACKCATALOG]]
+        assert None not in last_played
+        assert last_played == sorted(last_played)
+
+    def test_select_pools_ignored(self, db):
+        library = ColumnarLibrary(db)
+        limits = {role: 100 for role in TrackRole}
+        bit = db.get_track_ignore_mask("^\\d")
+        pools = library.select_pools(limits, min_rate=0, max_duration=10000)
+        assert [t for t in pools[TrackRole.REGULAR] if t["trackName"][0].isdigit()]
+        pools = library.select_pools(
+            limits, min_rate=0, max_duration=10000, ignore_bit=bit
+        )
+        assert len(pools[TrackRole.REGULAR]) > 0
+        assert not [t for t in pools[TrackRole.REGULAR] if t["trackName"][0].isdigit()]
+
+    def test_select_pools_genres(self, db):
+        library = ColumnarLibrary(db)
+        limits = {role: 100 for role in TrackRole}
+        genre_ids = db.get_genre_graph().expand_genre_ids("chiptune")
+        pools = library.select_pools(
+            limits, min_rate=0, max_duration=10000, genre_ids=genre_ids
+        )
+        track_ids = {t["trackId"] for t in pools[TrackRole.REGULAR]}
+        assert track_ids
+        assert track_ids == {
+            row[0]
+            for row in db.execute_query(
+                "SELECT id FROM tracks WHERE genreName = 'chiptune'"
+            )
+        }
+
+    def test_playlist_generator(self, db):
+        library = ColumnarLibrary(db)
+        for _ in range(2):
+            generator = PlaylistGenerator(
+                db,
+                length=20,
+                min_rate=0,
+                max_duration=10000,
+                sampling_engine="numpy",
+                library=library,
+            )
+            generator.generate()
+            assert len(set(generator.get_tracks_ids())) == 20
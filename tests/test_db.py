@@ -1,14 +1,18 @@
+import sqlite3
+
 import pytest
 
-from flozz_daily_mix.db import Database
+from flozz_daily_mix.db import Database, _SQL_MIGRATIONS
+from flozz_daily_mix.playlist import PlaylistGenerator
+from flozz_daily_mix.ignore import TrackIgnoreMatcher
 
 
 class TestDB:
 
     @pytest.fixture
-    def db(self):
+    def db(self, music_db_path):
         db = Database(
-            db_path="./tests/fixtures/music.db",
+            db_path=music_db_path,
             skip_table_creation=True,
         )
         return db
@@ -82,3 +86,410 @@ class TestDBInsert:
             "lastPlayed": "",
         }
         db.insert_track(**default_track)
+
+    def test_insert_artists_many(self, db):
+        count = db.insert_artists_many(
+            (("artist-%i" % i, "Artist %i" % i, None, False, 3) for i in range(25)),
+            chunk_size=10,
+        )
+        assert count == 25
+        assert db.execute_query(
+            "SELECT COUNT(*) FROM artists WHERE id LIKE 'artist-%'"
+        ).fetchone() == (25,)
+
+    def test_insert_albums_many_default_artist(self, db):
+        db.insert_albums_many([("album-1", None) + (None,) * 10])
+        assert db.execute_query(
+            "SELECT artistId FROM albums WHERE id = 'album-1'"
+        ).fetchone() == ("default-artist-0",)
+
+    def test_insert_tracks_many_defaults(self, db):
+        values = (None,) * 13
+        db.insert_tracks_many(
+            [
+                ("track-1", None, None, None) + values,
+                ("track-2", "artist-1", None, "album-1") + values,
+                ("track-3", None, "artist-2", "album-1") + values,
+            ]
+        )
+        assert db.execute_query(
+            "SELECT id, albumArtistId, artistId, albumId FROM tracks ORDER BY id"
+        ).fetchall() == [
+            ("track-1", "default-artist-0", "default-artist-0", "default-album-0"),
+            ("track-2", "artist-1", "artist-1", "album-1"),
+            ("track-3", "artist-2", "artist-2", "album-1"),
+        ]
+
+    def test_insert_many_upsert(self, db):
+        db.insert_artists_many([("artist-1", "Artist", None, False, 3)])
+        with pytest.raises(sqlite3.IntegrityError):
+            db.insert_artists_many([("artist-1", "Renamed", None, False, 3)])
+        db.insert_artists_many([("artist-1", "Renamed", None, False, 3)], upsert=True)
+        assert db.execute_query(
+            "SELECT name FROM artists WHERE id = 'artist-1'"
+        ).fetchone() == ("Renamed",)
+
+    def test_insert_genres_many(self, db):
+        db.insert_genres_many([(1, "rock"), (2, "pop")])
+        db.insert_genre_aliases_many([(1, 1, "rock music")])
+        db.insert_genre_relations_many([(1, 1, 2)])
+        assert db.is_genre("pop")
+        assert db.is_genre_alias("rock music")
+
+
+class TestDBMigrations:
+
+    def test_new_database_version(self, tmp_path):
+        db_path = str(tmp_path / "new.db")
+        Database(db_path)
+        con = sqlite3.connect(db_path)
+        (version,) = con.execute("PRAGMA user_version").fetchone()
+        assert version == len(_SQL_MIGRATIONS)
+
+    def test_migrate_old_database(self, music_db_path):
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        columns = [
+            row[1] for row in db.execute_query("PRAGMA table_info(albums)").fetchall()
+        ]
+        assert "songCount" in columns
+        assert "duration" in columns
+        del db
+
+        # Migrations are only applied once
+        Database(db_path=music_db_path, skip_table_creation=False)
+
+
+class TestDBReadOnly:
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        # Migrate the database and compute the scores before opening it in
+        # read-only mode
+        Database(db_path=music_db_path, skip_table_creation=True).close()
+        return Database(db_path=music_db_path, read_only=True)
+
+    def test_is_read_only(self, db):
+        assert db.is_read_only()
+
+    def test_write(self, db):
+        with pytest.raises(sqlite3.OperationalError):
+            db.execute_query("DELETE FROM tracks")
+
+    def test_refresh_track_scores(self, db):
+        assert db.refresh_track_scores() == 0
+
+    def test_track_ignore_masks(self, db):
+        db.compute_track_ignore_masks(["^.*"])
+        (count,) = db.execute_query(
+            "SELECT COUNT(*) FROM temp.track_ignore_masks"
+        ).fetchone()
+        assert count == 72
+
+    def test_backup(self, db, tmp_path):
+        db.backup(str(tmp_path / "copy.db"))
+        copy = Database(db_path=str(tmp_path / "copy.db"), read_only=True)
+        (count,) = copy.execute_query("SELECT COUNT(*) FROM tracks").fetchone()
+        assert count == 72
+
+
+class TestDBSync:
+
+    @pytest.fixture
+    def db(self):
+        db = Database(db_path=":memory:")
+        db.insert_artist(id_="artist-1", name="Artist 1")
+        db.insert_artist(id_="artist-2", name="Artist 2")
+        for album_id in ("album-1", "album-2"):
+            db.insert_album(
+                id_=album_id,
+                artistId="artist-1",
+                created="2024-01-01",
+                songCount=1,
+                duration=60,
+            )
+            db.insert_track(id_="%s-track-1" % album_id, albumId=album_id)
+        return db
+
+    def test_upsert(self, db):
+        db.insert_artist(id_="artist-1", name="Renamed", upsert=True)
+        assert db.execute_query(
+            "SELECT name FROM artists WHERE id = 'artist-1'"
+        ).fetchall() == [("Renamed",)]
+
+    def test_get_albums_signatures(self, db):
+        assert db.get_albums_signatures() == {
+            "album-1": ("2024-01-01", 1, 60),
+            "album-2": ("2024-01-01", 1, 60),
+        }
+
+    def test_delete_artists(self, db):
+        assert db.delete_artists(keep_ids={"artist-1"}) == 1
+        assert db.execute_query("SELECT id FROM artists ORDER BY id").fetchall() == [
+            ("artist-1",),
+            ("default-artist-0",),
+        ]
+
+    def test_delete_albums(self, db):
+        db.delete_albums(["album-1"])
+        assert list(db.get_albums_signatures()) == ["album-2"]
+        assert db.execute_query("SELECT id FROM tracks").fetchall() == [
+            ("album-2-track-1",)
+        ]
+
+
+class TestDBIndexes:
+
+    PARAMS = {
+        "min_rate": 2,
+        "min_duration": 60,
+        "max_duration": 600,
+        "track_ignore_mask": 0,
+    }
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        # The fixture database is migrated to the last version
+        return Database(db_path=music_db_path, skip_table_creation=True)
+
+    def _query_plan(self, db, query, params={}):
+        return " | ".join(
+            row[3] for row in db.execute_query("EXPLAIN QUERY PLAN %s" % query, params)
+        )
+
+    def _generator_query(self, db, where, order_by):
+        generator = PlaylistGenerator(db)
+        return generator._generate_sql_query(
+            where=generator._SQL_WHERE_CLAUSES + where, order_by=order_by, limit=10
+        )
+
+    def test_genre_filter(self, db):
+        db.set_genre_filter({1, 2})
+        query = self._generator_query(
+            db,
+            [PlaylistGenerator._SQL_GENRE_FILTER_WHERE_CLAUSE],
+            ["fzzInterestScore DESC", "rand DESC"],
+        )
+        plan = self._query_plan(db, query, self.PARAMS)
+        assert "USING COVERING INDEX track_genres_genreId" in plan
+        assert "SCAN tracks" not in plan
+        # The index of the genre names was dropped by a migration
+        assert not db.execute_query(
+            "SELECT 1 FROM sqlite_master WHERE name = ?",
+            ("tracks_genreName_rating_duration",),
+        ).fetchone()
+
+    def test_back_catalog(self, db):
+        query = self._generator_query(
+            db,
+            ["tracks.lastPlayed NOT NULL"],
+            ["tracks.lastPlayed", "rand DESC"],
+        )
+        plan = self._query_plan(db, query, self.PARAMS)
+        assert "USING INDEX tracks_lastPlayed" in plan
+        assert "RIGHT PART OF ORDER BY" in plan
+
+    def test_album_tracks(self, db):
+        plan = self._query_plan(
+            db, "SELECT id FROM tracks WHERE albumId = :id", {"id": "x"}
+        )
+        assert "USING INDEX tracks_albumId" in plan
+
+    def test_album_artist_tracks(self, db):
+        plan = self._query_plan(
+            db,
+            "SELECT artists.name, tracks.id FROM artists "
+            "JOIN tracks ON tracks.albumArtistId = artists.id "
+            "WHERE artists.id = :id",
+            {"id": "x"},
+        )
+        assert "USING INDEX tracks_albumArtistId" in plan
+
+    def test_interest_score(self, db):
+        db.refresh_track_scores()
+        query = self._generator_query(
+            db, [], ["track_scores.interestScore DESC", "rand DESC"]
+        )
+        plan = self._query_plan(db, query, self.PARAMS)
+        assert "USING INDEX track_scores_interestScore" in plan
+        assert "RIGHT PART OF ORDER BY" in plan
+
+
+class TestTrackScores:
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        return Database(db_path=music_db_path, skip_table_creation=True)
+
+    def _scores(self, db):
+        query = "SELECT trackId, day, interestScore, regularScore FROM track_scores"
+        return {row[0]: row[1:] for row in db.execute_query(query, {})}
+
+    def test_refresh(self, db):
+        assert db.refresh_track_scores(day="2024-06-01") == 72
+        assert db.refresh_track_scores(day="2024-06-01") == 0
+        scores = self._scores(db)
+        assert len(scores) == 72
+        assert {day for day, _, _ in scores.values()} == {"2024-06-01"}
+
+    def test_refresh_changed_tracks(self, db):
+        db.refresh_track_scores(day="2024-06-01")
+        (track_id,) = db.execute_query("SELECT id FROM tracks LIMIT 1", {}).fetchone()
+        db.execute_query(
+            "UPDATE tracks SET rating = 5 WHERE id = :id", {"id": track_id}
+        )
+        before = self._scores(db)
+        assert db.refresh_track_scores(day="2024-06-01") == 1
+        after = self._scores(db)
+        assert after[track_id][1] > before[track_id][1]
+
+    def test_refresh_new_day(self, db):
+        db.refresh_track_scores(day="2024-06-01")
+        assert db.refresh_track_scores(day="2024-06-02") == 72
+
+    def test_refresh_removed_tracks(self, db):
+        db.refresh_track_scores(day="2024-06-01")
+        (track_id,) = db.execute_query("SELECT id FROM tracks LIMIT 1", {}).fetchone()
+        db.execute_query("DELETE FROM tracks WHERE id = :id", {"id": track_id})
+        db.refresh_track_scores(day="2024-06-01")
+        assert track_id not in self._scores(db)
+
+
+class TestTrackIgnoreMasks:
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        return Database(db_path=music_db_path, skip_table_creation=True)
+
+    def _ignored_tracks(self, db, bit):
+        query = "SELECT trackId FROM temp.track_ignore_masks WHERE mask & :bit"
+        return {row[0] for row in db.execute_query(query, {"bit": bit})}
+
+    def _track_ids(self, db, where):
+        query = "SELECT id FROM tracks WHERE %s" % where
+        return {row[0] for row in db.execute_query(query)}
+
+    def test_masks(self, db):
+        db.compute_track_ignore_masks(["^\\d", "^.*reality.*$"])
+        digits = db.get_track_ignore_mask("^\\d")
+        reality = db.get_track_ignore_mask("^.*reality.*$")
+        assert digits != reality
+        assert self._ignored_tracks(db, digits) == self._track_ids(
+            db, "name GLOB '[0-9]*'"
+        )
+        assert self._ignored_tracks(db, reality) == self._track_ids(
+            db, "name LIKE '%reality%'"
+        )
+
+    def test_empty_pattern(self, db):
+        db.compute_track_ignore_masks([""])
+        assert db.get_track_ignore_mask("") == 0
+        assert self._ignored_tracks(db, -1) == set()
+
+    def test_new_pattern(self, db):
+        db.compute_track_ignore_masks(["^\\d"])
+        bit = db.get_track_ignore_mask("^\\d")
+        db.get_track_ignore_mask("^.*reality.*$")
+        assert db.get_track_ignore_mask("^\\d") == bit
+        assert self._ignored_tracks(db, bit)
+
+    def test_too_many_patterns(self, db, monkeypatch):
+        matchers = []
+        monkeypatch.setattr(
+            "flozz_daily_mix.db.TrackIgnoreMatcher",
+            lambda patterns: matchers.append(patterns) or TrackIgnoreMatcher(patterns),
+        )
+        patterns = ["^zz%i$" % i for i in range(69)] + ["^.*reality.*$"]
+        db.compute_track_ignore_masks(patterns)
+        assert matchers == [patterns[:62]]
+        # Patterns that did not fit are matched by a second pass
+        bit = db.get_track_ignore_mask("^.*reality.*$")
+        assert self._ignored_tracks(db, bit) == self._track_ids(
+            db, "name LIKE '%reality%'"
+        )
+        assert matchers[1:] == [["^.*reality.*$"] + patterns[62:69]]
+        for pattern in patterns[62:]:
+            db.get_track_ignore_mask(pattern)
+        assert len(matchers) == 2
+
+    def test_inserted_tracks(self, db):
+        bit = db.get_track_ignore_mask("^.*reality.*$")
+        db.insert_track(id_="new", name="Virtual Reality", albumId="x")
+        bit = db.get_track_ignore_mask("^.*reality.*$")
+        assert "new" in self._ignored_tracks(db, bit)
+
+    def test_playlist_generator(self, db):
+        generator = PlaylistGenerator(
+            db, min_duration=0, min_rate=0, track_ignore_pattern="^\\d"
+        )
+        generator.generate()
+        names = [track["trackName"] for track in generator.get_playlist()]
+        assert names
+        assert not [name for name in names if name[0].isdigit()]
+
+
+class TestTrackGenres:
+
+    @pytest.fixture
+    def db(self):
+        db = Database()
+        db.insert_genres_many([(1, "rock"), (2, "folk"), (3, "folk rock")])
+        db.insert_genre_aliases_many([(1, 1, "rock music")])
+        return db
+
+    def _track_genres(self, db, track_id):
+        query = "SELECT genreId FROM track_genres WHERE trackId = ?"
+        return {row[0] for row in db.execute_query(query, (track_id,))}
+
+    def test_insert_track(self, db):
+        db.insert_track(id_="track-1", genreName="rock music; folk; unknown")
+        custom_genre_id = db.get_custom_genre_id("unknown")
+        assert custom_genre_id < 0
+        assert self._track_genres(db, "track-1") == {1, 2, custom_genre_id}
+
+    def test_custom_genres(self, db):
+        # Genres that are not in the genre graph keep the same ID
+        db.insert_track(id_="track-1", genreName="Office Bangers")
+        db.insert_track(id_="track-2", genreName="rock; office bangers")
+        custom_genre_id = db.get_custom_genre_id("office bangers")
+        assert self._track_genres(db, "track-1") == {custom_genre_id}
+        assert self._track_genres(db, "track-2") == {1, custom_genre_id}
+        assert db.get_custom_genre_id("rock") is None
+
+    def test_genre_name_with_comma(self, db):
+        # Only ";" separates the genres, a genre name can contain a comma
+        db.insert_track(id_="track-1", genreName="Rock, Pop & Soul; rock")
+        custom_genre_id = db.get_custom_genre_id("rock, pop & soul")
+        assert custom_genre_id is not None
+        assert self._track_genres(db, "track-1") == {1, custom_genre_id}
+
+    def test_upsert_track(self, db):
+        db.insert_track(id_="track-1", genreName="rock")
+        db.insert_track(id_="track-1", genreName="folk rock", upsert=True)
+        assert self._track_genres(db, "track-1") == {3}
+
+    def test_tracks_inserted_before_genres(self):
+        db = Database()
+        db.insert_track(id_="track-1", genreName="rock")
+        assert self._track_genres(db, "track-1") == set()
+        db.insert_genres_many([(1, "rock")])
+        assert db.update_track_genres() == 1
+        assert self._track_genres(db, "track-1") == {1}
+
+    def test_delete_album_tracks(self, db):
+        db.insert_track(id_="track-1", albumId="album-1", genreName="rock")
+        db.delete_album_tracks("album-1")
+        assert self._track_genres(db, "track-1") == set()
+
+    def test_migration(self, music_db_path):
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        (count,) = db.execute_query(
+            "SELECT COUNT(*) FROM tracks "
+            "WHERE id NOT IN (SELECT trackId FROM track_genres)"
+        ).fetchone()
+        assert count == 0
+        # The "(unknown genre)" genre is not in the genre graph
+        custom_genre_id = db.get_custom_genre_id("(unknown genre)")
+        (count,) = db.execute_query(
+            "SELECT COUNT(*) FROM track_genres WHERE genreId = ?", (custom_genre_id,)
+        ).fetchone()
+        assert count == 1
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+from flozz_daily_mix.__main__ import generate_playlists, generate, dumpdata
+from flozz_daily_mix.config import _DEFAULT_PLAYLIST_CONFIG
+from flozz_daily_mix.db import Database
+from flozz_daily_mix.subsonic import SubsonicClient
+
+
+class TestGeneratePlaylists:
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        return Database(db_path=music_db_path, skip_table_creation=True)
+
+    @pytest.fixture
+    def playlists_configs(self):
+        return [
+            dict(
+                _DEFAULT_PLAYLIST_CONFIG,
+                name="Mix %i" % i,
+                max_tracks=5 + i,
+                min_track_duration=0,
+                minimal_track_rating=0,
+            )
+            for i in range(5)
+        ]
+
+    def test_generate_playlists(self, db, playlists_configs):
+        playlists = generate_playlists(db, playlists_configs)
+        assert [len(playlist) for playlist in playlists] == [5, 6, 7, 8, 9]
+
+    def test_generate_playlists_jobs(self, db, music_db_path, playlists_configs):
+        playlists = generate_playlists(
+            db, playlists_configs, jobs=2, db_file=music_db_path
+        )
+        # Playlists are returned in the order of the configs
+        assert [len(playlist) for playlist in playlists] == [5, 6, 7, 8, 9]
+        for playlist in playlists:
+            track_ids = [track["trackId"] for track in playlist]
+            assert len(set(track_ids)) == len(track_ids)
+
+    def test_generate_playlists_jobs_without_db_file(self, db, playlists_configs):
+        with pytest.raises(ValueError):
+            generate_playlists(db, playlists_configs, jobs=2)
+
+    def test_generate_playlists_jobs_without_scores(
+        self, db, music_db_path, playlists_configs
+    ):
+        # The workers cannot compute the scores: they must not publish empty
+        # playlists
+        copy_path = music_db_path + ".copy"
+        db.backup(copy_path)
+        with pytest.raises(RuntimeError):
+            generate_playlists(
+                Database(":memory:"), playlists_configs, jobs=2, db_file=copy_path
+            )
+
+
+class TestGenerate:
+
+    @pytest.mark.parametrize("jobs", [1, 3])
+    def test_generate(self, subsonic_server, monkeypatch, jobs):
+        playlists = []
+        monkeypatch.setattr("flozz_daily_mix.__main__.print_playlist", playlists.append)
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password")
+        playlists_configs = [
+            dict(_DEFAULT_PLAYLIST_CONFIG, _id=str(i), name="Mix %i" % i, max_tracks=5)
+            for i in range(3)
+        ]
+        generate(subsonic, playlists_configs, dry_run=True, print_pl=True, jobs=jobs)
+        assert [len(playlist) for playlist in playlists] == [5, 5, 5]
+
+    @pytest.mark.parametrize("jobs", [1, 3])
+    def test_generate_from_source_db(self, music_db_path, monkeypatch, jobs):
+        playlists = []
+        monkeypatch.setattr("flozz_daily_mix.__main__.print_playlist", playlists.append)
+        with open(music_db_path, "rb") as file:
+            source_db = file.read()
+        playlists_configs = [
+            dict(
+                _DEFAULT_PLAYLIST_CONFIG,
+                _id=str(i),
+                name="Mix %i" % i,
+                max_tracks=5,
+                min_track_duration=0,
+                minimal_track_rating=0,
+            )
+            for i in range(3)
+        ]
+        generate(
+            None,
+            playlists_configs,
+            db_file=music_db_path,
+            dry_run=True,
+            print_pl=True,
+            jobs=jobs,
+        )
+        assert [len(playlist) for playlist in playlists] == [5, 5, 5]
+        # The source database is not migrated nor scored
+        with open(music_db_path, "rb") as file:
+            assert file.read() == source_db
+        assert sorted(os.listdir(os.path.dirname(music_db_path))) == ["music.db"]
+
+    @pytest.mark.parametrize("jobs", [1, 3])
+    def test_generate_reuses_stored_scores(
+        self, subsonic_server, tmp_path, monkeypatch, jobs
+    ):
+        db_file = str(tmp_path / "music.db")
+        dumpdata(SubsonicClient(subsonic_server.url, "user", "password"), db_file)
+
+        rescored = []
+        refresh_track_scores = Database.refresh_track_scores
+
+        def _refresh_track_scores(self, *args, **kwargs):
+            rescored.append(refresh_track_scores(self, *args, **kwargs))
+            return rescored[-1]
+
+        def _create_temp_db_file():
+            raise AssertionError("The source database should not be copied")
+
+        monkeypatch.setattr(Database, "refresh_track_scores", _refresh_track_scores)
+        monkeypatch.setattr(
+            "flozz_daily_mix.__main__._create_temp_db_file", _create_temp_db_file
+        )
+        playlists = []
+        monkeypatch.setattr("flozz_daily_mix.__main__.print_playlist", playlists.append)
+        playlists_configs = [
+            dict(_DEFAULT_PLAYLIST_CONFIG, _id=str(i), name="Mix %i" % i, max_tracks=5)
+            for i in range(3)
+        ]
+        for _ in range(2):
+            generate(
+                None,
+                playlists_configs,
+                db_file=db_file,
+                dry_run=True,
+                print_pl=True,
+                jobs=jobs,
+            )
+        assert [len(playlist) for playlist in playlists] == [5] * 6
+        # The scores stored by dumpdata are read as is
+        assert not any(rescored)
+        assert os.listdir(tmp_path) == ["music.db"]
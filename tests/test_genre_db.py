@@ -0,0 +1,70 @@
+import os
+import sqlite3
+
+import pytest
+
+from flozz_daily_mix.db import Database
+from flozz_daily_mix.genre_db import get_genre_db_path, get_data_files_hash
+from flozz_daily_mix.__main__ import use_genre_db
+
+
+class TestGenreDb:
+
+    def test_get_genre_db_path(self, tmp_path):
+        db_path = get_genre_db_path(str(tmp_path))
+        assert os.listdir(tmp_path) == [os.path.basename(db_path)]
+        assert get_data_files_hash() in db_path
+        con = sqlite3.connect(db_path)
+        assert con.execute("SELECT COUNT(*) FROM genres").fetchone()[0] > 1000
+        # Built only once
+        mtime = os.stat(db_path).st_mtime_ns
+        assert get_genre_db_path(str(tmp_path)) == db_path
+        assert os.stat(db_path).st_mtime_ns == mtime
+
+    def test_default_cache_dir(self, cache_dir):
+        assert os.path.dirname(get_genre_db_path()) == str(cache_dir)
+
+    def test_invalid_cache_dir(self, tmp_path):
+        (tmp_path / "file").write_text("")
+        with pytest.raises(OSError):
+            get_genre_db_path(str(tmp_path / "file" / "cache"))
+
+
+class TestAttachGenreDb:
+
+    @pytest.fixture
+    def db(self):
+        db = Database()
+        db.insert_track(id_="track-1", genreName="rock music")
+        use_genre_db(db)
+        return db
+
+    def test_genres(self, db):
+        assert db.is_genre("rock")
+        assert db.get_genre_graph().is_genre_alias("rock music")
+        assert db.get_genre_tree("rock")[0]["children"]
+
+    def test_read_only(self, db):
+        with pytest.raises(sqlite3.OperationalError):
+            db.insert_genres_many([(1, "rock")])
+
+    def test_track_genres(self, db):
+        db.insert_track(id_="track-2", genreName="rock; jazz")
+        assert db.update_track_genres() == 3
+        (genre_id,) = db.execute_query(
+            "SELECT id FROM genres WHERE name = 'rock'"
+        ).fetchone()
+        assert {
+            row[0]
+            for row in db.execute_query(
+                "SELECT trackId FROM track_genres WHERE genreId = ?", (genre_id,)
+            )
+        } == {"track-1", "track-2"}
+
+    def test_imported_genres(self, music_db_path):
+        # Genres imported in the database are used
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        use_genre_db(db)
+        assert not db.execute_query(
+            "SELECT 1 FROM sqlite_temp_master WHERE name = 'genres'"
+        ).fetchone()
@@ -0,0 +1,114 @@
+import pytest
+
+from flozz_daily_mix.db import Database
+from flozz_daily_mix.genres import GenreGraph
+
+
+class TestGenreGraph:
+
+    @pytest.fixture
+    def graph(self):
+        return GenreGraph(
+            genres=[(1, "rock"), (2, "hard rock"), (3, "metal"), (4, "pop")],
+            aliases=[(1, "rock music"), (3, "heavy metal"), (4, "pop music")],
+            # "hard rock" and "metal" form a cycle
+            relations=[(1, 2), (2, 3), (3, 2), (None, 4)],
+        )
+
+    def test_is_genre(self, graph):
+        assert graph.is_genre("rock")
+        assert graph.is_genre(" Hard_Rock ")
+        assert not graph.is_genre("rock music")
+
+    def test_is_genre_alias(self, graph):
+        assert graph.is_genre_alias("Rock Music")
+        assert not graph.is_genre_alias("rock")
+
+    def test_get_genre_id(self, graph):
+        assert graph.get_genre_id("metal") == 3
+        assert graph.get_genre_id("heavy metal") == 3
+        assert graph.get_genre_id("jazz") is None
+
+    def test_get_closure(self, graph):
+        assert graph.get_closure(1) == {1, 2, 3}
+        assert graph.get_closure(2) == {2, 3}
+        assert graph.get_closure(3) == {2, 3}
+        assert graph.get_closure(4) == {4}
+
+    def test_expand_genre_ids(self, graph):
+        assert graph.expand_genre_ids("rock music") == {1, 2, 3}
+        assert graph.expand_genre_ids("jazz") == set()
+
+    def test_get_root_genres(self, graph):
+        assert graph.get_root_genres() == [4, 1]
+
+    def test_walk(self, graph):
+        assert list(graph.walk()) == [
+            (4, ((0, 2),)),
+            (1, ((1, 2),)),
+            (2, ((1, 2), (0, 1))),
+            # The cycle stops at "hard rock"
+            (3, ((1, 2), (0, 1), (0, 1))),
+        ]
+        assert [genre_id for genre_id, _ in graph.walk([3])] == [3, 2]
+
+    def test_expand_genre(self, graph):
+        assert graph.expand_genre("rock") == {
+            "rock",
+            "rock music",
+            "hard rock",
+            "metal",
+            "heavy metal",
+        }
+        assert graph.expand_genre("rock", with_aliases=False) == {
+            "rock",
+            "hard rock",
+            "metal",
+        }
+
+    def test_expand_genre_alias(self, graph):
+        assert graph.expand_genre("pop music") == {"pop", "pop music"}
+
+    def test_expand_unknown_genre(self, graph):
+        assert graph.expand_genre("Jazz") == {"jazz"}
+
+
+class TestDatabaseGenreGraph:
+
+    def test_get_genre_graph(self, music_db_path):
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        graph = db.get_genre_graph()
+        assert graph.is_genre("rock")
+        assert graph.is_genre_alias("rock music")
+        assert set(
+            db.get_genre_subgenres(
+                genre_name="rock",
+                with_aliases=True,
+                recursive=True,
+                include_input_genre_name=True,
+            )
+        ) <= graph.expand_genre("rock")
+        assert db.get_genre_graph() is graph
+
+    def test_get_genre_graph_reloaded(self):
+        db = Database()
+        assert not db.get_genre_graph().is_genre("rock")
+        db.insert_genres_many([(1, "rock")])
+        assert db.get_genre_graph().is_genre("rock")
+
+    def test_get_genre_tree(self, music_db_path):
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        tree = db.get_genre_tree()
+        names = [genre["name"] for genre in tree]
+        assert names == sorted(names)
+        assert "rock" in names
+
+        (rock,) = db.get_genre_tree("rock music")
+        assert rock["name"] == "rock"
+        assert rock["aliases"] == ["rock music"]
+        assert [genre["name"] for genre in rock["children"]] == list(
+            db.get_genre_subgenres(genre_name="rock", include_input_genre_name=False)
+        )
+
+        with pytest.raises(ValueError):
+            db.get_genre_tree("xxx not a genre")
@@ -0,0 +1,111 @@
+import threading
+import http.server
+import urllib.error
+
+import pytest
+
+from flozz_daily_mix.http_pool import HTTPConnectionPool
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/hello")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/error":
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b"hello"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Simulate a server that closes kept-alive sockets without notice
+        if self.server.drop_connections:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.connections = set()
+    server.drop_connections = False
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server, path="/hello"):
+    return "http://127.0.0.1:%i%s" % (server.server_address[1], path)
+
+
+class TestHTTPConnectionPool:
+
+    def test_keep_alive(self, server):
+        pool = HTTPConnectionPool(pool_size=2)
+        for _ in range(5):
+            with pool.request("GET", _url(server)) as response:
+                assert response.status == 200
+                assert response.read() == b"hello"
+        assert len(server.connections) == 1
+        pool.close()
+
+    def test_idle_timeout(self, server):
+        pool = HTTPConnectionPool(pool_size=2, idle_timeout=-1)
+        for _ in range(3):
+            with pool.request("GET", _url(server)) as response:
+                response.read()
+        assert len(server.connections) == 3
+
+    def test_reconnect_closed_connection(self, server):
+        server.drop_connections = True
+        pool = HTTPConnectionPool(pool_size=2)
+        for _ in range(3):
+            with pool.request("GET", _url(server)) as response:
+                assert response.read() == b"hello"
+
+    def test_threads(self, server):
+        pool = HTTPConnectionPool(pool_size=3)
+        results = []
+
+        def _worker():
+            for _ in range(10):
+                with pool.request("GET", _url(server)) as response:
+                    results.append(response.read())
+
+        threads = [threading.Thread(target=_worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [b"hello"] * 60
+        assert len(server.connections) <= 3
+
+    def test_redirect(self, server):
+        pool = HTTPConnectionPool()
+        with pool.request("GET", _url(server, "/redirect")) as response:
+            assert response.read() == b"hello"
+
+    def test_http_error(self, server):
+        pool = HTTPConnectionPool()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            pool.request("GET", _url(server, "/error"))
+        assert error.value.code == 503
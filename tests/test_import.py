@@ -0,0 +1,231 @@
+import os
+import time
+import sqlite3
+
+import pytest
+
+from flozz_daily_mix.__main__ import (
+    get_tracks,
+    get_tracks_bulk,
+    import_music_to_database,
+    sync_music_to_database,
+    dumpdata,
+    AlbumFetchError,
+)
+from flozz_daily_mix.subsonic import SubsonicClient, AsyncSubsonicClient
+from flozz_daily_mix.db import Database
+from flozz_daily_mix.retry import RetryPolicy
+
+
+class FakeSubsonic:
+
+    def __init__(self, album_count=10, failing_album_id=None, delay=0):
+        self._album_count = album_count
+        self._failing_album_id = failing_album_id
+        self._delay = delay
+
+    def getAlbumList(self, offset=0, size=100, **kwargs):
+        for i in range(offset, min(offset + size, self._album_count)):
+            yield {
+                "id": "album-%i" % i,
+                "parent": "artist-%i" % i,
+                "rating": None,
+                "genre": "Rock",
+            }
+
+    def getAlbum(self, id_=None, **kwargs):
+        time.sleep(self._delay)
+        if id_ == self._failing_album_id:
+            raise Exception("Server error")
+        return {
+            "id": id_,
+            "song": [{"id": "%s-track-%i" % (id_, i)} for i in range(3)],
+        }
+
+
+class TestGetTracks:
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_get_tracks(self, workers):
+        subsonic = FakeSubsonic(album_count=250)
+        tracks = list(get_tracks(subsonic, workers=workers))
+        assert len(tracks) == 750
+        assert len({track["id"] for track in tracks}) == 750
+        for track in tracks:
+            assert track["id"].startswith(
+                track["_albumArtistId"].replace("artist", "album")
+            )
+            assert track["_albumRating"] == 3
+            assert track["_albumGenre"] == "Rock"
+
+    def test_get_tracks_parallel(self):
+        subsonic = FakeSubsonic(album_count=20, delay=0.05)
+        start = time.monotonic()
+        assert len(list(get_tracks(subsonic, workers=10))) == 60
+        assert time.monotonic() - start < 20 * 0.05
+
+    def test_get_tracks_error(self):
+        subsonic = FakeSubsonic(album_count=20, failing_album_id="album-7")
+        with pytest.raises(AlbumFetchError) as error:
+            list(get_tracks(subsonic, workers=4))
+        assert error.value.album_id == "album-7"
+
+
+class TestImportMusicToDatabase:
+
+    @pytest.mark.parametrize("client_class", [SubsonicClient, AsyncSubsonicClient])
+    @pytest.mark.parametrize("search3_enabled", [False, True])
+    def test_import_music_to_database(
+        self, subsonic_server, client_class, search3_enabled
+    ):
+        subsonic_server.library.search3_enabled = search3_enabled
+        subsonic = client_class(subsonic_server.url, "user", "password")
+        db = Database(":memory:")
+        import_music_to_database(subsonic, db, workers=4)
+
+        assert db.execute_query("SELECT COUNT() FROM artists").fetchone()[0] == 3 + 1
+        assert db.execute_query("SELECT COUNT() FROM albums").fetchone()[0] == 6 + 1
+        assert db.execute_query("SELECT COUNT() FROM tracks").fetchone()[0] == 18
+        assert (
+            db.execute_query(
+                "SELECT COUNT() FROM tracks WHERE albumArtistId LIKE 'artist-%'"
+            ).fetchone()[0]
+            == 18
+        )
+
+        endpoints = [request[0] for request in subsonic_server.requests]
+        assert ("getAlbum" in endpoints) is not search3_enabled
+        # Artists and songs are streamed from XML responses
+        assert {
+            request[0]
+            for request in subsonic_server.requests
+            if request[1].get("f") == "xml"
+        } == ({"getArtists", "search3"} if search3_enabled else {"getArtists"})
+
+    def test_get_tracks_bulk_pages(self, subsonic_server):
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password")
+        albums = list(subsonic.getAlbumList(size=100))
+        tracks = list(get_tracks_bulk(subsonic, albums, page_size=5))
+        assert len(tracks) == 18
+        assert len([r for r in subsonic_server.requests if r[0] == "search3"]) == 4
+
+
+class TestSyncMusicToDatabase:
+
+    def _count(self, db, table):
+        return db.execute_query("SELECT COUNT() FROM %s" % table).fetchone()[0]
+
+    def test_sync_music_to_database(self, subsonic_server, tmp_path):
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password")
+        library = subsonic_server.library
+        library.search3_enabled = False
+        db = Database(str(tmp_path / "music.db"))
+
+        sync_music_to_database(subsonic, db, workers=2)
+        assert self._count(db, "albums") == 6 + 1
+        assert self._count(db, "tracks") == 18
+
+        # Nothing changed: no album fetched again
+        subsonic_server.requests.clear()
+        sync_music_to_database(subsonic, db, workers=2)
+        assert "getAlbum" not in [r[0] for r in subsonic_server.requests]
+        assert self._count(db, "tracks") == 18
+
+        # One album changed, one removed
+        library.albums[0]["songCount"] = 2
+        library.songs["album-0-0"].pop()
+        del library.albums[1]
+        subsonic_server.requests.clear()
+        sync_music_to_database(subsonic, db, workers=2)
+        assert [r[1]["id"] for r in subsonic_server.requests if r[0] == "getAlbum"] == [
+            "album-0-0"
+        ]
+        assert self._count(db, "albums") == 5 + 1
+        assert self._count(db, "tracks") == 14
+
+    def _track_stats(self, db, track_id):
+        return db.execute_query(
+            "SELECT rating, playCount FROM tracks WHERE id = ?", (track_id,)
+        ).fetchone()
+
+    def test_refresh_play_stats_with_song_listing(self, subsonic_server, tmp_path):
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password")
+        library = subsonic_server.library
+        db = Database(str(tmp_path / "music.db"))
+        sync_music_to_database(subsonic, db)
+        assert self._track_stats(db, "album-0-0-track-0") == (3, 0)
+
+        # The track is rated and played, its album does not change
+        library.songs["album-0-0"][0].update(userRating=5, playCount=4)
+        subsonic_server.requests.clear()
+        sync_music_to_database(subsonic, db)
+        assert "getAlbum" not in [r[0] for r in subsonic_server.requests]
+        assert self._track_stats(db, "album-0-0-track-0") == (5, 4)
+        assert self._count(db, "tracks") == 18
+
+    def test_refresh_play_stats_of_stale_albums(self, subsonic_server, tmp_path):
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password")
+        library = subsonic_server.library
+        library.search3_enabled = False
+        db = Database(str(tmp_path / "music.db"))
+        sync_music_to_database(subsonic, db)
+
+        # Tracks of both albums are rated, only the ones of album-0-1 are old
+        # enough to be fetched again
+        library.songs["album-0-0"][0]["userRating"] = 5
+        library.songs["album-0-1"][0]["userRating"] = 5
+        db.execute_query(
+            "UPDATE album_syncs SET tracksSynced = '2000-01-01 00:00:00' "
+            "WHERE albumId = 'album-0-1'"
+        )
+        subsonic_server.requests.clear()
+        sync_music_to_database(subsonic, db, stats_max_age=7)
+        assert [r[1]["id"] for r in subsonic_server.requests if r[0] == "getAlbum"] == [
+            "album-0-1"
+        ]
+        assert self._track_stats(db, "album-0-0-track-0") == (3, 0)
+        assert self._track_stats(db, "album-0-1-track-0") == (5, 0)
+        assert db.get_stale_album_ids(max_age=7) == []
+
+
+class TestDumpdata:
+
+    def test_dumpdata(self, subsonic_server, tmp_path):
+        db_file = str(tmp_path / "music.db")
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password")
+        dumpdata(subsonic, db_file)
+        assert os.listdir(tmp_path) == ["music.db"]
+
+        con = sqlite3.connect(db_file)
+        assert con.execute("SELECT COUNT(*) FROM tracks").fetchone() == (18,)
+        # Genres are read from the genre database, but the genres of the
+        # tracks are resolved
+        assert con.execute("SELECT COUNT(*) FROM genres").fetchone() == (0,)
+        assert con.execute("SELECT COUNT(*) FROM track_genres").fetchone() == (18,)
+        assert con.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+        indexes = [
+            row[0]
+            for row in con.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        ]
+        assert "genre_relations_parentGenreId" in indexes
+        # ANALYZE was run
+        assert con.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+        # The scores of the day are stored
+        assert con.execute("SELECT COUNT(*) FROM track_scores").fetchone() == (18,)
+        assert not Database(db_file, read_only=True).is_outdated()
+
+    def test_interrupted_dumpdata(self, subsonic_server, tmp_path):
+        db_file = tmp_path / "music.db"
+        db_file.write_bytes(b"previous database")
+        subsonic_server.library.songs["album-1-0"] = None  # Breaks the server
+        subsonic_server.library.search3_enabled = False
+        subsonic = SubsonicClient(
+            subsonic_server.url,
+            "user",
+            "password",
+            retry_policy=RetryPolicy(max_retries=0),
+        )
+        with pytest.raises(Exception):
+            dumpdata(subsonic, str(db_file))
+        assert os.listdir(tmp_path) == ["music.db"]
+        assert db_file.read_bytes() == b"previous database"
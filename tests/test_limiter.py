@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import urllib.error
+
+from flozz_daily_mix.limiter import AIMDLimiter, AsyncAIMDLimiter
+from flozz_daily_mix.retry import RetryPolicy
+
+
+class TestAIMDLimiter:
+
+    def test_additive_increase(self):
+        limiter = AIMDLimiter(8, initial_limit=2)
+        for _ in range(2):
+            limiter.release(limiter.acquire(), latency=0.1)
+        assert limiter.limit == 3
+        for _ in range(3):
+            limiter.release(limiter.acquire(), latency=0.1)
+        assert limiter.limit == 4
+
+    def test_max_limit(self):
+        limiter = AIMDLimiter(2, initial_limit=2)
+        for _ in range(10):
+            limiter.release(limiter.acquire(), latency=0.1)
+        assert limiter.limit == 2
+
+    def test_decrease_on_error(self):
+        limiter = AIMDLimiter(16, initial_limit=8)
+        tokens = [limiter.acquire() for _ in range(8)]
+        # Errors of requests started before the decrease are ignored
+        for token in tokens:
+            limiter.release(token, error=True)
+        assert limiter.limit == 4
+        limiter.release(limiter.acquire(), error=True)
+        assert limiter.limit == 2
+        limiter.release(limiter.acquire(), error=True)
+        limiter.release(limiter.acquire(), error=True)
+        assert limiter.limit == 1
+
+    def test_decrease_on_latency(self):
+        limiter = AIMDLimiter(16, initial_limit=16)
+        for _ in range(10):
+            limiter.release(limiter.acquire(), latency=0.1)
+        limiter.release(limiter.acquire(), latency=0.15)
+        assert limiter.limit == 16
+        limiter.release(limiter.acquire(), latency=1)
+        assert limiter.limit == 8
+
+    def test_concurrency(self):
+        limiter = AIMDLimiter(2, initial_limit=2)
+        in_flight = []
+        lock = threading.Lock()
+
+        def _worker():
+            token = limiter.acquire()
+            with lock:
+                in_flight.append(1)
+                assert len(in_flight) <= 2
+            with lock:
+                in_flight.pop()
+            limiter.release(token, latency=0.01)
+
+        threads = [threading.Thread(target=_worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_async_limiter(self):
+        limiter = AsyncAIMDLimiter(4, initial_limit=1)
+
+        async def _run():
+            for _ in range(5):
+                await limiter.release(await limiter.acquire(), latency=0.1)
+            return limiter.limit
+
+        assert asyncio.run(_run()) == 3
+
+
+class TestRetryPolicy:
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_retries=2)
+        error = urllib.error.HTTPError("", 503, "", {}, None)
+        assert policy.should_retry(error, 0)
+        assert policy.should_retry(error, 1)
+        assert not policy.should_retry(error, 2)
+        assert policy.should_retry(TimeoutError(), 0)
+        assert not policy.should_retry(urllib.error.HTTPError("", 404, "", {}, None), 0)
+
+    def test_get_delay(self):
+        policy = RetryPolicy(backoff_base=1, backoff_max=5)
+        for attempt in range(5):
+            assert 0 <= policy.get_delay(TimeoutError(), attempt) <= min(5, 2**attempt)
+
+    def test_retry_after(self):
+        policy = RetryPolicy(backoff_max=5)
+        error = urllib.error.HTTPError("", 429, "", {"Retry-After": "3"}, None)
+        assert policy.get_delay(error, 0) == 3
+        error = urllib.error.HTTPError("", 429, "", {"Retry-After": "60"}, None)
+        assert policy.get_delay(error, 0) == 5
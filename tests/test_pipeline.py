@@ -0,0 +1,96 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from flozz_daily_mix.pipeline import DatabaseWriter
+
+
+class FakeDatabase:
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.records = []
+        self.commits = []
+        self.threads = set()
+        self.calls = []
+
+    def insert_artist(self, id_, name):
+        if id_ == "error":
+            raise ValueError("Invalid artist")
+        time.sleep(self.delay)
+        self.threads.add(threading.current_thread())
+        self.records.append((id_, name))
+
+    def insert_artists_many(self, rows, upsert=False):
+        self.calls.append((len(rows), upsert))
+        for row in rows:
+            self.insert_artist(*row)
+
+    def commit(self):
+        self.commits.append(len(self.records))
+
+
+class TestDatabaseWriter:
+
+    def test_write_records(self):
+        db = FakeDatabase()
+        with DatabaseWriter(db, batch_size=4) as writer:
+            for i in range(10):
+                writer.put("insert_artist", id_=str(i), name="Artist %i" % i)
+        assert db.records == [(str(i), "Artist %i" % i) for i in range(10)]
+        assert db.commits == [4, 8, 10]
+        assert writer.commit_count == 3
+        assert threading.current_thread() not in db.threads
+        assert writer.fetch_stats.count == 10
+        assert writer.write_stats.count == 10
+
+    def test_write_rows(self):
+        db = FakeDatabase()
+        with DatabaseWriter(db, batch_size=4) as writer:
+            for i in range(6):
+                writer.put_row("insert_artists_many", (str(i), ""))
+            writer.put("insert_artist", id_="6", name="")
+            writer.put_row("insert_artists_many", ("7", ""))
+            writer.put_row("insert_artists_many", ("8", ""), upsert=True)
+        assert [record[0] for record in db.records] == [str(i) for i in range(9)]
+        assert db.calls == [(4, False), (2, False), (1, False), (1, True)]
+        assert db.commits == [4, 8, 9]
+
+    def test_back_pressure(self):
+        db = FakeDatabase(delay=0.02)
+        with DatabaseWriter(db, queue_size=2) as writer:
+            for i in range(10):
+                writer.put("insert_artist", id_=str(i), name="")
+                assert len(db.records) >= i - 3
+        assert writer.fetch_stats.wait_time > 0
+        assert len(db.records) == 10
+
+    def test_writer_error(self):
+        db = FakeDatabase()
+        with pytest.raises(ValueError):
+            with DatabaseWriter(db, queue_size=2) as writer:
+                writer.put("insert_artist", id_="error", name="")
+                for i in range(100):
+                    writer.put("insert_artist", id_=str(i), name="")
+        assert db.commits == []
+
+    def test_fetcher_error(self):
+        db = FakeDatabase()
+        with pytest.raises(KeyError):
+            with DatabaseWriter(db) as writer:
+                writer.put("insert_artist", id_="1", name="")
+                raise KeyError()
+        assert db.commits == []
+
+    def test_put_async(self):
+        db = FakeDatabase(delay=0.01)
+
+        async def _run():
+            with DatabaseWriter(db, queue_size=2) as writer:
+                for i in range(10):
+                    await writer.put_async("insert_artist", id_=str(i), name="")
+
+        asyncio.run(_run())
+        assert len(db.records) == 10
@@ -0,0 +1,370 @@
+import pytest
+
+from flozz_daily_mix.db import Database
+from flozz_daily_mix.ignore import TrackIgnoreMatcher
+from flozz_daily_mix.playlist import (
+    PlaylistGenerator,
+    PlaylistBatchGenerator,
+    TrackPool,
+    TrackRole,
+)
+
+
+class TestTrackPool:
+
+    def _pool(self, count):
+        return TrackPool({"trackId": str(i)} for i in range(count))
+
+    def test_remove(self):
+        pool = self._pool(5)
+        pool.remove("1")
+        pool.remove("4")
+        assert len(pool) == 3
+        assert "1" not in pool
+        assert sorted(track["trackId"] for track in pool.values()) == ["0", "2", "3"]
+        for track_id in ("0", "2", "3"):
+            pool.remove(track_id)
+        assert not pool
+
+    def test_add_existing(self):
+        pool = self._pool(2)
+        pool.add({"trackId": "1", "name": "foo"})
+        assert len(pool) == 2
+        pool.remove("0")
+        assert pool.choice() == {"trackId": "1", "name": "foo"}
+
+    def test_choice(self):
+        pool = self._pool(3)
+        picked = {pool.choice()["trackId"] for _ in range(100)}
+        assert picked == {"0", "1", "2"}
+
+
+class TestPlaylistGenerator:
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        # Fixture tracks are very short and were never played
+        db.execute_query(
+            "UPDATE tracks SET duration = 180, "
+            "lastPlayed = DATE('2024-01-01', '+' || (rowid % 30) || ' days') "
+            "WHERE rowid % 3 = 0"
+        )
+        db.commit()
+        return db
+
+    def _pools(self, generator):
+        return {
+            TrackRole.INTEREST: generator._tracks_interest,
+            TrackRole.FRESHNESS: generator._tracks_freshness,
+            TrackRole.BACKCATALOG: generator._tracks_backcatalog,
+            TrackRole.REGULAR: generator._tracks_regular,
+        }
+
+    def test_pools(self, db):
+        generator = PlaylistGenerator(db, length=20, min_duration=0, min_rate=0)
+        generator._fetch_musics()
+        pools = self._pools(generator)
+        assert len(pools[TrackRole.INTEREST]) == 10
+        assert len(pools[TrackRole.FRESHNESS]) == 10
+        assert len(pools[TrackRole.BACKCATALOG]) == 5
+        assert len(pools[TrackRole.REGULAR]) == 40
+        for role, pool in pools.items():
+            assert {track["role"] for track in pool.values()} == {role}
+
+        interest = [t["fzzInterestScore"] for t in pools[TrackRole.INTEREST].values()]
+        assert interest == sorted(interest, reverse=True)
+        assert min(interest) >= max(
+            track["fzzInterestScore"]
+            for track in pools[TrackRole.REGULAR].values()
+            if track["trackId"] not in pools[TrackRole.INTEREST]
+        )
+        last_played = [t["lastPlayed"] for t in pools[TrackRole.BACKCATALOG].values()]
+        assert None not in last_played
+        assert last_played == sorted(last_played)
+
+    def test_pools_filtered(self, db):
+        generator = PlaylistGenerator(db, length=20, min_duration=60, min_rate=0)
+        generator._fetch_musics()
+        for pool in self._pools(generator).values():
+            assert pool
+            assert min(track["duration"] for track in pool.values()) >= 60
+
+    def test_generate(self, db):
+        generator = PlaylistGenerator(db, length=20, min_duration=0, min_rate=0)
+        generator.generate()
+        track_ids = generator.get_tracks_ids()
+        assert len(track_ids) == 20
+        assert len(set(track_ids)) == 20
+
+    def test_generate_short_library(self, db):
+        # Pools run out of tracks: the playlist is shorter
+        generator = PlaylistGenerator(db, length=60, min_duration=60, min_rate=0)
+        generator.generate()
+        track_ids = generator.get_tracks_ids()
+        assert len(track_ids) == 24
+        assert len(set(track_ids)) == 24
+
+    def test_reservoir_engine(self, db):
+        generator = PlaylistGenerator(
+            db, length=20, min_duration=0, min_rate=0, sampling_engine="reservoir"
+        )
+        generator._fetch_musics()
+        pools = self._pools(generator)
+        assert len(pools[TrackRole.INTEREST]) == 10
+        assert len(pools[TrackRole.BACKCATALOG]) == 5
+        assert len(pools[TrackRole.REGULAR]) == 40
+        generator.generate()
+        assert len(set(generator.get_tracks_ids())) == 20
+
+    def test_unknown_engine(self, db):
+        with pytest.raises(ValueError):
+            PlaylistGenerator(db, sampling_engine="foo")
+
+
+class TestPlaylistBatchGenerator:
+
+    @pytest.fixture
+    def db(self, music_db_path):
+        db = Database(db_path=music_db_path, skip_table_creation=True)
+        db.execute_query(
+            "UPDATE tracks SET duration = 180, "
+            "lastPlayed = DATE('2024-01-01', '+' || (rowid % 30) || ' days') "
+            "WHERE rowid % 3 = 0"
+        )
+        db.execute_query("UPDATE tracks SET rating = 5 WHERE rowid % 2 = 0")
+        db.commit()
+        return db
+
+    def _get_tracks(self, db, generator):
+        query = "SELECT id, name, duration, rating, genreName FROM tracks WHERE id = ?"
+        return [
+            db.execute_query(query, (track_id,)).fetchone()
+            for track_id in generator.get_tracks_ids()
+        ]
+
+    @pytest.mark.parametrize("sampling_engine", ["sql", "reservoir"])
+    def test_generate(self, db, sampling_engine):
+        generators = [
+            PlaylistGenerator(
+                db,
+                length=20,
+                min_duration=0,
+                min_rate=0,
+                sampling_engine=sampling_engine,
+            ),
+            PlaylistGenerator(
+                db,
+                length=20,
+                min_duration=60,
+                min_rate=0,
+                sampling_engine=sampling_engine,
+            ),
+            PlaylistGenerator(
+                db,
+                length=20,
+                min_duration=0,
+                min_rate=5,
+                track_ignore_pattern="^\\d",
+                sampling_engine=sampling_engine,
+            ),
+        ]
+        PlaylistBatchGenerator(db, generators).generate()
+
+        tracks = self._get_tracks(db, generators[0])
+        assert len(tracks) == 20
+        assert len({track[0] for track in tracks}) == 20
+
+        tracks = self._get_tracks(db, generators[1])
+        assert len({track[0] for track in tracks}) == len(tracks) > 0
+        assert min(track[2] for track in tracks) >= 60
+
+        tracks = self._get_tracks(db, generators[2])
+        assert len({track[0] for track in tracks}) == len(tracks) > 0
+        assert min(track[3] for track in tracks) == 5
+        assert not [track for track in tracks if track[1][0].isdigit()]
+
+    def test_generate_genres(self, db):
+        genre = db.execute_query(
+            "SELECT genreName FROM tracks GROUP BY genreName ORDER BY COUNT(*) DESC"
+        ).fetchone()[0]
+        generators = [
+            PlaylistGenerator(db, length=10, min_duration=0, min_rate=0),
+            PlaylistGenerator(
+                db, length=10, min_duration=0, min_rate=0, genres=[genre]
+            ),
+        ]
+        PlaylistBatchGenerator(db, generators).generate()
+        assert len(generators[0].get_tracks_ids()) == 10
+        tracks = self._get_tracks(db, generators[1])
+        assert tracks
+        assert {track[4] for track in tracks} == {genre}
+
+    @pytest.mark.parametrize("sampling_engine", ["sql", "reservoir", "numpy"])
+    def test_generate_custom_genre(self, db, sampling_engine):
+        # Genres that are not in the genre graph are matched by name
+        if sampling_engine == "numpy":
+            pytest.importorskip("numpy")
+        for i in range(3):
+            db.insert_track(
+                id_="custom-%i" % i,
+                name="Custom %i" % i,
+                albumId="x",
+                genreName="Office Bangers" if i else "rock; office bangers",
+                duration=180,
+                rating=5,
+            )
+        generators = [
+            PlaylistGenerator(
+                db,
+                length=10,
+                min_duration=0,
+                min_rate=0,
+                genres=["office bangers"],
+                sampling_engine=sampling_engine,
+            )
+        ]
+        PlaylistBatchGenerator(db, generators).generate()
+        assert sorted(generators[0].get_tracks_ids()) == [
+            "custom-0",
+            "custom-1",
+            "custom-2",
+        ]
+        generators[0].generate()
+        assert len(generators[0].get_tracks_ids()) == 3
+
+    def test_generate_multiple_genres(self, db):
+        # Tracks are selected by any of their genres
+        db.insert_track(
+            id_="new",
+            name="New",
+            albumId="x",
+            genreName="rock; jazz",
+            duration=180,
+            rating=5,
+        )
+        generators = [
+            PlaylistGenerator(
+                db, length=10, min_duration=0, min_rate=0, genres=["jazz"]
+            ),
+            PlaylistGenerator(
+                db,
+                length=10,
+                min_duration=0,
+                min_rate=0,
+                genres=["jazz"],
+                sampling_engine="reservoir",
+            ),
+        ]
+        PlaylistBatchGenerator(db, generators).generate()
+        assert generators[0].get_tracks_ids() == ["new"]
+        assert generators[1].get_tracks_ids() == ["new"]
+        generators[0].generate()
+        assert generators[0].get_tracks_ids() == ["new"]
+
+    def test_single_scan(self, db, monkeypatch):
+        # The scored tracks are read by a single query for all the playlists
+        execute_query = db.execute_query
+        queries = []
+        monkeypatch.setattr(
+            db,
+            "execute_query",
+            lambda query, params={}: queries.append(query)
+            or execute_query(query, params),
+        )
+        generators = [
+            PlaylistGenerator(
+                db,
+                length=10,
+                min_duration=min_duration,
+                min_rate=min_rate,
+                genres=genres,
+                track_ignore_pattern=pattern,
+                sampling_engine=sampling_engine,
+            )
+            for min_duration, min_rate, genres, pattern, sampling_engine in [
+                (0, 0, ["all"], None, "sql"),
+                (60, 0, ["chiptune"], "^\\d", "sql"),
+                (0, 5, ["all"], "^a", "reservoir"),
+                (0, 0, ["chiptune"], None, "reservoir"),
+            ]
+        ]
+        PlaylistBatchGenerator(db, generators).generate()
+        assert len([query for query in queries if "FROM track_scores" in query]) == 1
+        # Only 9 tracks match the filters of the second playlist
+        assert [len(generator.get_tracks_ids()) for generator in generators] == [
+            10,
+            9,
+            10,
+            10,
+        ]
+        tracks = self._get_tracks(db, generators[1])
+        assert {track[4] for track in tracks} == {"chiptune"}
+        assert not [track for track in tracks if track[1][0].isdigit()]
+        assert min(track[3] for track in self._get_tracks(db, generators[2])) == 5
+
+    def test_same_pools_as_generator(self, db):
+        # Pools selected by score do not depend on the generator
+        generator = PlaylistGenerator(db, length=20, min_duration=0, min_rate=0)
+        generator._reset()
+        generator._fetch_musics()
+        expected = {
+            track["fzzInterestScore"] for track in generator._tracks_interest.values()
+        }
+        batch_generator = PlaylistGenerator(db, length=20, min_duration=0, min_rate=0)
+        PlaylistBatchGenerator(db, [batch_generator]).generate()
+        scores = {
+            track["fzzInterestScore"]
+            for track in batch_generator._tracks_interest.values()
+        }
+        assert scores == expected
+
+    def test_shared_preparation(self, db, monkeypatch):
+        # The ignore patterns are matched and the scores refreshed only once,
+        # the pools are selected by the engine of each playlist
+        refresh_track_scores = db.refresh_track_scores
+        refresh_calls = []
+        monkeypatch.setattr(
+            db,
+            "refresh_track_scores",
+            lambda: refresh_calls.append(1) or refresh_track_scores(),
+        )
+        matchers = []
+        monkeypatch.setattr(
+            "flozz_daily_mix.db.TrackIgnoreMatcher",
+            lambda patterns: matchers.append(patterns) or TrackIgnoreMatcher(patterns),
+        )
+        generators = [
+            PlaylistGenerator(
+                db,
+                length=10,
+                min_duration=0,
+                min_rate=0,
+                track_ignore_pattern=pattern,
+                sampling_engine=sampling_engine,
+            )
+            for pattern, sampling_engine in [
+                ("^\\d", "sql"),
+                ("^a", "reservoir"),
+                ("^\\d", "reservoir"),
+            ]
+        ]
+        PlaylistBatchGenerator(db, generators).generate()
+        assert len(refresh_calls) == 1
+        assert matchers == [["^\\d", "^a"]]
+        for generator in generators:
+            assert len(generator.get_tracks_ids()) == 10
+
+    def test_too_many_patterns(self, db):
+        # More playlists than ignore masks stored at the same time
+        patterns = ["^zz%i" % i for i in range(69)] + ["^\\d"]
+        generators = [
+            PlaylistGenerator(
+                db, length=5, min_duration=0, min_rate=0, track_ignore_pattern=pattern
+            )
+            for pattern in patterns
+        ]
+        PlaylistBatchGenerator(db, generators).generate()
+        names = [track["trackName"] for track in generators[-1].get_playlist()]
+        assert len(names) == 5
+        assert not [name for name in names if name[0].isdigit()]
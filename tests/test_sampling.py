@@ -0,0 +1,42 @@
+import random
+import collections
+
+from flozz_daily_mix.sampling import WeightedReservoir, weighted_sample
+
+
+class TestWeightedReservoir:
+
+    def test_sample_size(self):
+        assert len(weighted_sample(range(100), 10, weight=lambda i: 1)) == 10
+        assert len(weighted_sample(range(5), 10, weight=lambda i: 1)) == 5
+        assert weighted_sample(range(5), 0, weight=lambda i: 1) == []
+
+    def test_no_duplicates(self):
+        sample = weighted_sample(range(1000), 100, weight=lambda i: 1 + i % 7)
+        assert len(set(sample)) == 100
+
+    def test_zero_weight(self):
+        sample = weighted_sample(range(100), 50, weight=lambda i: i % 2)
+        assert len(sample) == 50
+        assert all(i % 2 for i in sample)
+
+    def test_proportional(self):
+        rng = random.Random(42)
+        weights = [1, 2, 3, 4]
+        counter = collections.Counter()
+        for _ in range(20000):
+            counter.update(
+                weighted_sample(range(4), 1, weight=lambda i: weights[i], rng=rng)
+            )
+        for i, weight in enumerate(weights):
+            assert abs(counter[i] / 20000 - weight / 10) < 0.02
+
+    def test_streaming(self):
+        rng = random.Random(42)
+        reservoir = WeightedReservoir(10, rng=rng)
+        # A heavy item at the end of a long stream is (almost) always drawn
+        for i in range(10000):
+            reservoir.add(i, 1)
+        reservoir.add("heavy", 100000)
+        assert "heavy" in reservoir.get_items()
+        assert reservoir.get_items()[0] == "heavy"
@@ -53,6 +53,12 @@ class TestSubsonic:
                 assert "rating" in artist
                 assert "starred" in artist
 
+    def test_iterArtists(self, subsonic):
+        artists = [
+            artist for index in subsonic.getArtists() for artist in index["artist"]
+        ]
+        assert list(subsonic.iterArtists()) == artists
+
     def test_getAlbumList(self, subsonic):
         albums = subsonic.getAlbumList()
 
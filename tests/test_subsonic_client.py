@@ -0,0 +1,266 @@
+import zlib
+import asyncio
+import urllib.error
+
+import pytest
+
+from conftest import FakeSubsonicLibrary
+
+from flozz_daily_mix.subsonic import SubsonicClient, AsyncSubsonicClient
+from flozz_daily_mix.retry import RetryPolicy
+
+
+class TestSubsonicClient:
+
+    @pytest.fixture
+    def subsonic(self, subsonic_server):
+        return SubsonicClient(subsonic_server.url, "user", "password")
+
+    def test_getArtists(self, subsonic):
+        artists = subsonic.getArtists()
+        assert len(artists[0]["artist"]) == 3
+        assert artists[0]["artist"][0]["rating"] is None
+
+    def test_getAlbumList(self, subsonic):
+        albums = list(subsonic.getAlbumList(offset=2, size=3))
+        assert [album["id"] for album in albums] == [
+            "album-1-0",
+            "album-1-1",
+            "album-2-0",
+        ]
+
+    def test_getAlbum(self, subsonic):
+        album = subsonic.getAlbum(id_="album-1-0")
+        assert album["songCount"] == 3
+        assert album["song"][0]["userRating"] is None
+
+    def test_keep_alive(self, subsonic, subsonic_server):
+        for _ in range(5):
+            subsonic.getAlbum(id_="album-0-0")
+        assert len(subsonic_server.connections) == 1
+
+
+class TestAsyncSubsonicClient:
+
+    @pytest.fixture
+    def subsonic(self, subsonic_server):
+        return AsyncSubsonicClient(subsonic_server.url, "user", "password")
+
+    def _run(self, subsonic, coroutine):
+        async def _main():
+            try:
+                return await coroutine
+            finally:
+                await subsonic.close()
+
+        return asyncio.run(_main())
+
+    def test_getArtists(self, subsonic):
+        artists = self._run(subsonic, subsonic.getArtists())
+        assert len(artists[0]["artist"]) == 3
+
+    @pytest.mark.parametrize("chunked", [False, True])
+    def test_getAlbum(self, subsonic, subsonic_server, chunked):
+        subsonic_server.chunked = chunked
+        album = self._run(subsonic, subsonic.getAlbum(id_="album-1-0"))
+        assert album["songCount"] == 3
+        assert [song["id"] for song in album["song"]] == [
+            "album-1-0-track-0",
+            "album-1-0-track-1",
+            "album-1-0-track-2",
+        ]
+
+    def test_concurrent_requests(self, subsonic, subsonic_server):
+        album_ids = [album["id"] for album in subsonic_server.library.albums]
+
+        async def _get_albums():
+            return await asyncio.gather(
+                *[subsonic.getAlbum(id_=album_id) for album_id in album_ids * 4]
+            )
+
+        albums = self._run(subsonic, _get_albums())
+        assert [album["id"] for album in albums] == album_ids * 4
+
+    def test_playlists(self, subsonic):
+        async def _create_playlist():
+            playlist = await subsonic.createPlaylist(name="Mix")
+            await subsonic.updatePlaylist(playlistId=playlist["id"], comment="Foo")
+            return await subsonic.getPlaylists()
+
+        playlists = self._run(subsonic, _create_playlist())
+        assert playlists[0]["name"] == "Mix"
+        assert playlists[0]["songCount"] == 0
+
+
+class TestCompression:
+
+    @pytest.mark.parametrize(
+        "compression,deflate_wbits",
+        [
+            ("gzip", None),
+            ("deflate", zlib.MAX_WBITS),
+            ("deflate", -zlib.MAX_WBITS),
+        ],
+    )
+    def test_compressed_response(self, subsonic_server, compression, deflate_wbits):
+        subsonic_server.compression = compression
+        subsonic_server.deflate_wbits = deflate_wbits
+        subsonic_server.library = FakeSubsonicLibrary(
+            artist_count=1, albums_per_artist=1, songs_per_album=200
+        )
+
+        subsonic = SubsonicClient(subsonic_server.url, "user", "password")
+        album = subsonic.getAlbum(id_="album-0-0")
+        assert len(album["song"]) == 200
+
+        stats = subsonic.transfer_stats
+        assert 0 < stats.bytes_received < stats.bytes_decoded / 5
+
+        async_subsonic = AsyncSubsonicClient(subsonic_server.url, "user", "password")
+        album = asyncio.run(async_subsonic.getAlbum(id_="album-0-0"))
+        assert len(album["song"]) == 200
+        assert async_subsonic.transfer_stats.bytes_received < (
+            async_subsonic.transfer_stats.bytes_decoded
+        )
+
+
+class TestStreaming:
+
+    @pytest.fixture
+    def subsonic(self, subsonic_server):
+        subsonic_server.library = FakeSubsonicLibrary(
+            artist_count=500, albums_per_artist=1, songs_per_album=2
+        )
+        subsonic_server.chunked = True
+        return SubsonicClient(subsonic_server.url, "user", "password")
+
+    def test_iterArtists(self, subsonic):
+        artists = list(subsonic.iterArtists())
+        assert artists == [
+            artist for index in subsonic.getArtists() for artist in index["artist"]
+        ]
+        assert artists[1] == {
+            "id": "artist-1",
+            "name": "Artist 1",
+            "sortName": None,
+            "albumCount": 1,
+            "rating": None,
+            "starred": None,
+        }
+
+    def test_iterSearch3Songs(self, subsonic):
+        songs = list(subsonic.iterSearch3Songs(songCount=50, songOffset=10))
+        expected = subsonic.search3(
+            artistCount=0, albumCount=0, songCount=50, songOffset=10
+        )["song"]
+        assert songs == expected
+        assert songs[0]["track"] == 1
+        assert songs[0]["isDir"] is False
+
+    def test_async_client(self, subsonic, subsonic_server):
+        subsonic_server.compression = "gzip"
+        async_subsonic = AsyncSubsonicClient(subsonic_server.url, "user", "password")
+
+        async def _run():
+            try:
+                artists = [artist async for artist in async_subsonic.iterArtists()]
+                songs = [
+                    song
+                    async for song in async_subsonic.iterSearch3Songs(
+                        songCount=50, songOffset=10
+                    )
+                ]
+                expected = await async_subsonic.search3(
+                    artistCount=0, albumCount=0, songCount=50, songOffset=10
+                )
+                return artists, songs, expected["song"]
+            finally:
+                await async_subsonic.close()
+
+        artists, songs, expected = asyncio.run(_run())
+        assert len(artists) == 500
+        assert artists[1]["id"] == "artist-1"
+        assert songs == expected
+        # Streamed responses were read to the end: the connection was reused
+        assert len(subsonic_server.connections) == 1
+
+
+class TestRetries:
+
+    @pytest.fixture
+    def retry_policy(self):
+        return RetryPolicy(max_retries=2, backoff_base=0.01)
+
+    def test_retry_server_errors(self, subsonic_server, retry_policy):
+        subsonic_server.failures = [503, 500]
+        subsonic = SubsonicClient(
+            subsonic_server.url, "user", "password", retry_policy=retry_policy
+        )
+        assert subsonic.getAlbum(id_="album-0-0")["id"] == "album-0-0"
+        assert len(subsonic_server.requests) == 3
+
+    def test_give_up(self, subsonic_server, retry_policy):
+        subsonic_server.failures = [502, 502, 502]
+        subsonic = SubsonicClient(
+            subsonic_server.url, "user", "password", retry_policy=retry_policy
+        )
+        with pytest.raises(urllib.error.HTTPError):
+            subsonic.getAlbum(id_="album-0-0")
+        assert len(subsonic_server.requests) == 3
+
+    def test_no_retry_client_errors(self, subsonic_server, retry_policy):
+        subsonic_server.failures = [404]
+        subsonic = SubsonicClient(
+            subsonic_server.url, "user", "password", retry_policy=retry_policy
+        )
+        with pytest.raises(urllib.error.HTTPError):
+            subsonic.getAlbum(id_="album-0-0")
+        assert len(subsonic_server.requests) == 1
+
+    def test_no_retry_playlist_creation(self, subsonic_server, retry_policy):
+        subsonic_server.failures = [503]
+        subsonic = SubsonicClient(
+            subsonic_server.url, "user", "password", retry_policy=retry_policy
+        )
+        with pytest.raises(urllib.error.HTTPError):
+            subsonic.createPlaylist(name="Mix")
+        assert len(subsonic_server.requests) == 1
+
+    def test_retry_streamed_response(self, subsonic_server, retry_policy):
+        subsonic_server.failures = [503]
+        subsonic = SubsonicClient(
+            subsonic_server.url, "user", "password", retry_policy=retry_policy
+        )
+        assert len(list(subsonic.iterArtists())) == 3
+
+    def test_timeout(self, subsonic_server, retry_policy):
+        subsonic_server.delays = [0.5]
+        subsonic = SubsonicClient(
+            subsonic_server.url,
+            "user",
+            "password",
+            timeout=0.1,
+            retry_policy=retry_policy,
+        )
+        assert subsonic.getAlbum(id_="album-0-0")["id"] == "album-0-0"
+        assert len(subsonic_server.requests) == 2
+
+    def test_async_client(self, subsonic_server, retry_policy):
+        subsonic_server.failures = [429]
+        subsonic_server.delays = [0, 0.5]
+
+        async def _run():
+            subsonic = AsyncSubsonicClient(
+                subsonic_server.url,
+                "user",
+                "password",
+                timeout=0.1,
+                retry_policy=retry_policy,
+            )
+            try:
+                return await subsonic.getAlbum(id_="album-0-0")
+            finally:
+                await subsonic.close()
+
+        assert asyncio.run(_run())["id"] == "album-0-0"
+        assert len(subsonic_server.requests) == 3